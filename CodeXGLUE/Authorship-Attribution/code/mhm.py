@@ -12,8 +12,8 @@ import warnings
 import torch
 import numpy as np
 from model import Model
-from utils import set_seed
-from utils import Recorder
+from utils import set_seed, get_device
+from utils import AttackScheduler, ConcurrentAttackRunner
 from run import TextDataset
 from utils import CodeDataset
 from run_parser import get_identifiers
@@ -29,7 +29,7 @@ MODEL_CLASSES = {
     'roberta': (RobertaConfig, RobertaModel, RobertaTokenizer),
 }
 
-from utils import build_vocab
+from utils import load_vocab
             
 def main():
     
@@ -88,6 +88,20 @@ def main():
                         help="Whether to run eval on the dev set.")    
     parser.add_argument("--eval_batch_size", default=4, type=int,
                         help="Batch size per GPU/CPU for evaluation.")
+    parser.add_argument("--no_cuda", action='store_true',
+                        help="Avoid using CUDA when available")
+    parser.add_argument("--num_threads", default=0, type=int,
+                        help="Number of CPU threads for inference when running without CUDA (0 = torch default).")
+    parser.add_argument("--query_cache_size", default=100000, type=int,
+                        help="Max number of cached victim model outputs (0 disables the query cache).")
+    parser.add_argument("--nb_workers", default=1, type=int,
+                        help="Number of worker processes attacking examples in parallel.")
+    parser.add_argument("--nb_concurrent", default=1, type=int,
+                        help="Number of examples attacked concurrently in each process; their model queries are pooled into shared batches.")
+    parser.add_argument("--mhm_chains", default=1, type=int,
+                        help="Number of independent MHM chains per example; the candidates of all chains are scored in one batch each step.")
+    parser.add_argument("--resume", action='store_true',
+                        help="Continue an interrupted run: keep the rows already in csv_store_path and skip their examples.")
     parser.add_argument('--seed', type=int, default=42,
                         help="random seed for initialization")
     parser.add_argument("--cache_dir", default="", type=str,
@@ -96,14 +110,23 @@ def main():
 
     args = parser.parse_args()
 
+    AttackScheduler(args.nb_workers).run(run_attack, args)
 
-    args.device = torch.device("cuda")
+
+def run_attack(args, worker):
+    import json
+    import pickle
+    import time
+
+
+
+    args.device = get_device(args.no_cuda, args.num_threads)
     # Set seed
     set_seed(args.seed)
 
     codebert_mlm = RobertaForMaskedLM.from_pretrained(args.base_model)
     tokenizer_mlm = RobertaTokenizer.from_pretrained(args.base_model)
-    codebert_mlm.to('cuda') 
+    codebert_mlm.to(args.device)
 
     args.start_epoch = 0
     args.start_step = 0
@@ -147,7 +170,7 @@ def main():
 
     checkpoint_prefix = 'checkpoint-best-f1/model.bin'
     output_dir = os.path.join(args.output_dir, '{}'.format(checkpoint_prefix))  
-    model.load_state_dict(torch.load(output_dir))      
+    model.load_state_dict(torch.load(output_dir, map_location=args.device))
     model.to(args.device)
     print ("MODEL LOADED!")
 
@@ -169,14 +192,12 @@ def main():
             substs.append(item["substitutes"])
     assert(len(source_codes) == len(eval_dataset) == len(substs))
 
-    code_tokens = []
-    for index, code in enumerate(source_codes):
-        code_tokens.append(get_identifiers(code, "python")[1])
+    # 词表和codes的hash一起缓存在数据集旁边, 之后的运行不需要再parse所有的程序
+    id2token, token2id = load_vocab(codes_file_path, source_codes, "python", 5000)
 
-    id2token, token2id = build_vocab(code_tokens, 5000)
-
-    recoder = Recorder(args.csv_store_path)
-    attacker = MHM_Attacker(args, model, codebert_mlm, tokenizer_mlm, token2id, id2token)
+    recoder = worker.recorder(args.csv_store_path)
+    runner = ConcurrentAttackRunner(model, args.nb_concurrent)
+    attacker = MHM_Attacker(args, runner.model, codebert_mlm, tokenizer_mlm, token2id, id2token)
     
     # token2id: dict,key是变量名, value是id
     # id2token: list,每个元素是变量名
@@ -185,22 +206,23 @@ def main():
     
     adv = {"tokens": [], "raw_tokens": [], "ori_raw": [],
            'ori_tokens': [], "label": [], }
-    n_succ = 0.0
-    total_cnt = 0
-    query_times = 0
-    all_start_time = time.time()
-    for index, example in enumerate(eval_dataset):
+    # --resume时从已有的csv恢复统计
+    n_succ = float(recoder.nb_success)
+    total_cnt = recoder.nb_total
+    model.query += recoder.query_times
+    all_start_time = time.time() - recoder.time_cost * 60
+
+    def attack_example(index, example):
         code = source_codes[index]
         subs = substs[index]
 
-        orig_prob, orig_label = model.get_results([example], args.eval_batch_size)
+        orig_prob, orig_label = runner.model.get_results([example], args.eval_batch_size)
         orig_prob = orig_prob[0]
         orig_label = orig_label[0]
         ground_truth = example[1].item()
         if orig_label != ground_truth:
-            continue
+            return None
         
-        start_time = time.time()
         
         # 这里需要进行修改.
         if args.is_original_mhm:
@@ -211,7 +233,12 @@ def main():
             _res = attacker.mcmc(tokenizer, code,
                                 _label=ground_truth, _n_candi=30,
                                 _max_iter=100, _prob_threshold=1, subs = subs)
-        
+        return code, orig_label, ground_truth, _res
+
+    for index, example, result, attack_queries, time_cost in runner.run(attack_example, worker, eval_dataset):
+        if result is None:
+            continue
+        code, orig_label, ground_truth, _res = result
         if _res['succ'] is None:
             continue
         if _res['succ'] == True:
@@ -222,14 +249,14 @@ def main():
         else:
             print ("EXAMPLE "+str(index)+" FAILED.")
         total_cnt += 1
-        print ("  time cost = %.2f min" % ((time.time()-start_time)/60))
-        time_cost = (time.time()-start_time)/60
+        print ("  time cost = %.2f min" % time_cost)
         print ("  ALL EXAMPLE time cost = %.2f min" % ((time.time()-all_start_time)/60))
         print ("  curr succ rate = "+str(n_succ/total_cnt))
-        print("Query times in this attack: ", model.query - query_times)
+        print("Query times in this attack: ", attack_queries)
         print("All Query times: ", model.query)
-        recoder.writemhm(index, code, _res["prog_length"], _res['tokens'], ground_truth, orig_label, _res["new_pred"], _res["is_success"], _res["old_uid"], _res["score_info"], _res["nb_changed_var"], _res["nb_changed_pos"], _res["replace_info"], _res["attack_type"], model.query - query_times, time_cost)
-        query_times = model.query
+        print("Query cache hits/misses: ", model.engine.cache.hits, model.engine.cache.misses)
+        recoder.writemhm(index, code, _res["prog_length"], _res['tokens'], ground_truth, orig_label, _res["new_pred"], _res["is_success"], _res["old_uid"], _res["score_info"], _res["nb_changed_var"], _res["nb_changed_pos"], _res["replace_info"], _res["attack_type"], attack_queries, time_cost)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,9 @@
 # Copyright (c) Microsoft Corporation. 
 # Licensed under the MIT license.
+import sys
+sys.path.append('../../../')
+sys.path.append('../../../python_parser')
+
 import torch
 import torch.nn as nn
 import torch
@@ -7,8 +11,8 @@ from torch.autograd import Variable
 import copy
 import torch.nn.functional as F
 from torch.nn import CrossEntropyLoss, MSELoss
-from torch.utils.data import SequentialSampler, DataLoader
 import numpy as np
+from utils import InferenceEngine
 
 class RobertaClassificationHead(nn.Module):
     """Head for sentence-level classification tasks."""
@@ -38,10 +42,11 @@ class Model(nn.Module):
         self.classifier=RobertaClassificationHead(config)
         self.args=args
         self.query = 0
+        self.engine = InferenceEngine(args.device, getattr(args, 'query_cache_size', 0))
     
         
     def forward(self, input_ids=None,labels=None): 
-        input_ids=input_ids.view(-1,self.args.block_size)
+        input_ids=input_ids.view(-1,input_ids.size(-1))
         outputs = self.encoder(input_ids= input_ids,attention_mask=input_ids.ne(1))[0]
         logits=self.classifier(outputs)
         prob=F.softmax(logits)
@@ -52,36 +57,26 @@ class Model(nn.Module):
             return loss,prob
         else:
             return prob
-      
+
+    def feature_length(self, item):
+        # 输入只在末尾pad, 非pad token的个数就是实际长度
+        return int(item[0].ne(self.tokenizer.pad_token_id).sum())
+
+    def trim_features(self, features):
+        '''
+        features: [input_ids, labels]. 只pad到batch里最长的那个样本
+        '''
+        length = int(features[0].ne(self.tokenizer.pad_token_id).sum(-1).max())
+        return [features[0][:, :length]] + features[1:]
+
     def get_results(self, dataset, batch_size):
         '''
         给定example和tgt model，返回预测的label和probability
         '''
-        self.query += len(dataset)
-        eval_sampler = SequentialSampler(dataset)
-        eval_dataloader = DataLoader(dataset, sampler=eval_sampler, batch_size=batch_size,num_workers=4,pin_memory=False)
-
-        ## Evaluate Model
-
-        eval_loss = 0.0
-        nb_eval_steps = 0
         self.eval()
-        logits=[] 
-        labels=[]
-        for batch in eval_dataloader:
-            inputs = batch[0].to("cuda")       
-            label=batch[1].to("cuda") 
-            with torch.no_grad():
-                lm_loss,logit = self.forward(inputs,label)
-                # 调用这个模型. 重写了反前向传播模型.
-                eval_loss += lm_loss.mean().item()
-                logits.append(logit.cpu().numpy())
-                labels.append(label.cpu().numpy())
-                
-
-            nb_eval_steps += 1
-        logits=np.concatenate(logits,0)
-        labels=np.concatenate(labels,0)
+        logits, nb_queries = self.engine.predict(self, dataset, batch_size)
+        # inputs served from the query cache are not counted as queries
+        self.query += nb_queries
 
         probs = logits
         pred_labels = []
@@ -43,6 +43,7 @@ except:
 from tqdm import tqdm, trange
 import multiprocessing
 from model import Model
+from utils import FeatureStore
 
 cpu_cont = 16
 from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
@@ -101,7 +102,7 @@ class TextDataset(Dataset):
 
         print('\n cached_features_file: ',cache_file_path)
         try:
-            self.examples = torch.load(cache_file_path)
+            self.examples = FeatureStore.load(cache_file_path)
             with open(code_pairs_file_path, 'rb') as f:
                 code_files = pickle.load(f)
             
@@ -123,7 +124,7 @@ class TextDataset(Dataset):
             with open(code_pairs_file_path, 'wb') as f:
                 pickle.dump(code_files, f)
             logger.info("Saving features into cached file %s", cache_file_path)
-            torch.save(self.examples, cache_file_path)
+            self.examples = FeatureStore.save(cache_file_path, self.examples)
 
         if 'train' in file_path:
             for idx, example in enumerate(self.examples[:3]):
@@ -140,7 +141,7 @@ class TextDataset(Dataset):
 
     def __getitem__(self, item):
         
-        return torch.tensor(self.examples[item].input_ids),torch.tensor(self.examples[item].label)
+        return torch.tensor(self.examples[item].input_ids, dtype=torch.long),torch.tensor(self.examples[item].label)
 
 
 def load_and_cache_examples(args, tokenizer, evaluate=False,test=False,pool=None):
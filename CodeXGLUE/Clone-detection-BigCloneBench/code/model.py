@@ -1,5 +1,9 @@
 # Copyright (c) Microsoft Corporation. 
 # Licensed under the MIT license.
+import sys
+sys.path.append('../../../')
+sys.path.append('../../../python_parser')
+
 import torch
 import torch.nn as nn
 import torch
@@ -7,8 +11,8 @@ from torch.autograd import Variable
 import copy
 import torch.nn.functional as F
 from torch.nn import CrossEntropyLoss, MSELoss
-from torch.utils.data import SequentialSampler, DataLoader
 import numpy as np
+from utils import InferenceEngine, QueryCache, group_rows
 
 class RobertaClassificationHead(nn.Module):
     """Head for sentence-level classification tasks."""
@@ -38,11 +42,16 @@ class Model(nn.Module):
         self.classifier=RobertaClassificationHead(config)
         self.args=args
         self.query = 0
+        self.engine = InferenceEngine(args.device, getattr(args, 'query_cache_size', 0))
+        # code 2 的<s>输出, 见encode_partners
+        self.partner_cache = QueryCache(getattr(args, 'partner_cache_size', 32))
     
         
     def forward(self, input_ids=None,labels=None): 
-        input_ids=input_ids.view(-1,self.args.block_size)
-        outputs = self.encoder(input_ids= input_ids,attention_mask=input_ids.ne(1))[0]
+        if labels is None and not self.training:
+            return self.predict_pairs(input_ids)
+        input_ids=input_ids.view(-1,input_ids.size(-1)//2)
+        outputs = self.encode(input_ids)
         logits=self.classifier(outputs)
         prob=F.softmax(logits)
         if labels is not None:
@@ -52,31 +61,69 @@ class Model(nn.Module):
         else:
             return prob
 
+    def encode(self, input_ids):
+        # classifier只用到<s>的输出
+        return self.encoder(input_ids= input_ids,attention_mask=input_ids.ne(1))[0][:, :1, :]
 
-    def get_results(self, dataset, batch_size, threshold=0.5):
-        '''Given a dataset, return probabilities and labels.'''
-        self.query += len(dataset)
-        eval_sampler = SequentialSampler(dataset)
-        eval_dataloader = DataLoader(dataset, sampler=eval_sampler, batch_size=batch_size,num_workers=4,pin_memory=False)
+    def encode_partners(self, input_ids):
+        '''
+        code 2 的<s>输出. attack时code 2是固定的, 一个batch中相同的code 2只编码一次,
+        编码过的code 2 (按去掉padding之后的input_ids) 直接从partner_cache中取.
+        code 2 不需要梯度 (见utils.embedding_saliency), 缓存的输出都detach.
+        '''
+        groups = group_rows(input_ids)
+        index = torch.empty(input_ids.size(0), dtype=torch.long, device=input_ids.device)
+        outputs = []
+        for g, (first, rows) in enumerate(groups):
+            length = int(input_ids[first].ne(self.tokenizer.pad_token_id).sum())
+            key = self.partner_cache.key([input_ids[first, :length].cpu()])
+            output = self.partner_cache.get(key)
+            if output is None:
+                output = self.encode(input_ids[first:first+1, :length]).detach()
+                self.partner_cache.put(key, output)
+            outputs.append(output)
+            index[rows] = g
+        return torch.cat(outputs)[index]
+
+    def predict_pairs(self, input_ids):
+        '''
+        推理时两段代码分开编码: 只对code 1运行encoder, code 2由encode_partners复用.
+        classifier只把两段代码的<s>输出拼起来, 所以结果和forward相同.
+        '''
+        input_ids = input_ids.view(input_ids.size(0), 2, -1)
+        outputs_1 = self.encode(input_ids[:, 0])
+        outputs_2 = self.encode_partners(input_ids[:, 1])
+        outputs = torch.cat((outputs_1, outputs_2), 1).view(-1, 1, outputs_1.size(-1))
+        logits = self.classifier(outputs)
+        prob = F.softmax(logits)
+        return prob
 
-        ## Evaluate Model
+    def train(self, mode=True):
+        # 参数会被更新, 缓存的code 2输出不再有效
+        if mode:
+            self.partner_cache = QueryCache(self.partner_cache.maxsize)
+        return super(Model, self).train(mode)
 
-        eval_loss = 0.0
+    def feature_length(self, item):
+        # 两段代码各自pad到block_size, 取较长的那段
+        code1, code2 = item[0].view(2, -1)
+        return max(int(code1.ne(self.tokenizer.pad_token_id).sum()), int(code2.ne(self.tokenizer.pad_token_id).sum()))
+
+    def trim_features(self, features):
+        '''
+        features: [input_ids (两段代码拼接), labels]. 两段都只pad到batch里最长的那段
+        '''
+        input_ids = features[0].view(features[0].size(0), 2, -1)
+        length = int(input_ids.ne(self.tokenizer.pad_token_id).sum(-1).max())
+        return [input_ids[:, :, :length].reshape(input_ids.size(0), -1)] + features[1:]
+
+    def get_results(self, dataset, batch_size, threshold=0.5):
+        '''Given a dataset, return probabilities and labels.'''
         self.eval()
-        logits=[] 
-        labels=[]
-        for batch in eval_dataloader:
-            inputs = batch[0].to("cuda")       
-            label=batch[1].to("cuda") 
-            with torch.no_grad():
-                lm_loss,logit = self.forward(inputs,label)
-                # 调用这个模型. 重写了反前向传播模型.
-                eval_loss += lm_loss.mean().item()
-                logits.append(logit.cpu().numpy())
-                # 和defect detection任务不一样，这个的输出就是softmax值，而非sigmoid值
-                labels.append(label.cpu().numpy())
-        logits=np.concatenate(logits,0)
-        labels=np.concatenate(labels,0)
+        logits, nb_queries = self.engine.predict(self, dataset, batch_size)
+        # inputs served from the query cache are not counted as queries
+        self.query += nb_queries
+        # 和defect detection任务不一样，这个的输出就是softmax值，而非sigmoid值
 
         probs = logits
         pred_labels = [0 if first_softmax  > threshold else 1 for first_softmax in logits[:,0]]
@@ -43,6 +43,7 @@ except:
 from tqdm import tqdm, trange
 import multiprocessing
 from model import Model
+from utils import FeatureStore
 
 cpu_cont = 16
 from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
@@ -135,7 +136,7 @@ class TextDataset(Dataset):
                                     postfix))
         code_pairs = []
         try:
-            self.examples = torch.load(cache_file_path)
+            self.examples = FeatureStore.load(cache_file_path)
             with open(code_pairs_file_path, 'rb') as f:
                 code_pairs = pickle.load(f)
             logger.info("Loading features from cached file %s", cache_file_path)
@@ -176,7 +177,7 @@ class TextDataset(Dataset):
                 pickle.dump(code_pairs, f)
             pool = multiprocessing.Pool(7)
             self.examples=pool.map(get_example,tqdm(data,total=len(data)))
-            torch.save(self.examples, cache_file_path)
+            self.examples = FeatureStore.save(cache_file_path, self.examples)
         # 这应该就是处理数据的地方了.
         if 'train' in postfix:
             for idx, example in enumerate(self.examples[:3]):
@@ -193,7 +194,7 @@ class TextDataset(Dataset):
 
     def __getitem__(self, item):
         
-        return torch.tensor(self.examples[item].input_ids),torch.tensor(self.examples[item].label)
+        return torch.tensor(self.examples[item].input_ids, dtype=torch.long),torch.tensor(self.examples[item].label)
 
 
 def load_and_cache_examples(args, tokenizer, evaluate=False,test=False,pool=None):
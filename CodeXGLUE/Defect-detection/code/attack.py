@@ -25,6 +25,7 @@ from run import set_seed
 from run import TextDataset
 from run import InputFeatures
 from utils import is_valid_variable_name, _tokenize
+from utils import get_device, IdentifierMLMHead
 from utils import get_identifier_posistions_from_code
 from utils import get_masked_code_by_position, get_substitues
 from run_parser import get_identifiers
@@ -57,29 +58,8 @@ def get_results(dataset, model, batch_size):
     '''
     给定example和tgt model，返回预测的label和probability
     '''
-
-    eval_sampler = SequentialSampler(dataset)
-    eval_dataloader = DataLoader(dataset, sampler=eval_sampler, batch_size=batch_size,num_workers=4,pin_memory=False)
-
-    ## Evaluate Model
-
-    nb_eval_steps = 0
     model.eval()
-    logits=[] 
-    labels=[]
-    for batch in eval_dataloader:
-        inputs = batch[0].to("cuda")       
-        label=batch[1].to("cuda") 
-        with torch.no_grad():
-            lm_loss,logit = model(inputs,label)
-            # 调用这个模型. 重写了反前向传播模型.
-            logits.append(logit.cpu().numpy())
-            labels.append(label.cpu().numpy())
-            
-
-        nb_eval_steps += 1
-    logits=np.concatenate(logits,0)
-    labels=np.concatenate(labels,0)
+    logits, _ = model.engine.predict(model, dataset, batch_size)
 
     probs = [[1 - prob[0], prob[0]] for prob in logits]
     pred_labels = [1 if label else 0 for label in logits[:,0]>0.5]
@@ -133,7 +113,7 @@ def get_importance_score(args, example, code, words_list: list, sub_words: list,
 
     return importance_score, replace_token_positions, positions
 
-def attack(args, example, code, codebert_tgt, tokenizer_tgt, codebert_mlm, tokenizer_mlm, use_bpe, threshold_pred_score):
+def attack(args, example, code, codebert_tgt, tokenizer_tgt, codebert_mlm, tokenizer_mlm, use_bpe, threshold_pred_score, identifier_head=None):
     '''
     return
         original program: code
@@ -191,8 +171,11 @@ def attack(args, example, code, codebert_tgt, tokenizer_tgt, codebert_mlm, token
     sub_words = [tokenizer_tgt.cls_token] + sub_words[:args.block_size - 2] + [tokenizer_tgt.sep_token]
     # 如果长度超了，就截断；这里的block_size是CodeBERT能接受的输入长度
     input_ids_ = torch.tensor([tokenizer_mlm.convert_tokens_to_ids(sub_words)])
-    word_predictions = codebert_mlm(input_ids_.to('cuda'))[0].squeeze()  # seq-len(sub) vocab
-    word_pred_scores_all, word_predictions = torch.topk(word_predictions, 30, -1)  # seq-len k
+    if identifier_head is None:
+        identifier_head = IdentifierMLMHead(codebert_mlm, tokenizer_mlm)
+    # 只在可以组成变量名的subword上取top k
+    word_pred_scores_all, word_predictions, _ = identifier_head.topk(input_ids_, 30)
+    word_pred_scores_all, word_predictions = word_pred_scores_all.squeeze(), word_predictions.squeeze()  # seq-len k
     # 得到前k个结果.
 
     word_predictions = word_predictions[1:len(sub_words) + 1, :]
@@ -442,6 +425,10 @@ def main():
                         help="Overwrite the content of the output directory")
     parser.add_argument('--overwrite_cache', action='store_true',
                         help="Overwrite the cached training and evaluation sets")
+    parser.add_argument("--num_threads", default=0, type=int,
+                        help="Number of CPU threads for inference when running without CUDA (0 = torch default).")
+    parser.add_argument("--query_cache_size", default=100000, type=int,
+                        help="Max number of cached victim model outputs (0 disables the query cache).")
     parser.add_argument('--seed', type=int, default=42,
                         help="random seed for initialization")
     parser.add_argument('--epoch', type=int, default=42,
@@ -460,7 +447,7 @@ def main():
     args = parser.parse_args()
 
 
-    args.device = torch.device("cuda")
+    args.device = get_device(args.no_cuda, args.num_threads)
     # Set seed
     set_seed(args.seed)
 
@@ -509,7 +496,7 @@ def main():
 
     checkpoint_prefix = 'checkpoint-best-acc/model.bin'
     output_dir = os.path.join(args.output_dir, '{}'.format(checkpoint_prefix))  
-    model.load_state_dict(torch.load(output_dir))      
+    model.load_state_dict(torch.load(output_dir, map_location=args.device))
     model.to(args.device)
     # 会是因为模型不同吗？我看evaluate的时候模型是重新导入的.
 
@@ -517,7 +504,8 @@ def main():
     ## Load CodeBERT (MLM) model
     codebert_mlm = RobertaForMaskedLM.from_pretrained(args.base_model)
     tokenizer_mlm = RobertaTokenizer.from_pretrained(args.base_model)
-    codebert_mlm.to('cuda') 
+    codebert_mlm.to(args.device)
+    identifier_head = IdentifierMLMHead(codebert_mlm, tokenizer_mlm)
 
     ## Load Dataset
     test_dataset = TextDataset(tokenizer, args,args.eval_data_file)
@@ -551,7 +539,7 @@ def main():
                     "Replaced Names"])
     for index, example in enumerate(test_dataset):
         code = source_codes[index]
-        code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, names_to_importance_score, nb_changed_var, nb_changed_pos, replaced_words = attack(args, example, code, model, tokenizer, codebert_mlm, tokenizer_mlm, use_bpe=1, threshold_pred_score=0)
+        code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, names_to_importance_score, nb_changed_var, nb_changed_pos, replaced_words = attack(args, example, code, model, tokenizer, codebert_mlm, tokenizer_mlm, use_bpe=1, threshold_pred_score=0, identifier_head=identifier_head)
 
 
         score_info = ''
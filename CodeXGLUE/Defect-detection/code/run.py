@@ -34,7 +34,7 @@ sys.path.append('../../')
 sys.path.append('../../../')
 sys.path.append('../../../python_parser')
 from python_parser.parser_folder import remove_comments_and_docstrings
-from utils import set_seed
+from utils import set_seed, FeatureStore
 
 import numpy as np
 import torch
@@ -106,7 +106,7 @@ class TextDataset(Dataset):
 
         print('\n cached_features_file: ',cache_file_path)
         try:
-            self.examples = torch.load(cache_file_path)
+            self.examples = FeatureStore.load(cache_file_path)
             logger.info("Loading features from cached file %s", cache_file_path)
         
         except:
@@ -117,7 +117,7 @@ class TextDataset(Dataset):
                     self.examples.append(convert_examples_to_features(js,tokenizer,args))
                     # 这里每次都是重新读取并处理数据集，能否cache然后load
             logger.info("Saving features into cached file %s", cache_file_path)
-            torch.save(self.examples, cache_file_path)
+            self.examples = FeatureStore.save(cache_file_path, self.examples)
 
         if 'train' in file_path:
             for idx, example in enumerate(self.examples[:3]):
@@ -131,7 +131,7 @@ class TextDataset(Dataset):
         return len(self.examples)
 
     def __getitem__(self, i):       
-        return torch.tensor(self.examples[i].input_ids),torch.tensor(self.examples[i].label)
+        return torch.tensor(self.examples[i].input_ids, dtype=torch.long),torch.tensor(self.examples[i].label)
             
 
 
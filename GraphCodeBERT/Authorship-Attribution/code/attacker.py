@@ -5,25 +5,28 @@ sys.path.append('../../../')
 sys.path.append('../../../python_parser')
 
 import copy
+import time
 import torch
 import numpy as np
 import random
 from run import InputFeatures, extract_dataflow
-from utils import select_parents, crossover, map_chromesome, mutate, is_valid_variable_name, _tokenize, get_identifier_posistions_from_code, get_masked_code_by_position, get_substitues, is_valid_substitue
+from utils import GeneticPopulation, map_chromesome, is_valid_variable_name, _tokenize, get_identifier_posistions_from_code, get_masked_code_by_position, get_substitues, is_valid_substitue
 
-from utils import GraphCodeDataset, isUID
+from utils import GraphCodeDataset, isUID, GraphFeatureTemplate, build_graph_features, code_token_pieces, candidate_batches, MHMChain, mhm_accept
+from utils import get_gradient_importance_score, report_importance_agreement, get_masked_code_by_variable, spread_variable_scores
 from run_parser import get_identifiers, get_example
+from functools import lru_cache
 
-def compute_fitness(chromesome, codebert_tgt, tokenizer_tgt, orig_prob, orig_label, true_label ,code, names_positions_dict, args):
+def compute_population_fitness(chromesomes, codebert_tgt, tokenizer_tgt, orig_prob, orig_label, true_label ,code, names_positions_dict, args):
     # 计算fitness function.
     # words + chromesome + orig_label + current_prob
-    temp_code = map_chromesome(chromesome, code, "python")
-    new_feature = convert_code_to_features(temp_code, tokenizer_tgt, true_label, args)
-    new_dataset = GraphCodeDataset([new_feature], args)
+    # 所有chromesome放在一个dataset里一起query
+    new_example = [convert_renamed_features(code, chromesome, tokenizer_tgt, true_label, args) for chromesome in chromesomes]
+    new_dataset = GraphCodeDataset(new_example, args)
     new_logits, preds = codebert_tgt.get_results(new_dataset, args.eval_batch_size)
     # 计算fitness function
-    fitness_value = orig_prob - new_logits[0][orig_label]
-    return fitness_value, preds[0]
+    fitness_values = [orig_prob - logits[orig_label] for logits in new_logits]
+    return fitness_values, preds
 
 from parser import DFG_python,DFG_java,DFG_ruby,DFG_go,DFG_php,DFG_javascript
 from parser import (remove_comments_and_docstrings,
@@ -53,36 +56,39 @@ def convert_code_to_features(code, tokenizer, label, args):
     # 这里要被修改..
     parser = parsers["python"]
     code_tokens,dfg = extract_dataflow(code, parser, "python")
-    code_tokens=[tokenizer.tokenize('@ '+x)[1:] if idx!=0 else tokenizer.tokenize(x) for idx,x in enumerate(code_tokens)]
-    ori2cur_pos={}
-    ori2cur_pos[-1]=(0,0)
-    for i in range(len(code_tokens)):
-        ori2cur_pos[i]=(ori2cur_pos[i-1][1],ori2cur_pos[i-1][1]+len(code_tokens[i]))    
-    code_tokens=[y for x in code_tokens for y in x]
-
-    code_tokens=code_tokens[:args.code_length+args.data_flow_length-2-min(len(dfg),args.data_flow_length)]
-    source_tokens =[tokenizer.cls_token]+code_tokens+[tokenizer.sep_token]
-    source_ids =  tokenizer.convert_tokens_to_ids(source_tokens)
-    position_idx = [i+tokenizer.pad_token_id + 1 for i in range(len(source_tokens))]
-    dfg = dfg[:args.code_length+args.data_flow_length-len(source_tokens)]
-    source_tokens += [x[0] for x in dfg]
-    position_idx+=[0 for x in dfg]
-    source_ids+=[tokenizer.unk_token_id for x in dfg]
-    padding_length=args.code_length+args.data_flow_length-len(source_ids)
-    position_idx+=[tokenizer.pad_token_id]*padding_length
-    source_ids+=[tokenizer.pad_token_id]*padding_length
-
-    reverse_index={}
-    for idx,x in enumerate(dfg):
-        reverse_index[x[1]]=idx
-    for idx,x in enumerate(dfg):
-        dfg[idx]=x[:-1]+([reverse_index[i] for i in x[-1] if i in reverse_index],)    
-    dfg_to_dfg=[x[-1] for x in dfg]
-    dfg_to_code=[ori2cur_pos[x[1]] for x in dfg]
-    length=len([tokenizer.cls_token])
-    dfg_to_code=[(x[0]+length,x[1]+length) for x in dfg_to_code]
-    
-    return InputFeatures(source_tokens, source_ids, position_idx, dfg_to_code, dfg_to_dfg, label)
+    features = build_graph_features(code_token_pieces(code_tokens, tokenizer), dfg, tokenizer, args)
+    return InputFeatures(*features, label)
+
+
+def has_syntax_error(code):
+    # 和run.extract_dataflow相同的预处理
+    code = code.replace("\\n", "\n")
+    try:
+        code = remove_comments_and_docstrings(code, "python")
+    except:
+        pass
+    return parsers["python"][0].parse(bytes(code,'utf8')).root_node.has_error
+
+
+@lru_cache(maxsize=64)
+def get_feature_template(code, tokenizer, persist=True):
+    # 和convert_code_to_features(map_chromesome(chromesome, code, "python"), ...)相同的预处理
+    code = map_chromesome({}, code, "python", persist)
+    code_tokens,dfg = extract_dataflow(code, parsers["python"], "python")
+    # 和utils.get_graph_feature_template相同: 有非ASCII字符时DFG中的变量名可能被截错, 只能完整地重新计算
+    return GraphFeatureTemplate(code_tokens, dfg, tokenizer, "python", code.isascii() and not has_syntax_error(code))
+
+
+def convert_renamed_features(code, chromesome, tokenizer, label, args, persist=True):
+    '''
+    和convert_code_to_features(map_chromesome(chromesome, code, "python"), tokenizer, label, args)相同,
+    但是复用code的DFG和subword, 只重新tokenize被重命名的token.
+    persist=False: code是attack过程中得到的代码 (不是数据集中的), 它的解析结果不写入磁盘缓存.
+    '''
+    features = get_feature_template(code, tokenizer, persist).rename(chromesome, args)
+    if features is None:
+        return convert_code_to_features(map_chromesome(chromesome, code, "python", persist), tokenizer, label, args)
+    return InputFeatures(*features, label)
 
 
 def get_importance_score(args, example, code, words_list: list, sub_words: list, variable_names: list, tgt_model, tokenizer, label_list, batch_size=16, max_length=512, model_type='classification'):
@@ -101,6 +107,20 @@ def get_importance_score(args, example, code, words_list: list, sub_words: list,
     masked_token_list, replace_token_positions = get_masked_code_by_position(words_list, positions)
     # replace_token_positions 表示着，哪一个位置的token被替换了.
 
+    # --importance_mode gradient: 只对原始代码做一次forward + backward, 见get_gradient_importance_score
+    importance_mode = getattr(args, 'importance_mode', 'mask')
+    if importance_mode in ['gradient', 'compare']:
+        gradient_start = time.time()
+        orig_dataset = GraphCodeDataset([convert_code_to_features(' '.join(words_list), tokenizer, example[3].item(), args)], args)
+        gradient_score = get_gradient_importance_score(tgt_model, orig_dataset, words_list, replace_token_positions, args.ig_steps)
+        gradient_time = time.time() - gradient_start
+        if importance_mode == 'gradient' and gradient_score is not None:
+            return gradient_score, replace_token_positions, positions
+    mask_start = time.time()
+    if importance_mode == 'variable':
+        # 每个变量只mask一次 (所有位置同时mask)
+        masked_token_list = get_masked_code_by_variable(words_list, positions)
+
 
     for index, tokens in enumerate([words_list] + masked_token_list):
         new_code = ' '.join(tokens)
@@ -120,6 +140,12 @@ def get_importance_score(args, example, code, words_list: list, sub_words: list,
     for prob in logits[1:]:
         importance_score.append(orig_prob - prob[orig_label])
 
+    if importance_mode == 'variable':
+        importance_score = spread_variable_scores(positions, importance_score)
+    if importance_mode == 'compare' and gradient_score is not None:
+        report_importance_agreement(positions, replace_token_positions, importance_score, gradient_score,
+                                    (time.time() - mask_start, len(masked_token_list) + 1), (gradient_time, args.ig_steps))
+
     return importance_score, replace_token_positions, positions
 
 class Attacker():
@@ -201,86 +227,65 @@ class Attacker():
         base_chromesome = {word: word for word in variable_substitue_dict.keys()}
         population = [base_chromesome]
         # 关于chromesome的定义: {tgt_word: candidate, tgt_word_2: candidate_2, ...}
-        for tgt_word in variable_substitue_dict.keys():
-            # 这里进行初始化
-            if initial_replace is None:
-                # 对于每个variable: 选择"影响最大"的substitues
-                replace_examples = []
-                substitute_list = []
-                
-                current_prob = max(orig_prob)
-                most_gap = 0.0
-                initial_candidate = tgt_word
-                tgt_positions = names_positions_dict[tgt_word]
-                
-                # 原来是随机选择的，现在要找到改变最大的.
+        if initial_replace is None:
+            # 对于每个variable: 选择"影响最大"的substitues.
+            # 所有variable的substitues放在一起query
+            replace_examples = []
+            substitute_list = []
+            for tgt_word in variable_substitue_dict.keys():
                 for a_substitue in variable_substitue_dict[tgt_word]:
-                    # a_substitue = a_substitue.strip()
-                    substitute_list.append(a_substitue)
-                    temp_code = get_example(code, tgt_word, a_substitue, "python")
-
-                    new_feature = convert_code_to_features(temp_code, self.tokenizer_tgt, example[3].item(), self.args)
+                    # 记录下这次换的是哪个variable的哪个substitue
+                    substitute_list.append((tgt_word, a_substitue))
+                    new_feature = convert_renamed_features(code, {tgt_word: a_substitue}, self.tokenizer_tgt, example[3].item(), self.args)
                     replace_examples.append(new_feature)
 
-                if len(replace_examples) == 0:
-                    # 并没有生成新的mutants，直接跳去下一个token
-                    continue
+            initial_candidates = {}
+            most_gaps = {}
+            if len(replace_examples) > 0:
                 new_dataset = GraphCodeDataset(replace_examples, self.args)
-                    # 3. 将他们转化成features
                 logits, preds = self.model_tgt.get_results(new_dataset, self.args.eval_batch_size)
-
-                _the_best_candidate = -1
+                current_prob = max(orig_prob)
                 for index, temp_prob in enumerate(logits):
-                    temp_label = preds[index]
-                    gap = current_prob - temp_prob[temp_label]
+                    tgt_word, a_substitue = substitute_list[index]
+                    # 没有gap > 0的substitue时保持原来的变量名
+                    initial_candidates.setdefault(tgt_word, tgt_word)
+                    gap = current_prob - temp_prob[preds[index]]
                     # 并选择那个最大的gap.
-                    if gap > most_gap:
-                        most_gap = gap
-                        _the_best_candidate = index
-                if _the_best_candidate == -1:
-                    initial_candidate = tgt_word
-                else:
-                    initial_candidate = substitute_list[_the_best_candidate]
-            else:
-                initial_candidate = initial_replace[tgt_word]
+                    if gap > most_gaps.get(tgt_word, 0.0):
+                        most_gaps[tgt_word] = gap
+                        initial_candidates[tgt_word] = a_substitue
+        else:
+            initial_candidates = initial_replace
 
+        for tgt_word in variable_substitue_dict.keys():
+            if initial_replace is None and tgt_word not in initial_candidates:
+                # 并没有生成新的mutants，直接跳去下一个token
+                continue
             temp_chromesome = copy.deepcopy(base_chromesome)
-            temp_chromesome[tgt_word] = initial_candidate
+            temp_chromesome[tgt_word] = initial_candidates[tgt_word]
             population.append(temp_chromesome)
-            temp_fitness, temp_label = compute_fitness(temp_chromesome, self.model_tgt, self.tokenizer_tgt, max(orig_prob), orig_label, true_label ,code, names_positions_dict, self.args)
-            fitness_values.append(temp_fitness)
 
+        # 所有初始的chromesome一起计算fitness
+        if len(population) > 1:
+            fitness_values, preds = compute_population_fitness(population[1:], self.model_tgt, self.tokenizer_tgt, max(orig_prob), orig_label, true_label, code, names_positions_dict, self.args)
+            temp_label = preds[-1]
+
+        # 种群用整数数组表示, 见GeneticPopulation. 原来的变量名的fitness为0
+        ga_population = GeneticPopulation(variable_substitue_dict)
+        ga_population.add(population, [0.0] + list(fitness_values))
         cross_probability = 0.7
 
         max_iter = max(5 * len(population), 10)
         # 这里的超参数还是的调试一下.
 
         for i in range(max_iter):
-            _temp_mutants = []
-            for j in range(self.args.eval_batch_size):
-                p = random.random()
-                chromesome_1, index_1, chromesome_2, index_2 = select_parents(population)
-                if p < cross_probability: # 进行crossover
-                    if chromesome_1 == chromesome_2:
-                        child_1 = mutate(chromesome_1, variable_substitue_dict)
-                        continue
-                    child_1, child_2 = crossover(chromesome_1, chromesome_2)
-                    if child_1 == chromesome_1 or child_1 == chromesome_2:
-                        child_1 = mutate(chromesome_1, variable_substitue_dict)
-                else: # 进行mutates
-                    child_1 = mutate(chromesome_1, variable_substitue_dict)
-                _temp_mutants.append(child_1)
-            
+            children = ga_population.breed(self.args.eval_batch_size, cross_probability)
+            if len(children) == 0:
+                continue
+            _temp_mutants = [ga_population.decode(child) for child in children]
             # compute fitness in batch
-            feature_list = []
-            for mutant in _temp_mutants:
-                _temp_code = map_chromesome(mutant, code, "python")
-                _tmp_feature = convert_code_to_features(_temp_code, self.tokenizer_tgt, true_label, self.args)
-                feature_list.append(_tmp_feature)
-            new_dataset = GraphCodeDataset(feature_list, self.args)
-            mutate_logits, mutate_preds = self.model_tgt.get_results(new_dataset, self.args.eval_batch_size)
-            mutate_fitness_values = []
-            for index, logits in enumerate(mutate_logits):
+            mutate_fitness_values, mutate_preds = compute_population_fitness(_temp_mutants, self.model_tgt, self.tokenizer_tgt, max(orig_prob), orig_label, true_label, code, names_positions_dict, self.args)
+            for index in range(len(_temp_mutants)):
                 if mutate_preds[index] != orig_label:
                     adv_code = map_chromesome(_temp_mutants[index], code, "python")
                     for old_word in _temp_mutants[index].keys():
@@ -289,17 +294,9 @@ class Attacker():
                             nb_changed_pos += len(names_positions_dict[old_word])
 
                     return code, prog_length, adv_code, true_label, orig_label, mutate_preds[index], 1, variable_names, None, nb_changed_var, nb_changed_pos, _temp_mutants[index]
-                _tmp_fitness = max(orig_prob) - logits[orig_label]
-                mutate_fitness_values.append(_tmp_fitness)
-            
+
             # 现在进行替换.
-            for index, fitness_value in enumerate(mutate_fitness_values):
-                min_value = min(fitness_values)
-                if fitness_value > min_value:
-                    # 替换.
-                    min_index = fitness_values.index(min_value)
-                    population[min_index] = _temp_mutants[index]
-                    fitness_values[min_index] = fitness_value
+            ga_population.replace(children, mutate_fitness_values)
 
         return code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, None, nb_changed_var, nb_changed_pos, None
         
@@ -410,58 +407,53 @@ class Attacker():
             
             all_substitues = subs[tgt_word]
 
+            if len(all_substitues) == 0:
+                # 并没有生成新的mutants，直接跳去下一个token
+                continue
+
             most_gap = 0.0
             candidate = None
-            replace_examples = []
-
-            substitute_list = []
-
-            for substitute in all_substitues:
-                
-                substitute_list.append(substitute)
-                # 记录了替换的顺序
+            # 按substitutes的顺序 (get_substitutes中的排名) 分micro-batch查询, 一旦攻击成功就不再查询剩下的
+            for substitute_list in candidate_batches(all_substitues, self.args.greedy_batch_size):
+                replace_examples = []
+                for substitute in substitute_list:
+                    # 需要将几个位置都替换成sustitue_
+                    new_feature = convert_renamed_features(final_code, {tgt_word: substitute}, self.tokenizer_tgt, example[3].item(), self.args, persist=False)
+                    replace_examples.append(new_feature)
+                new_dataset = GraphCodeDataset(replace_examples, self.args)
+                    # 3. 将他们转化成features
+                logits, preds = self.model_tgt.get_results(new_dataset, self.args.eval_batch_size)
+                assert(len(logits) == len(substitute_list))
 
-                # 需要将几个位置都替换成sustitue_
-                temp_code = get_example(final_code, tgt_word, substitute, "python")
-                new_feature = convert_code_to_features(temp_code, self.tokenizer_tgt, example[3].item(), self.args)
-                replace_examples.append(new_feature)
-            if len(replace_examples) == 0:
-                # 并没有生成新的mutants，直接跳去下一个token
-                continue
-            new_dataset = GraphCodeDataset(replace_examples, self.args)
-                # 3. 将他们转化成features
-            logits, preds = self.model_tgt.get_results(new_dataset, self.args.eval_batch_size)
-            assert(len(logits) == len(substitute_list))
-
-            for index, temp_prob in enumerate(logits):
-                temp_label = preds[index]
-                if temp_label != orig_label:
-                    # 如果label改变了，说明这个mutant攻击成功
-                    is_success = 1
-                    nb_changed_var += 1
-                    nb_changed_pos += len(names_positions_dict[tgt_word])
-                    candidate = substitute_list[index]
-                    replaced_words[tgt_word] = candidate
-                    adv_code = get_example(final_code, tgt_word, candidate, "python")
-                    print("%s SUC! %s => %s (%.5f => %.5f)" % \
-                        ('>>', tgt_word, candidate,
-                        current_prob,
-                        temp_prob[orig_label]), flush=True)
-                    return code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, names_to_importance_score, nb_changed_var, nb_changed_pos, replaced_words
-                else:
-                    # 如果没有攻击成功，我们看probability的修改
-                    gap = current_prob - temp_prob[temp_label]
-                    # 并选择那个最大的gap.
-                    if gap > most_gap:
-                        most_gap = gap
+                for index, temp_prob in enumerate(logits):
+                    temp_label = preds[index]
+                    if temp_label != orig_label:
+                        # 如果label改变了，说明这个mutant攻击成功
+                        is_success = 1
+                        nb_changed_var += 1
+                        nb_changed_pos += len(names_positions_dict[tgt_word])
                         candidate = substitute_list[index]
-        
+                        replaced_words[tgt_word] = candidate
+                        adv_code = get_example(final_code, tgt_word, candidate, "python", persist=False)
+                        print("%s SUC! %s => %s (%.5f => %.5f)" % \
+                            ('>>', tgt_word, candidate,
+                            current_prob,
+                            temp_prob[orig_label]), flush=True)
+                        return code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, names_to_importance_score, nb_changed_var, nb_changed_pos, replaced_words
+                    else:
+                        # 如果没有攻击成功，我们看probability的修改
+                        gap = current_prob - temp_prob[temp_label]
+                        # 并选择那个最大的gap.
+                        if gap > most_gap:
+                            most_gap = gap
+                            candidate = substitute_list[index]
+
             if most_gap > 0:
 
                 nb_changed_var += 1
                 nb_changed_pos += len(names_positions_dict[tgt_word])
                 current_prob = current_prob - most_gap
-                final_code = get_example(final_code, tgt_word, candidate, "python")
+                final_code = get_example(final_code, tgt_word, candidate, "python", persist=False)
                 replaced_words[tgt_word] = candidate
                 print("%s ACC! %s => %s (%.5f => %.5f)" % \
                     ('>>', tgt_word, candidate,
@@ -504,52 +496,25 @@ class MHM_Attacker():
         for tgt_word in uid.keys():
             variable_substitue_dict[tgt_word] = subs[tgt_word]
         
-        old_uids = {}
-        old_uid = ""
+        chains = [MHMChain(code, uid, variable_substitue_dict, raw_tokens) for _ in range(max(1, getattr(self.args, 'mhm_chains', 1)))]
         for iteration in range(1, 1+_max_iter):
-            # 这个函数需要tokens
-            res = self.__replaceUID(_tokens=code, _label=_label, _uid=uid,
-                                    substitute_dict=variable_substitue_dict,
-                                    _n_candi=_n_candi,
-                                    _prob_threshold=_prob_threshold)
-            self.__printRes(_iter=iteration, _res=res, _prefix="  >> ")
-            if res['status'].lower() in ['s', 'a']:
-                if iteration == 1:
-                    old_uids[res["old_uid"]] = []
-                    old_uids[res["old_uid"]].append(res["new_uid"])
-                    old_uid = res["old_uid"]
-                flag = 0
-                for k in old_uids.keys():
-                    if res["old_uid"] == old_uids[k][-1]:
-                        flag = 1
-                        old_uids[k].append(res["new_uid"])
-                        old_uid = k
-                        break
-                if flag == 0:
-                    old_uids[res["old_uid"]] = []
-                    old_uids[res["old_uid"]].append(res["new_uid"])
-                    old_uid = res["old_uid"]
-
-                code = res['tokens']
-                uid[res['new_uid']] = uid.pop(res['old_uid']) # 替换key，但保留value.
-                variable_substitue_dict[res['new_uid']] = variable_substitue_dict.pop(res['old_uid'])
-                for i in range(len(raw_tokens)):
-                    if raw_tokens[i] == res['old_uid']:
-                        raw_tokens[i] = res['new_uid']
-                if res['status'].lower() == 's':
-                    replace_info = {}
-                    nb_changed_pos = 0
-                    for uid_ in old_uids.keys():
-                        replace_info[uid_] = old_uids[uid_][-1]
-                        nb_changed_pos += len(uid[old_uids[uid_][-1]])
-                    return {'succ': True, 'tokens': code,
-                            'raw_tokens': raw_tokens, "prog_length": prog_length, "new_pred": res["new_pred"], "is_success": 1, "old_uid": old_uid, "score_info": res["old_prob"][0]-res["new_prob"][0], "nb_changed_var": len(old_uids), "nb_changed_pos":nb_changed_pos, "replace_info": replace_info, "attack_type": "MHM"}
-        replace_info = {}
-        nb_changed_pos = 0
-        for uid_ in old_uids.keys():
-            replace_info[uid_] = old_uids[uid_][-1]
-            nb_changed_pos += len(uid[old_uids[uid_][-1]])
-        return {'succ': False, 'tokens': res['tokens'], 'raw_tokens': None, "prog_length": prog_length, "new_pred": res["new_pred"], "is_success": -1, "old_uid": old_uid, "score_info": res["old_prob"][0]-res["new_prob"][0], "nb_changed_var": len(old_uids), "nb_changed_pos":nb_changed_pos, "replace_info": replace_info, "attack_type": "MHM"}
+            # 所有链的候选一起打分, 任意一条链攻击成功就停止
+            results = self.__replaceUID(chains, _label=_label,
+                                        _n_candi=_n_candi,
+                                        _prob_threshold=_prob_threshold)
+            for k, (chain, res) in enumerate(zip(chains, results)):
+                self.__printRes(_iter=iteration, _res=res, _prefix="  >> " if len(chains) == 1 else "  >> chain %d," % k)
+                chain.update(res, iteration)
+            for chain in chains:
+                if chain.res['status'].lower() == 's':
+                    res = chain.res
+                    replace_info, nb_changed_pos = chain.replace_info()
+                    return {'succ': True, 'tokens': chain.code,
+                            'raw_tokens': chain.raw_tokens, "prog_length": prog_length, "new_pred": res["new_pred"], "is_success": 1, "old_uid": chain.old_uid, "score_info": res["old_prob"][0]-res["new_prob"][0], "nb_changed_var": len(chain.old_uids), "nb_changed_pos":nb_changed_pos, "replace_info": replace_info, "attack_type": "MHM"}
+        chain = chains[0]
+        res = chain.res
+        replace_info, nb_changed_pos = chain.replace_info()
+        return {'succ': False, 'tokens': res['tokens'], 'raw_tokens': None, "prog_length": prog_length, "new_pred": res["new_pred"], "is_success": -1, "old_uid": chain.old_uid, "score_info": res["old_prob"][0]-res["new_prob"][0], "nb_changed_var": len(chain.old_uids), "nb_changed_pos":nb_changed_pos, "replace_info": replace_info, "attack_type": "MHM"}
     
     
     def mcmc_random(self, tokenizer, code=None, _label=None, _n_candi=30,
@@ -572,173 +537,69 @@ class MHM_Attacker():
         for tgt_word in uid.keys():
             variable_substitue_dict[tgt_word] = subs[tgt_word]
             
-        old_uids = {}
-        old_uid = ""
+        chains = [MHMChain(code, uid, variable_substitue_dict, raw_tokens) for _ in range(max(1, getattr(self.args, 'mhm_chains', 1)))]
         for iteration in range(1, 1+_max_iter):
-            # 这个函数需要tokens
-            res = self.__replaceUID_random(_tokens=code, _label=_label, _uid=uid,
-                                    substitute_dict=variable_substitue_dict,
-                                    _n_candi=_n_candi,
-                                    _prob_threshold=_prob_threshold)
-            self.__printRes(_iter=iteration, _res=res, _prefix="  >> ")
-            if res['status'].lower() in ['s', 'a']:
-                if iteration == 1:
-                    old_uids[res["old_uid"]] = []
-                    old_uids[res["old_uid"]].append(res["new_uid"])
-                    old_uid = res["old_uid"]
-                flag = 0
-                for k in old_uids.keys():
-                    if res["old_uid"] == old_uids[k][-1]:
-                        flag = 1
-                        old_uids[k].append(res["new_uid"])
-                        old_uid = k
-                        break
-                if flag == 0:
-                    old_uids[res["old_uid"]] = []
-                    old_uids[res["old_uid"]].append(res["new_uid"])
-                    old_uid = res["old_uid"]
-                code = res['tokens']
-                uid[res['new_uid']] = uid.pop(res['old_uid']) # 替换key，但保留value.
-                variable_substitue_dict[res['new_uid']] = variable_substitue_dict.pop(res['old_uid'])
-                for i in range(len(raw_tokens)):
-                    if raw_tokens[i] == res['old_uid']:
-                        raw_tokens[i] = res['new_uid']
-                if res['status'].lower() == 's':
-                    replace_info = {}
-                    nb_changed_pos = 0
-                    for uid_ in old_uids.keys():
-                        replace_info[uid_] = old_uids[uid_][-1]
-                        nb_changed_pos += len(uid[old_uids[uid_][-1]])
-                    return {'succ': True, 'tokens': code,
-                            'raw_tokens': raw_tokens, "prog_length": prog_length, "new_pred": res["new_pred"], "is_success": 1, "old_uid": old_uid, "score_info": res["old_prob"][0]-res["new_prob"][0], "nb_changed_var": len(old_uids), "nb_changed_pos": nb_changed_pos, "replace_info": replace_info, "attack_type": "Ori_MHM"}
-        replace_info = {}
-        nb_changed_pos = 0
-        for uid_ in old_uids.keys():
-            replace_info[uid_] = old_uids[uid_][-1]
-            nb_changed_pos += len(uid[old_uids[uid_][-1]])
-        return {'succ': False, 'tokens': res['tokens'], 'raw_tokens': None, "prog_length": prog_length, "new_pred": res["new_pred"], "is_success": -1, "old_uid": old_uid, "score_info": res["old_prob"][0]-res["new_prob"][0], "nb_changed_var": len(old_uids), "nb_changed_pos": nb_changed_pos, "replace_info": replace_info, "attack_type": "Ori_MHM"}
-    
-    def __replaceUID(self, _tokens, _label=None, _uid={}, substitute_dict={},
-                     _n_candi=30, _prob_threshold=0.95, _candi_mode="random"):
-        
-        assert _candi_mode.lower() in ["random", "nearby"]
-        
-        selected_uid = random.sample(substitute_dict.keys(), 1)[0] # 选择需要被替换的变量名
-        if _candi_mode == "random":
-            # First, generate candidate set.
-            # The transition probabilities of all candidate are the same.
-            candi_token = [selected_uid]
-            candi_tokens = [copy.deepcopy(_tokens)]
-            candi_labels = [_label]
-            for c in random.sample(substitute_dict[selected_uid], min(_n_candi, len(substitute_dict[selected_uid]))): # 选出_n_candi数量的候选.
-                if c in _uid.keys():
-                    continue
-                if isUID(c): # 判断是否是变量名.
-                    candi_token.append(c)
-                    candi_tokens.append(copy.deepcopy(_tokens))
-                    candi_labels.append(_label)
-                    candi_tokens[-1] = get_example(candi_tokens[-1], selected_uid, c, "python")
-
-            new_example = []
-            for tmp_tokens in candi_tokens:
-                tmp_code = tmp_tokens
-                new_feature = convert_code_to_features(tmp_code, self.tokenizer_mlm, _label, self.args)
-                new_example.append(new_feature)
-            new_dataset = GraphCodeDataset(new_example, self.args)
-            prob, pred = self.classifier.get_results(new_dataset, self.args.eval_batch_size)
-
-            for i in range(len(candi_token)):   # Find a valid example
-                if pred[i] != _label: # 如果有样本攻击成功
-                    return {"status": "s", "alpha": 1, "tokens": candi_tokens[i],
-                            "old_uid": selected_uid, "new_uid": candi_token[i],
-                            "old_prob": prob[0], "new_prob": prob[i],
-                            "old_pred": pred[0], "new_pred": pred[i], "nb_changed_pos": _tokens.count(selected_uid)}
-
-            candi_idx = 0
-            min_prob = 1.0
-
-            for idx, a_prob in enumerate(prob[1:]):
-                if a_prob[_label] < min_prob:
-                    candi_idx = idx + 1
-                    min_prob = a_prob[_label]
-
-            # 找到Ground_truth对应的probability最小的那个mutant
-            # At last, compute acceptance rate.
-            alpha = (1-prob[candi_idx][_label]+1e-10) / (1-prob[0][_label]+1e-10)
-            # 计算这个id对应的alpha值.
-            if random.uniform(0, 1) > alpha or alpha < _prob_threshold:
-                return {"status": "r", "alpha": alpha, "tokens": candi_tokens[i],
-                        "old_uid": selected_uid, "new_uid": candi_token[i],
-                        "old_prob": prob[0], "new_prob": prob[i],
-                        "old_pred": pred[0], "new_pred": pred[i], "nb_changed_pos": _tokens.count(selected_uid)}
-            else:
-                return {"status": "a", "alpha": alpha, "tokens": candi_tokens[i],
-                        "old_uid": selected_uid, "new_uid": candi_token[i],
-                        "old_prob": prob[0], "new_prob": prob[i],
-                        "old_pred": pred[0], "new_pred": pred[i], "nb_changed_pos": _tokens.count(selected_uid)}
-        else:
-            pass
+            # 所有链的候选一起打分, 任意一条链攻击成功就停止
+            results = self.__replaceUID(chains, _label=_label,
+                                        _n_candi=_n_candi,
+                                        _prob_threshold=_prob_threshold, _random=True)
+            for k, (chain, res) in enumerate(zip(chains, results)):
+                self.__printRes(_iter=iteration, _res=res, _prefix="  >> " if len(chains) == 1 else "  >> chain %d," % k)
+                chain.update(res, iteration)
+            for chain in chains:
+                if chain.res['status'].lower() == 's':
+                    res = chain.res
+                    replace_info, nb_changed_pos = chain.replace_info()
+                    return {'succ': True, 'tokens': chain.code,
+                            'raw_tokens': chain.raw_tokens, "prog_length": prog_length, "new_pred": res["new_pred"], "is_success": 1, "old_uid": chain.old_uid, "score_info": res["old_prob"][0]-res["new_prob"][0], "nb_changed_var": len(chain.old_uids), "nb_changed_pos": nb_changed_pos, "replace_info": replace_info, "attack_type": "Ori_MHM"}
+        chain = chains[0]
+        res = chain.res
+        replace_info, nb_changed_pos = chain.replace_info()
+        return {'succ': False, 'tokens': res['tokens'], 'raw_tokens': None, "prog_length": prog_length, "new_pred": res["new_pred"], "is_success": -1, "old_uid": chain.old_uid, "score_info": res["old_prob"][0]-res["new_prob"][0], "nb_changed_var": len(chain.old_uids), "nb_changed_pos": nb_changed_pos, "replace_info": replace_info, "attack_type": "Ori_MHM"}
     
-    def __replaceUID_random(self, _tokens, _label=None, _uid={}, substitute_dict={},
-                     _n_candi=30, _prob_threshold=0.95, _candi_mode="random"):
-        
-        assert _candi_mode.lower() in ["random", "nearby"]
-        
+    def __proposeUID(self, chain, _label=None, _n_candi=30, _random=False):
+        '''
+        为一条链选择需要被替换的变量名并生成候选 (_random时从整个词表中采样), 返回候选和它们的feature.
+        '''
+        _tokens = chain.code
+        _uid = chain.uid
+        substitute_dict = chain.substitute_dict
         selected_uid = random.sample(substitute_dict.keys(), 1)[0] # 选择需要被替换的变量名
-        if _candi_mode == "random":
-            # First, generate candidate set.
-            # The transition probabilities of all candidate are the same.
-            candi_token = [selected_uid]
-            candi_tokens = [copy.deepcopy(_tokens)]
-            candi_labels = [_label]
-            for c in random.sample(self.idx2token, _n_candi): # 选出_n_candi数量的候选.
-                if c in _uid.keys():
-                    continue
-                if isUID(c): # 判断是否是变量名.
-                    candi_token.append(c)
-                    candi_tokens.append(copy.deepcopy(_tokens))
-                    candi_labels.append(_label)
-                    candi_tokens[-1] = get_example(candi_tokens[-1], selected_uid, c, "python")
-
-            new_example = []
-            for tmp_tokens in candi_tokens:
-                tmp_code = tmp_tokens
-                new_feature = convert_code_to_features(tmp_code, self.tokenizer_mlm, _label, self.args)
-                new_example.append(new_feature)
-            new_dataset = GraphCodeDataset(new_example, self.args)
-            prob, pred = self.classifier.get_results(new_dataset, self.args.eval_batch_size)
-
-            for i in range(len(candi_token)):   # Find a valid example
-                if pred[i] != _label: # 如果有样本攻击成功
-                    return {"status": "s", "alpha": 1, "tokens": candi_tokens[i],
-                            "old_uid": selected_uid, "new_uid": candi_token[i],
-                            "old_prob": prob[0], "new_prob": prob[i],
-                            "old_pred": pred[0], "new_pred": pred[i], "nb_changed_pos": _tokens.count(selected_uid)}
-
-            candi_idx = 0
-            min_prob = 1.0
-
-            for idx, a_prob in enumerate(prob[1:]):
-                if a_prob[_label] < min_prob:
-                    candi_idx = idx + 1
-                    min_prob = a_prob[_label]
-
-            # 找到Ground_truth对应的probability最小的那个mutant
-            # At last, compute acceptance rate.
-            alpha = (1-prob[candi_idx][_label]+1e-10) / (1-prob[0][_label]+1e-10)
-            # 计算这个id对应的alpha值.
-            if random.uniform(0, 1) > alpha or alpha < _prob_threshold:
-                return {"status": "r", "alpha": alpha, "tokens": candi_tokens[i],
-                        "old_uid": selected_uid, "new_uid": candi_token[i],
-                        "old_prob": prob[0], "new_prob": prob[i],
-                        "old_pred": pred[0], "new_pred": pred[i], "nb_changed_pos": _tokens.count(selected_uid)}
-            else:
-                return {"status": "a", "alpha": alpha, "tokens": candi_tokens[i],
-                        "old_uid": selected_uid, "new_uid": candi_token[i],
-                        "old_prob": prob[0], "new_prob": prob[i],
-                        "old_pred": pred[0], "new_pred": pred[i], "nb_changed_pos": _tokens.count(selected_uid)}
+        if _random:
+            candidates = random.sample(self.idx2token, _n_candi)
         else:
-            pass
+            candidates = random.sample(substitute_dict[selected_uid], min(_n_candi, len(substitute_dict[selected_uid])))
+        # First, generate candidate set.
+        # The transition probabilities of all candidate are the same.
+        candi_token = [selected_uid]
+        candi_tokens = [copy.deepcopy(_tokens)]
+        for c in candidates: # 选出_n_candi数量的候选.
+            if c in _uid.keys():
+                continue
+            if isUID(c): # 判断是否是变量名.
+                candi_token.append(c)
+                candi_tokens.append(copy.deepcopy(_tokens))
+                candi_tokens[-1] = get_example(candi_tokens[-1], selected_uid, c, "python", persist=False)
+        # 第一个是没有替换的代码, 其余的是把selected_uid换成candi_token[i]
+        new_example = [convert_code_to_features(candi_tokens[0], self.tokenizer_mlm, _label, self.args)]
+        for c in candi_token[1:]:
+            new_feature = convert_renamed_features(_tokens, {selected_uid: c}, self.tokenizer_mlm, _label, self.args, persist=False)
+            new_example.append(new_feature)
+        return (_tokens, selected_uid, candi_token, candi_tokens), new_example
+
+    def __replaceUID(self, chains, _label=None, _n_candi=30, _prob_threshold=0.95, _random=False):
+        '''
+        每条链各走一步: 所有链的候选在一次get_results中一起打分, 然后分别计算接受率.
+        '''
+        proposals = []
+        new_example = []
+        for chain in chains:
+            proposal, features = self.__proposeUID(chain, _label=_label, _n_candi=_n_candi, _random=_random)
+            proposals.append(proposal)
+            new_example.extend(features)
+        new_dataset = GraphCodeDataset(new_example, self.args)
+        prob, pred = self.classifier.get_results(new_dataset, self.args.eval_batch_size)
+        return mhm_accept(proposals, prob, pred, _label, _prob_threshold)
 
     def __printRes(self, _iter=None, _res=None, _prefix="  => "):
         if _res['status'].lower() == 's':   # Accepted & successful
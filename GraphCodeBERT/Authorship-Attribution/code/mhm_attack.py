@@ -12,10 +12,10 @@ import warnings
 import torch
 import numpy as np
 from model import Model
-from utils import set_seed
+from utils import set_seed, get_device
 from run import TextDataset
 from utils import GraphCodeDataset
-from utils import Recorder
+from utils import AttackScheduler, ConcurrentAttackRunner
 from run_parser import get_identifiers
 from transformers import RobertaForMaskedLM
 from transformers import (RobertaConfig, RobertaForSequenceClassification, RobertaTokenizer)
@@ -29,75 +29,16 @@ MODEL_CLASSES = {
     'roberta': (RobertaConfig, RobertaForSequenceClassification, RobertaTokenizer)
 }
 
-from utils import build_vocab
+from utils import load_vocab
             
-if __name__ == "__main__":
-    
+def run_attack(args, worker):
     import json
     import pickle
     import time
-    import os
-    
-    # import tree as Tree
-    # from dataset import Dataset, POJ104_SEQ
-    # from lstm_classifier import LSTMEncoder, LSTMClassifier
-    
-    parser = argparse.ArgumentParser()
 
-    ## Required parameters
-    parser.add_argument("--train_data_file", default=None, type=str, required=True,
-                        help="The input training data file (a text file).")
-    parser.add_argument("--output_dir", default=None, type=str, required=True,
-                        help="The output directory where the model predictions and checkpoints will be written.")
-
-    ## Other parameters
-    parser.add_argument("--eval_data_file", default=None, type=str,
-                        help="An optional input evaluation data file to evaluate the perplexity on (a text file).")
-    parser.add_argument("--test_data_file", default=None, type=str,
-                        help="An optional input evaluation data file to evaluate the perplexity on (a text file).")
-                    
-    parser.add_argument("--model_type", default="bert", type=str,
-                        help="The model architecture to be fine-tuned.")
-    parser.add_argument("--model_name_or_path", default=None, type=str,
-                        help="The model checkpoint for weights initialization.")
 
-    parser.add_argument("--base_model", default=None, type=str,
-                        help="Base Model")
-    parser.add_argument("--csv_store_path", default=None, type=str,
-                        help="Base Model")
 
-    parser.add_argument("--mlm", action='store_true',
-                        help="Train with masked-language modeling loss instead of language modeling.")
-    parser.add_argument("--mlm_probability", type=float, default=0.15,
-                        help="Ratio of tokens to mask for masked language modeling loss")
-    parser.add_argument("--number_labels", type=int,
-                        help="The number of labels.") 
-    parser.add_argument("--config_name", default="", type=str,
-                        help="Optional pretrained config name or path if not the same as model_name_or_path")
-    parser.add_argument("--tokenizer_name", default="", type=str,
-                        help="Optional pretrained tokenizer name or path if not the same as model_name_or_path")
-    parser.add_argument("--data_flow_length", default=64, type=int,
-                        help="Optional Data Flow input sequence length after tokenization.") 
-    parser.add_argument("--code_length", default=256, type=int,
-                        help="Optional Code input sequence length after tokenization.") 
-    parser.add_argument("--do_eval", action='store_true',
-                        help="Whether to run eval on the dev set.")
-    parser.add_argument("--do_test", action='store_true',
-                        help="Whether to run eval on the dev set.")
-    parser.add_argument("--original", action='store_true',
-                        help="Whether to MHM original.")  
-    parser.add_argument("--eval_batch_size", default=4, type=int,
-                        help="Batch size per GPU/CPU for evaluation.")
-    parser.add_argument('--seed', type=int, default=42,
-                        help="random seed for initialization")
-    parser.add_argument("--cache_dir", default="", type=str,
-                        help="Optional directory to store the pre-trained models downloaded from s3 (instread of the default one)")
-
-
-    args = parser.parse_args()
-
-
-    args.device = torch.device("cuda")
+    args.device = get_device(args.no_cuda, args.num_threads)
     # Set seed
     set_seed(args.seed)
 
@@ -141,12 +82,12 @@ if __name__ == "__main__":
 
     checkpoint_prefix = 'checkpoint-best-acc/model.bin'
     output_dir = os.path.join(args.output_dir, '{}'.format(checkpoint_prefix))  
-    model.load_state_dict(torch.load(output_dir))      
+    model.load_state_dict(torch.load(output_dir, map_location=args.device))
     model.to(args.device)
     print ("MODEL LOADED!")
     codebert_mlm = RobertaForMaskedLM.from_pretrained(args.base_model)
     tokenizer_mlm = RobertaTokenizer.from_pretrained(args.base_model)
-    codebert_mlm.to('cuda') 
+    codebert_mlm.to(args.device)
 
     ## Load Dataset
     eval_dataset = TextDataset(tokenizer, args,args.eval_data_file)
@@ -165,14 +106,12 @@ if __name__ == "__main__":
             substs.append(item["substitutes"])
     assert(len(source_codes) == len(eval_dataset) == len(substs))
 
-    code_tokens = []
-    for index, code in enumerate(source_codes):
-        code_tokens.append(get_identifiers(code, "python")[1])
-
-    id2token, token2id = build_vocab(code_tokens, 5000)
+    # 词表和codes的hash一起缓存在数据集旁边, 之后的运行不需要再parse所有的程序
+    id2token, token2id = load_vocab(codes_file_path, source_codes, "python", 5000)
 
-    recoder = Recorder(args.csv_store_path)
-    attacker = MHM_Attacker(args, model, codebert_mlm, tokenizer_mlm, token2id, id2token)
+    recoder = worker.recorder(args.csv_store_path)
+    runner = ConcurrentAttackRunner(model, args.nb_concurrent)
+    attacker = MHM_Attacker(args, runner.model, codebert_mlm, tokenizer_mlm, token2id, id2token)
     
     # token2id: dict,key是变量名, value是id
     # id2token: list,每个元素是变量名
@@ -181,23 +120,24 @@ if __name__ == "__main__":
     
     adv = {"tokens": [], "raw_tokens": [], "ori_raw": [],
            'ori_tokens': [], "label": [], }
-    n_succ = 0.0
-    total_cnt = 0
-    query_times = 0
-    all_start_time = time.time()
-    for index, example in enumerate(eval_dataset):
+    # --resume时从已有的csv恢复统计
+    n_succ = float(recoder.nb_success)
+    total_cnt = recoder.nb_total
+    model.query += recoder.query_times
+    all_start_time = time.time() - recoder.time_cost * 60
+
+    def attack_example(index, example):
         code = source_codes[index]
         subs = substs[index]
         
-        orig_prob, orig_label = model.get_results([example], args.eval_batch_size)
+        orig_prob, orig_label = runner.model.get_results([example], args.eval_batch_size)
         orig_prob = orig_prob[0]
         orig_label = orig_label[0]
         ground_truth = example[3].item()
 
         if orig_label != ground_truth:
-            continue
+            return None
         
-        start_time = time.time()
         
         # 这里需要进行修改.
         if args.original:
@@ -208,7 +148,12 @@ if __name__ == "__main__":
             _res = attacker.mcmc(tokenizer, code,
                              _label=ground_truth, _n_candi=30,
                              _max_iter=100, _prob_threshold=1, subs = subs)
-    
+        return code, orig_label, ground_truth, _res
+
+    for index, example, result, attack_queries, time_cost in runner.run(attack_example, worker, eval_dataset):
+        if result is None:
+            continue
+        code, orig_label, ground_truth, _res = result
         if _res['succ'] is None:
             continue
         if _res['succ'] == True:
@@ -219,12 +164,93 @@ if __name__ == "__main__":
         else:
             print ("EXAMPLE "+str(index)+" FAILED.")
         total_cnt += 1
-        print ("  time cost = %.2f min" % ((time.time()-start_time)/60))
-        time_cost = (time.time()-start_time)/60
+        print ("  time cost = %.2f min" % time_cost)
         print ("  ALL EXAMPLE time cost = %.2f min" % ((time.time()-all_start_time)/60))
         print ("  curr succ rate = "+str(n_succ/total_cnt))
         
-        print("Query times in this attack: ", model.query - query_times)
+        print("Query times in this attack: ", attack_queries)
         print("All Query times: ", model.query)
-        recoder.writemhm(index, code, _res["prog_length"], " ".join(_res['tokens']), ground_truth, orig_label, _res["new_pred"], _res["is_success"], _res["old_uid"], _res["score_info"], _res["nb_changed_var"], _res["nb_changed_pos"], _res["replace_info"], _res["attack_type"], model.query - query_times, time_cost)
-        query_times = model.query
\ No newline at end of file
+        print("Query cache hits/misses: ", model.engine.cache.hits, model.engine.cache.misses)
+        recoder.writemhm(index, code, _res["prog_length"], " ".join(_res['tokens']), ground_truth, orig_label, _res["new_pred"], _res["is_success"], _res["old_uid"], _res["score_info"], _res["nb_changed_var"], _res["nb_changed_pos"], _res["replace_info"], _res["attack_type"], attack_queries, time_cost)
+
+
+if __name__ == "__main__":
+    
+    import json
+    import pickle
+    import time
+    import os
+    
+    # import tree as Tree
+    # from dataset import Dataset, POJ104_SEQ
+    # from lstm_classifier import LSTMEncoder, LSTMClassifier
+    
+    parser = argparse.ArgumentParser()
+
+    ## Required parameters
+    parser.add_argument("--train_data_file", default=None, type=str, required=True,
+                        help="The input training data file (a text file).")
+    parser.add_argument("--output_dir", default=None, type=str, required=True,
+                        help="The output directory where the model predictions and checkpoints will be written.")
+
+    ## Other parameters
+    parser.add_argument("--eval_data_file", default=None, type=str,
+                        help="An optional input evaluation data file to evaluate the perplexity on (a text file).")
+    parser.add_argument("--test_data_file", default=None, type=str,
+                        help="An optional input evaluation data file to evaluate the perplexity on (a text file).")
+                    
+    parser.add_argument("--model_type", default="bert", type=str,
+                        help="The model architecture to be fine-tuned.")
+    parser.add_argument("--model_name_or_path", default=None, type=str,
+                        help="The model checkpoint for weights initialization.")
+
+    parser.add_argument("--base_model", default=None, type=str,
+                        help="Base Model")
+    parser.add_argument("--csv_store_path", default=None, type=str,
+                        help="Base Model")
+
+    parser.add_argument("--mlm", action='store_true',
+                        help="Train with masked-language modeling loss instead of language modeling.")
+    parser.add_argument("--mlm_probability", type=float, default=0.15,
+                        help="Ratio of tokens to mask for masked language modeling loss")
+    parser.add_argument("--number_labels", type=int,
+                        help="The number of labels.") 
+    parser.add_argument("--config_name", default="", type=str,
+                        help="Optional pretrained config name or path if not the same as model_name_or_path")
+    parser.add_argument("--tokenizer_name", default="", type=str,
+                        help="Optional pretrained tokenizer name or path if not the same as model_name_or_path")
+    parser.add_argument("--data_flow_length", default=64, type=int,
+                        help="Optional Data Flow input sequence length after tokenization.") 
+    parser.add_argument("--code_length", default=256, type=int,
+                        help="Optional Code input sequence length after tokenization.") 
+    parser.add_argument("--do_eval", action='store_true',
+                        help="Whether to run eval on the dev set.")
+    parser.add_argument("--do_test", action='store_true',
+                        help="Whether to run eval on the dev set.")
+    parser.add_argument("--original", action='store_true',
+                        help="Whether to MHM original.")  
+    parser.add_argument("--eval_batch_size", default=4, type=int,
+                        help="Batch size per GPU/CPU for evaluation.")
+    parser.add_argument("--no_cuda", action='store_true',
+                        help="Avoid using CUDA when available")
+    parser.add_argument("--num_threads", default=0, type=int,
+                        help="Number of CPU threads for inference when running without CUDA (0 = torch default).")
+    parser.add_argument("--query_cache_size", default=100000, type=int,
+                        help="Max number of cached victim model outputs (0 disables the query cache).")
+    parser.add_argument("--nb_workers", default=1, type=int,
+                        help="Number of worker processes attacking examples in parallel.")
+    parser.add_argument("--nb_concurrent", default=1, type=int,
+                        help="Number of examples attacked concurrently in each process; their model queries are pooled into shared batches.")
+    parser.add_argument("--mhm_chains", default=1, type=int,
+                        help="Number of independent MHM chains per example; the candidates of all chains are scored in one batch each step.")
+    parser.add_argument("--resume", action='store_true',
+                        help="Continue an interrupted run: keep the rows already in csv_store_path and skip their examples.")
+    parser.add_argument('--seed', type=int, default=42,
+                        help="random seed for initialization")
+    parser.add_argument("--cache_dir", default="", type=str,
+                        help="Optional directory to store the pre-trained models downloaded from s3 (instread of the default one)")
+
+
+    args = parser.parse_args()
+
+    AttackScheduler(args.nb_workers).run(run_attack, args)
@@ -1,14 +1,18 @@
 # Copyright (c) Microsoft Corporation. 
 # Licensed under the MIT license.
+import sys
+sys.path.append('../../../')
+sys.path.append('../../../python_parser')
+
 import torch
 import torch.nn as nn
 import torch
 from torch.autograd import Variable
 import copy
 import numpy as np
+from utils import InferenceEngine
 import torch.nn.functional as F
 from torch.nn import CrossEntropyLoss, MSELoss
-from torch.utils.data import SequentialSampler, DataLoader
 
 class RobertaClassificationHead(nn.Module):
     """Head for sentence-level classification tasks."""
@@ -38,6 +42,7 @@ class Model(nn.Module):
         self.classifier=RobertaClassificationHead(config)
         self.args=args
         self.query = 0
+        self.engine = InferenceEngine(args.device, getattr(args, 'query_cache_size', 0))
     
         
     def forward(self, inputs_ids=None, attn_mask=None, position_idx=None, labels=None): 
@@ -62,28 +67,25 @@ class Model(nn.Module):
             return loss,prob
         else:
             return prob
-      
+
+    def feature_length(self, item):
+        # code tokens + dfg nodes, 之后全是pad
+        return int(item[2].ne(self.tokenizer.pad_token_id).sum())
+
+    def trim_features(self, features):
+        '''
+        features: [inputs_ids, attn_mask, position_idx, labels]. 只pad到batch里最长的那个样本
+        '''
+        inputs_ids, attn_mask, position_idx = features[:3]
+        length = int(position_idx.ne(self.tokenizer.pad_token_id).sum(-1).max())
+        return [inputs_ids[:, :length], attn_mask[:, :length, :length], position_idx[:, :length]] + features[3:]
+
     def get_results(self, dataset, batch_size):
         '''Given a dataset, return probabilities and labels.'''
-        self.query += len(dataset)
-        eval_sampler = SequentialSampler(dataset)
-        eval_dataloader = DataLoader(dataset, sampler=eval_sampler, batch_size=batch_size,num_workers=4,pin_memory=False)
-
         self.eval()
-        logits=[] 
-        labels=[]
-        for batch in eval_dataloader:
-            inputs_ids = batch[0].to("cuda")       
-            attn_mask = batch[1].to("cuda") 
-            position_idx = batch[2].to("cuda") 
-            label=batch[3].to("cuda")  
-            with torch.no_grad():
-                lm_loss,logit = self.forward(inputs_ids, attn_mask, position_idx, label)
-                logits.append(logit.cpu().numpy())
-                labels.append(label.cpu().numpy())
-                
-        logits=np.concatenate(logits,0)
-        labels=np.concatenate(labels,0)
+        logits, nb_queries = self.engine.predict(self, dataset, batch_size)
+        # inputs served from the query cache are not counted as queries
+        self.query += nb_queries
 
         probs = logits
         pred_labels = []
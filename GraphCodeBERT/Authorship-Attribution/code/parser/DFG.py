@@ -5,28 +5,29 @@ from tree_sitter import Language, Parser
 from .utils import (remove_comments_and_docstrings,
                    tree_to_token_index,
                    index_to_code_token,
-                   tree_to_variable_index)
+                   tree_to_variable_index,
+                   walk_dfg)
 
 
-def DFG_python(root_node,index_to_code,states):
+def _DFG_python_leaf(root_node,index_to_code,states):
+    idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
+    if root_node.type==code:
+        return [],states
+    elif code in states:
+        return [(code,idx,'comesFrom',[code],states[code].copy())],states
+    else:
+        if root_node.type=='identifier':
+            states={**states,code:[idx]}
+        return [(code,idx,'comesFrom',[],[])],states
+
+def _DFG_python(root_node,index_to_code,states):
     assignment=['assignment','augmented_assignment','for_in_clause']
     if_statement=['if_statement']
     for_statement=['for_statement']
     while_statement=['while_statement']
     do_first_statement=['for_in_clause'] 
     def_statement=['default_parameter']
-    states=states.copy() 
-    if (len(root_node.children)==0 or root_node.type=='string') and root_node.type!='comment':        
-        idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
-        if root_node.type==code:
-            return [],states
-        elif code in states:
-            return [(code,idx,'comesFrom',[code],states[code].copy())],states
-        else:
-            if root_node.type=='identifier':
-                states[code]=[idx]
-            return [(code,idx,'comesFrom',[],[])],states
-    elif root_node.type in def_statement:
+    if root_node.type in def_statement:
         name=root_node.child_by_field_name('name')
         value=root_node.child_by_field_name('value')
         DFG=[]
@@ -35,20 +36,20 @@ def DFG_python(root_node,index_to_code,states):
             for index in indexs:
                 idx,code=index_to_code[index]
                 DFG.append((code,idx,'comesFrom',[],[]))
-                states[code]=[idx]
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code:[idx]}
+            return DFG,states
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_python(value,index_to_code,states)
+            temp,states=(yield value,states)
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
                 for index2 in value_indexs:
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'comesFrom',[code2],[idx2]))
-                states[code1]=[idx1]   
-            return sorted(DFG,key=lambda x:x[1]),states        
+                states={**states,code1:[idx1]}
+            return DFG,states        
     elif root_node.type in assignment:
         if root_node.type=='for_in_clause':
             right_nodes=[root_node.children[-1]]
@@ -67,7 +68,7 @@ def DFG_python(root_node,index_to_code,states):
                 right_nodes=[root_node.child_by_field_name('right')]
         DFG=[]
         for node in right_nodes:
-            temp,states=DFG_python(node,index_to_code,states)
+            temp,states=(yield node,states)
             DFG+=temp
             
         for left_node,right_node in zip(left_nodes,right_nodes):
@@ -78,9 +79,9 @@ def DFG_python(root_node,index_to_code,states):
                 idx1,code1=index_to_code[token1_index]
                 temp.append((code1,idx1,'computedFrom',[index_to_code[x][1] for x in right_tokens_index],
                              [index_to_code[x][0] for x in right_tokens_index]))
-                states[code1]=[idx1]
+                states={**states,code1:[idx1]}
             DFG+=temp        
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in if_statement:
         DFG=[]
         current_states=states.copy()
@@ -92,10 +93,10 @@ def DFG_python(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in ['elif_clause','else_clause']:
-                temp,current_states=DFG_python(child,index_to_code,current_states)
+                temp,current_states=(yield child,current_states)
                 DFG+=temp
             else:
-                temp,new_states=DFG_python(child,index_to_code,states)
+                temp,new_states=(yield child,states)
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
@@ -110,7 +111,7 @@ def DFG_python(root_node,index_to_code,states):
                     new_states[key]+=dic[key]
         for key in new_states:
             new_states[key]=sorted(list(set(new_states[key])))
-        return sorted(DFG,key=lambda x:x[1]),new_states
+        return DFG,new_states
     elif root_node.type in for_statement:
         DFG=[]
         for i in range(2):
@@ -124,7 +125,7 @@ def DFG_python(root_node,index_to_code,states):
             if len(right_nodes)==0:
                 right_nodes=[root_node.child_by_field_name('right')]
             for node in right_nodes:
-                temp,states=DFG_python(node,index_to_code,states)
+                temp,states=(yield node,states)
                 DFG+=temp
             for left_node,right_node in zip(left_nodes,right_nodes):
                 left_tokens_index=tree_to_variable_index(left_node,index_to_code)
@@ -134,10 +135,10 @@ def DFG_python(root_node,index_to_code,states):
                     idx1,code1=index_to_code[token1_index]
                     temp.append((code1,idx1,'computedFrom',[index_to_code[x][1] for x in right_tokens_index],
                                  [index_to_code[x][0] for x in right_tokens_index]))
-                    states[code1]=[idx1]
+                    states={**states,code1:[idx1]}
                 DFG+=temp   
             if  root_node.children[-1].type=="block":
-                temp,states=DFG_python(root_node.children[-1],index_to_code,states)
+                temp,states=(yield root_node.children[-1],states)
                 DFG+=temp 
         dic={}
         for x in DFG:
@@ -147,12 +148,12 @@ def DFG_python(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in while_statement:  
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_python(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -162,22 +163,35 @@ def DFG_python(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states        
+        return DFG,states        
     else:
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_python(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_python(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         
-        return sorted(DFG,key=lambda x:x[1]),states
-        
+        return DFG,states
 
-def DFG_java(root_node,index_to_code,states):
+def DFG_python(root_node,index_to_code,states):
+    return walk_dfg(_DFG_python,_DFG_python_leaf,root_node,index_to_code,states)
+
+def _DFG_java_leaf(root_node,index_to_code,states):
+    idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
+    if root_node.type==code:
+        return [],states
+    elif code in states:
+        return [(code,idx,'comesFrom',[code],states[code].copy())],states
+    else:
+        if root_node.type=='identifier':
+            states={**states,code:[idx]}
+        return [(code,idx,'comesFrom',[],[])],states
+
+def _DFG_java(root_node,index_to_code,states):
     assignment=['assignment_expression']
     def_statement=['variable_declarator']
     increment_statement=['update_expression']
@@ -186,18 +200,7 @@ def DFG_java(root_node,index_to_code,states):
     enhanced_for_statement=['enhanced_for_statement']
     while_statement=['while_statement']
     do_first_statement=[]    
-    states=states.copy()
-    if (len(root_node.children)==0 or root_node.type=='string') and root_node.type!='comment':
-        idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
-        if root_node.type==code:
-            return [],states
-        elif code in states:
-            return [(code,idx,'comesFrom',[code],states[code].copy())],states
-        else:
-            if root_node.type=='identifier':
-                states[code]=[idx]
-            return [(code,idx,'comesFrom',[],[])],states
-    elif root_node.type in def_statement:
+    if root_node.type in def_statement:
         name=root_node.child_by_field_name('name')
         value=root_node.child_by_field_name('value')
         DFG=[]
@@ -206,25 +209,25 @@ def DFG_java(root_node,index_to_code,states):
             for index in indexs:
                 idx,code=index_to_code[index]
                 DFG.append((code,idx,'comesFrom',[],[]))
-                states[code]=[idx]
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code:[idx]}
+            return DFG,states
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_java(value,index_to_code,states)
+            temp,states=(yield value,states)
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
                 for index2 in value_indexs:
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'comesFrom',[code2],[idx2]))
-                states[code1]=[idx1]   
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code1:[idx1]}
+            return DFG,states
     elif root_node.type in assignment:
         left_nodes=root_node.child_by_field_name('left')
         right_nodes=root_node.child_by_field_name('right')
         DFG=[]
-        temp,states=DFG_java(right_nodes,index_to_code,states)
+        temp,states=(yield right_nodes,states)
         DFG+=temp            
         name_indexs=tree_to_variable_index(left_nodes,index_to_code)
         value_indexs=tree_to_variable_index(right_nodes,index_to_code)        
@@ -233,8 +236,8 @@ def DFG_java(root_node,index_to_code,states):
             for index2 in value_indexs:
                 idx2,code2=index_to_code[index2]
                 DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-            states[code1]=[idx1]   
-        return sorted(DFG,key=lambda x:x[1]),states
+            states={**states,code1:[idx1]}
+        return DFG,states
     elif root_node.type in increment_statement:
         DFG=[]
         indexs=tree_to_variable_index(root_node,index_to_code)
@@ -243,8 +246,8 @@ def DFG_java(root_node,index_to_code,states):
             for index2 in indexs:
                 idx2,code2=index_to_code[index2]
                 DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-            states[code1]=[idx1]
-        return sorted(DFG,key=lambda x:x[1]),states   
+            states={**states,code1:[idx1]}
+        return DFG,states   
     elif root_node.type in if_statement:
         DFG=[]
         current_states=states.copy()
@@ -257,11 +260,11 @@ def DFG_java(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement and flag is False:
-                temp,current_states=DFG_java(child,index_to_code,current_states)
+                temp,current_states=(yield child,current_states)
                 DFG+=temp
             else:
                 flag=True
-                temp,new_states=DFG_java(child,index_to_code,states)
+                temp,new_states=(yield child,states)
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
@@ -276,16 +279,16 @@ def DFG_java(root_node,index_to_code,states):
                     new_states[key]+=dic[key]
         for key in new_states:
             new_states[key]=sorted(list(set(new_states[key])))
-        return sorted(DFG,key=lambda x:x[1]),new_states
+        return DFG,new_states
     elif root_node.type in for_statement:
         DFG=[]
         for child in root_node.children:
-            temp,states=DFG_java(child,index_to_code,states)
+            temp,states=(yield child,states)
             DFG+=temp
         flag=False
         for child in root_node.children:
             if flag:
-                temp,states=DFG_java(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp                
             elif child.type=="local_variable_declaration":
                 flag=True
@@ -297,14 +300,14 @@ def DFG_java(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in enhanced_for_statement:
         name=root_node.child_by_field_name('name')
         value=root_node.child_by_field_name('value')
         body=root_node.child_by_field_name('body')
         DFG=[]
         for i in range(2):
-            temp,states=DFG_java(value,index_to_code,states)
+            temp,states=(yield value,states)
             DFG+=temp       
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)        
@@ -313,8 +316,8 @@ def DFG_java(root_node,index_to_code,states):
                 for index2 in value_indexs:
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-                states[code1]=[idx1]   
-            temp,states=DFG_java(body,index_to_code,states)
+                states={**states,code1:[idx1]}
+            temp,states=(yield body,states)
             DFG+=temp                       
         dic={}
         for x in DFG:
@@ -324,12 +327,12 @@ def DFG_java(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in while_statement:  
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_java(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -339,21 +342,35 @@ def DFG_java(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states        
+        return DFG,states        
     else:
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_java(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_java(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
 
-def DFG_csharp(root_node,index_to_code,states):
+def DFG_java(root_node,index_to_code,states):
+    return walk_dfg(_DFG_java,_DFG_java_leaf,root_node,index_to_code,states)
+
+def _DFG_csharp_leaf(root_node,index_to_code,states):
+    idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
+    if root_node.type==code:
+        return [],states
+    elif code in states:
+        return [(code,idx,'comesFrom',[code],states[code].copy())],states
+    else:
+        if root_node.type=='identifier':
+            states={**states,code:[idx]}
+        return [(code,idx,'comesFrom',[],[])],states
+
+def _DFG_csharp(root_node,index_to_code,states):
     assignment=['assignment_expression']
     def_statement=['variable_declarator']
     increment_statement=['postfix_unary_expression']
@@ -362,18 +379,7 @@ def DFG_csharp(root_node,index_to_code,states):
     enhanced_for_statement=['for_each_statement']
     while_statement=['while_statement']
     do_first_statement=[]    
-    states=states.copy()
-    if (len(root_node.children)==0 or root_node.type=='string') and root_node.type!='comment':
-        idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
-        if root_node.type==code:
-            return [],states
-        elif code in states:
-            return [(code,idx,'comesFrom',[code],states[code].copy())],states
-        else:
-            if root_node.type=='identifier':
-                states[code]=[idx]
-            return [(code,idx,'comesFrom',[],[])],states
-    elif root_node.type in def_statement:
+    if root_node.type in def_statement:
         if len(root_node.children)==2:
             name=root_node.children[0]
             value=root_node.children[1]
@@ -386,25 +392,25 @@ def DFG_csharp(root_node,index_to_code,states):
             for index in indexs:
                 idx,code=index_to_code[index]
                 DFG.append((code,idx,'comesFrom',[],[]))
-                states[code]=[idx]
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code:[idx]}
+            return DFG,states
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_csharp(value,index_to_code,states)
+            temp,states=(yield value,states)
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
                 for index2 in value_indexs:
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'comesFrom',[code2],[idx2]))
-                states[code1]=[idx1]   
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code1:[idx1]}
+            return DFG,states
     elif root_node.type in assignment:
         left_nodes=root_node.child_by_field_name('left')
         right_nodes=root_node.child_by_field_name('right')
         DFG=[]
-        temp,states=DFG_csharp(right_nodes,index_to_code,states)
+        temp,states=(yield right_nodes,states)
         DFG+=temp            
         name_indexs=tree_to_variable_index(left_nodes,index_to_code)
         value_indexs=tree_to_variable_index(right_nodes,index_to_code)        
@@ -413,8 +419,8 @@ def DFG_csharp(root_node,index_to_code,states):
             for index2 in value_indexs:
                 idx2,code2=index_to_code[index2]
                 DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-            states[code1]=[idx1]   
-        return sorted(DFG,key=lambda x:x[1]),states
+            states={**states,code1:[idx1]}
+        return DFG,states
     elif root_node.type in increment_statement:
         DFG=[]
         indexs=tree_to_variable_index(root_node,index_to_code)
@@ -423,8 +429,8 @@ def DFG_csharp(root_node,index_to_code,states):
             for index2 in indexs:
                 idx2,code2=index_to_code[index2]
                 DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-            states[code1]=[idx1]
-        return sorted(DFG,key=lambda x:x[1]),states   
+            states={**states,code1:[idx1]}
+        return DFG,states   
     elif root_node.type in if_statement:
         DFG=[]
         current_states=states.copy()
@@ -437,11 +443,11 @@ def DFG_csharp(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement and flag is False:
-                temp,current_states=DFG_csharp(child,index_to_code,current_states)
+                temp,current_states=(yield child,current_states)
                 DFG+=temp
             else:
                 flag=True
-                temp,new_states=DFG_csharp(child,index_to_code,states)
+                temp,new_states=(yield child,states)
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
@@ -456,16 +462,16 @@ def DFG_csharp(root_node,index_to_code,states):
                     new_states[key]+=dic[key]
         for key in new_states:
             new_states[key]=sorted(list(set(new_states[key])))
-        return sorted(DFG,key=lambda x:x[1]),new_states
+        return DFG,new_states
     elif root_node.type in for_statement:
         DFG=[]
         for child in root_node.children:
-            temp,states=DFG_csharp(child,index_to_code,states)
+            temp,states=(yield child,states)
             DFG+=temp
         flag=False
         for child in root_node.children:
             if flag:
-                temp,states=DFG_csharp(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp                
             elif child.type=="local_variable_declaration":
                 flag=True
@@ -477,14 +483,14 @@ def DFG_csharp(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in enhanced_for_statement:
         name=root_node.child_by_field_name('left')
         value=root_node.child_by_field_name('right')
         body=root_node.child_by_field_name('body')
         DFG=[]
         for i in range(2):
-            temp,states=DFG_csharp(value,index_to_code,states)
+            temp,states=(yield value,states)
             DFG+=temp       
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)        
@@ -493,8 +499,8 @@ def DFG_csharp(root_node,index_to_code,states):
                 for index2 in value_indexs:
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-                states[code1]=[idx1]   
-            temp,states=DFG_csharp(body,index_to_code,states)
+                states={**states,code1:[idx1]}
+            temp,states=(yield body,states)
             DFG+=temp                       
         dic={}
         for x in DFG:
@@ -504,12 +510,12 @@ def DFG_csharp(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in while_statement:  
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_csharp(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -519,42 +525,43 @@ def DFG_csharp(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states        
+        return DFG,states        
     else:
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_csharp(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_csharp(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
 
+def DFG_csharp(root_node,index_to_code,states):
+    return walk_dfg(_DFG_csharp,_DFG_csharp_leaf,root_node,index_to_code,states)
 
-    
-    
-def DFG_ruby(root_node,index_to_code,states):
+def _DFG_ruby_leaf(root_node,index_to_code,states):
+    states=states.copy()
+    idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
+    if root_node.type==code:
+        return [],states
+    elif code in states:
+        return [(code,idx,'comesFrom',[code],states[code].copy())],states
+    else:
+        if root_node.type=='identifier':
+            states[code]=[idx]
+        return [(code,idx,'comesFrom',[],[])],states
+
+def _DFG_ruby(root_node,index_to_code,states):
     assignment=['assignment','operator_assignment']
     if_statement=['if','elsif','else','unless','when']
     for_statement=['for']
     while_statement=['while_modifier','until']
     do_first_statement=[] 
     def_statement=['keyword_parameter']
-    if (len(root_node.children)==0 or root_node.type=='string') and root_node.type!='comment':
-        states=states.copy()
-        idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
-        if root_node.type==code:
-            return [],states
-        elif code in states:
-            return [(code,idx,'comesFrom',[code],states[code].copy())],states
-        else:
-            if root_node.type=='identifier':
-                states[code]=[idx]
-            return [(code,idx,'comesFrom',[],[])],states
-    elif root_node.type in def_statement:
+    if root_node.type in def_statement:
         name=root_node.child_by_field_name('name')
         value=root_node.child_by_field_name('value')
         DFG=[]
@@ -564,11 +571,11 @@ def DFG_ruby(root_node,index_to_code,states):
                 idx,code=index_to_code[index]
                 DFG.append((code,idx,'comesFrom',[],[]))
                 states[code]=[idx]
-            return sorted(DFG,key=lambda x:x[1]),states
+            return DFG,states
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_ruby(value,index_to_code,states)
+            temp,states=(yield value,states)
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
@@ -576,7 +583,7 @@ def DFG_ruby(root_node,index_to_code,states):
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'comesFrom',[code2],[idx2]))
                 states[code1]=[idx1]   
-            return sorted(DFG,key=lambda x:x[1]),states        
+            return DFG,states        
     elif root_node.type in assignment:
         left_nodes=[x for x in root_node.child_by_field_name('left').children if x.type!=',']
         right_nodes=[x for x in root_node.child_by_field_name('right').children if x.type!=',']
@@ -593,7 +600,7 @@ def DFG_ruby(root_node,index_to_code,states):
 
         DFG=[]
         for node in right_nodes:
-            temp,states=DFG_ruby(node,index_to_code,states)
+            temp,states=(yield node,states)
             DFG+=temp
             
         for left_node,right_node in zip(left_nodes,right_nodes):
@@ -606,7 +613,7 @@ def DFG_ruby(root_node,index_to_code,states):
                              [index_to_code[x][0] for x in right_tokens_index]))
                 states[code1]=[idx1]
             DFG+=temp        
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in if_statement:
         DFG=[]
         current_states=states.copy()
@@ -618,10 +625,10 @@ def DFG_ruby(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement:
-                temp,current_states=DFG_ruby(child,index_to_code,current_states)
+                temp,current_states=(yield child,current_states)
                 DFG+=temp
             else:
-                temp,new_states=DFG_ruby(child,index_to_code,states)
+                temp,new_states=(yield child,states)
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
@@ -636,7 +643,7 @@ def DFG_ruby(root_node,index_to_code,states):
                     new_states[key]+=dic[key]
         for key in new_states:
             new_states[key]=sorted(list(set(new_states[key])))
-        return sorted(DFG,key=lambda x:x[1]),new_states
+        return DFG,new_states
     elif root_node.type in for_statement:
         DFG=[]
         for i in range(2):
@@ -644,7 +651,7 @@ def DFG_ruby(root_node,index_to_code,states):
             right_nodes=[root_node.child_by_field_name('value')]
             assert len(right_nodes)==len(left_nodes)
             for node in right_nodes:
-                temp,states=DFG_ruby(node,index_to_code,states)
+                temp,states=(yield node,states)
                 DFG+=temp
             for left_node,right_node in zip(left_nodes,right_nodes):
                 left_tokens_index=tree_to_variable_index(left_node,index_to_code)
@@ -656,7 +663,7 @@ def DFG_ruby(root_node,index_to_code,states):
                                  [index_to_code[x][0] for x in right_tokens_index]))
                     states[code1]=[idx1]
                 DFG+=temp 
-            temp,states=DFG_ruby(root_node.child_by_field_name('body'),index_to_code,states)
+            temp,states=(yield root_node.child_by_field_name('body'),states)
             DFG+=temp 
         dic={}
         for x in DFG:
@@ -666,12 +673,12 @@ def DFG_ruby(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in while_statement:  
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_ruby(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -681,21 +688,35 @@ def DFG_ruby(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states        
+        return DFG,states        
     else:
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_ruby(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_ruby(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
 
-def DFG_go(root_node,index_to_code,states):
+def DFG_ruby(root_node,index_to_code,states):
+    return walk_dfg(_DFG_ruby,_DFG_ruby_leaf,root_node,index_to_code,states)
+
+def _DFG_go_leaf(root_node,index_to_code,states):
+    idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
+    if root_node.type==code:
+        return [],states
+    elif code in states:
+        return [(code,idx,'comesFrom',[code],states[code].copy())],states
+    else:
+        if root_node.type=='identifier':
+            states={**states,code:[idx]}
+        return [(code,idx,'comesFrom',[],[])],states
+
+def _DFG_go(root_node,index_to_code,states):
     assignment=['assignment_statement',]
     def_statement=['var_spec']
     increment_statement=['inc_statement']
@@ -704,18 +725,7 @@ def DFG_go(root_node,index_to_code,states):
     enhanced_for_statement=[]
     while_statement=[]
     do_first_statement=[]    
-    states=states.copy()
-    if (len(root_node.children)==0 or root_node.type=='string') and root_node.type!='comment':
-        idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
-        if root_node.type==code:
-            return [],states
-        elif code in states:
-            return [(code,idx,'comesFrom',[code],states[code].copy())],states
-        else:
-            if root_node.type=='identifier':
-                states[code]=[idx]
-            return [(code,idx,'comesFrom',[],[])],states
-    elif root_node.type in def_statement:
+    if root_node.type in def_statement:
         name=root_node.child_by_field_name('name')
         value=root_node.child_by_field_name('value')
         DFG=[]
@@ -724,25 +734,25 @@ def DFG_go(root_node,index_to_code,states):
             for index in indexs:
                 idx,code=index_to_code[index]
                 DFG.append((code,idx,'comesFrom',[],[]))
-                states[code]=[idx]
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code:[idx]}
+            return DFG,states
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_go(value,index_to_code,states)
+            temp,states=(yield value,states)
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
                 for index2 in value_indexs:
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'comesFrom',[code2],[idx2]))
-                states[code1]=[idx1]   
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code1:[idx1]}
+            return DFG,states
     elif root_node.type in assignment:
         left_nodes=root_node.child_by_field_name('left')
         right_nodes=root_node.child_by_field_name('right')
         DFG=[]
-        temp,states=DFG_go(right_nodes,index_to_code,states)
+        temp,states=(yield right_nodes,states)
         DFG+=temp            
         name_indexs=tree_to_variable_index(left_nodes,index_to_code)
         value_indexs=tree_to_variable_index(right_nodes,index_to_code)        
@@ -751,8 +761,8 @@ def DFG_go(root_node,index_to_code,states):
             for index2 in value_indexs:
                 idx2,code2=index_to_code[index2]
                 DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-            states[code1]=[idx1]   
-        return sorted(DFG,key=lambda x:x[1]),states
+            states={**states,code1:[idx1]}
+        return DFG,states
     elif root_node.type in increment_statement:
         DFG=[]
         indexs=tree_to_variable_index(root_node,index_to_code)
@@ -761,8 +771,8 @@ def DFG_go(root_node,index_to_code,states):
             for index2 in indexs:
                 idx2,code2=index_to_code[index2]
                 DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-            states[code1]=[idx1]
-        return sorted(DFG,key=lambda x:x[1]),states   
+            states={**states,code1:[idx1]}
+        return DFG,states   
     elif root_node.type in if_statement:
         DFG=[]
         current_states=states.copy()
@@ -775,11 +785,11 @@ def DFG_go(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement and flag is False:
-                temp,current_states=DFG_go(child,index_to_code,current_states)
+                temp,current_states=(yield child,current_states)
                 DFG+=temp
             else:
                 flag=True
-                temp,new_states=DFG_go(child,index_to_code,states)
+                temp,new_states=(yield child,states)
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
@@ -799,20 +809,20 @@ def DFG_go(root_node,index_to_code,states):
                 new_states[key]+=states[key]
         for key in new_states:
             new_states[key]=sorted(list(set(new_states[key])))
-        return sorted(DFG,key=lambda x:x[1]),new_states
+        return DFG,new_states
     elif root_node.type in for_statement:
         DFG=[]
         for child in root_node.children:
-            temp,states=DFG_go(child,index_to_code,states)
+            temp,states=(yield child,states)
             DFG+=temp
         flag=False
         for child in root_node.children:
             if flag:
-                temp,states=DFG_go(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp                
             elif child.type=="for_clause":
                 if child.child_by_field_name('update') is not None:
-                    temp,states=DFG_go(child.child_by_field_name('update'),index_to_code,states)
+                    temp,states=(yield child.child_by_field_name('update'),states)
                     DFG+=temp                 
                 flag=True
         dic={}
@@ -823,24 +833,35 @@ def DFG_go(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     else:
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_go(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_go(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
 
-    
-    
+def DFG_go(root_node,index_to_code,states):
+    return walk_dfg(_DFG_go,_DFG_go_leaf,root_node,index_to_code,states)
 
-def DFG_php(root_node,index_to_code,states):
+def _DFG_php_leaf(root_node,index_to_code,states):
+    idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
+    if root_node.type==code:
+        return [],states
+    elif code in states:
+        return [(code,idx,'comesFrom',[code],states[code].copy())],states
+    else:
+        if root_node.type=='identifier':
+            states={**states,code:[idx]}
+        return [(code,idx,'comesFrom',[],[])],states
+
+def _DFG_php(root_node,index_to_code,states):
     assignment=['assignment_expression','augmented_assignment_expression']
     def_statement=['simple_parameter']
     increment_statement=['update_expression']
@@ -849,18 +870,7 @@ def DFG_php(root_node,index_to_code,states):
     enhanced_for_statement=['foreach_statement']
     while_statement=['while_statement']
     do_first_statement=[]    
-    states=states.copy()
-    if (len(root_node.children)==0 or root_node.type=='string') and root_node.type!='comment':
-        idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
-        if root_node.type==code:
-            return [],states
-        elif code in states:
-            return [(code,idx,'comesFrom',[code],states[code].copy())],states
-        else:
-            if root_node.type=='identifier':
-                states[code]=[idx]
-            return [(code,idx,'comesFrom',[],[])],states
-    elif root_node.type in def_statement:
+    if root_node.type in def_statement:
         name=root_node.child_by_field_name('name')
         value=root_node.child_by_field_name('default_value')
         DFG=[]
@@ -869,25 +879,25 @@ def DFG_php(root_node,index_to_code,states):
             for index in indexs:
                 idx,code=index_to_code[index]
                 DFG.append((code,idx,'comesFrom',[],[]))
-                states[code]=[idx]
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code:[idx]}
+            return DFG,states
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_php(value,index_to_code,states)
+            temp,states=(yield value,states)
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
                 for index2 in value_indexs:
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'comesFrom',[code2],[idx2]))
-                states[code1]=[idx1]   
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code1:[idx1]}
+            return DFG,states
     elif root_node.type in assignment:
         left_nodes=root_node.child_by_field_name('left')
         right_nodes=root_node.child_by_field_name('right')
         DFG=[]
-        temp,states=DFG_php(right_nodes,index_to_code,states)
+        temp,states=(yield right_nodes,states)
         DFG+=temp            
         name_indexs=tree_to_variable_index(left_nodes,index_to_code)
         value_indexs=tree_to_variable_index(right_nodes,index_to_code)        
@@ -896,8 +906,8 @@ def DFG_php(root_node,index_to_code,states):
             for index2 in value_indexs:
                 idx2,code2=index_to_code[index2]
                 DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-            states[code1]=[idx1]   
-        return sorted(DFG,key=lambda x:x[1]),states
+            states={**states,code1:[idx1]}
+        return DFG,states
     elif root_node.type in increment_statement:
         DFG=[]
         indexs=tree_to_variable_index(root_node,index_to_code)
@@ -906,8 +916,8 @@ def DFG_php(root_node,index_to_code,states):
             for index2 in indexs:
                 idx2,code2=index_to_code[index2]
                 DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-            states[code1]=[idx1]
-        return sorted(DFG,key=lambda x:x[1]),states   
+            states={**states,code1:[idx1]}
+        return DFG,states   
     elif root_node.type in if_statement:
         DFG=[]
         current_states=states.copy()
@@ -920,11 +930,11 @@ def DFG_php(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement and flag is False:
-                temp,current_states=DFG_php(child,index_to_code,current_states)
+                temp,current_states=(yield child,current_states)
                 DFG+=temp
             else:
                 flag=True
-                temp,new_states=DFG_php(child,index_to_code,states)
+                temp,new_states=(yield child,states)
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
@@ -942,16 +952,16 @@ def DFG_php(root_node,index_to_code,states):
                 new_states[key]+=states[key]
         for key in new_states:
             new_states[key]=sorted(list(set(new_states[key])))
-        return sorted(DFG,key=lambda x:x[1]),new_states
+        return DFG,new_states
     elif root_node.type in for_statement:
         DFG=[]
         for child in root_node.children:
-            temp,states=DFG_php(child,index_to_code,states)
+            temp,states=(yield child,states)
             DFG+=temp
         flag=False
         for child in root_node.children:
             if flag:
-                temp,states=DFG_php(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp                
             elif child.type=="assignment_expression":               
                 flag=True
@@ -963,7 +973,7 @@ def DFG_php(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in enhanced_for_statement:
         name=None
         value=None
@@ -976,7 +986,7 @@ def DFG_php(root_node,index_to_code,states):
         body=root_node.child_by_field_name('body')
         DFG=[]
         for i in range(2):
-            temp,states=DFG_php(value,index_to_code,states)
+            temp,states=(yield value,states)
             DFG+=temp       
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)        
@@ -985,8 +995,8 @@ def DFG_php(root_node,index_to_code,states):
                 for index2 in value_indexs:
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-                states[code1]=[idx1]   
-            temp,states=DFG_php(body,index_to_code,states)
+                states={**states,code1:[idx1]}
+            temp,states=(yield body,states)
             DFG+=temp                       
         dic={}
         for x in DFG:
@@ -996,12 +1006,12 @@ def DFG_php(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in while_statement:  
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_php(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -1011,22 +1021,35 @@ def DFG_php(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states        
+        return DFG,states        
     else:
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_php(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_php(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
 
+def DFG_php(root_node,index_to_code,states):
+    return walk_dfg(_DFG_php,_DFG_php_leaf,root_node,index_to_code,states)
 
-def DFG_javascript(root_node,index_to_code,states):
+def _DFG_javascript_leaf(root_node,index_to_code,states):
+    idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
+    if root_node.type==code:
+        return [],states
+    elif code in states:
+        return [(code,idx,'comesFrom',[code],states[code].copy())],states
+    else:
+        if root_node.type=='identifier':
+            states={**states,code:[idx]}
+        return [(code,idx,'comesFrom',[],[])],states
+
+def _DFG_javascript(root_node,index_to_code,states):
     assignment=['assignment_pattern','augmented_assignment_expression']
     def_statement=['variable_declarator']
     increment_statement=['update_expression']
@@ -1035,18 +1058,7 @@ def DFG_javascript(root_node,index_to_code,states):
     enhanced_for_statement=[]
     while_statement=['while_statement']
     do_first_statement=[]    
-    states=states.copy()
-    if (len(root_node.children)==0 or root_node.type=='string') and root_node.type!='comment':
-        idx,code=index_to_code[(root_node.start_point,root_node.end_point)]
-        if root_node.type==code:
-            return [],states
-        elif code in states:
-            return [(code,idx,'comesFrom',[code],states[code].copy())],states
-        else:
-            if root_node.type=='identifier':
-                states[code]=[idx]
-            return [(code,idx,'comesFrom',[],[])],states
-    elif root_node.type in def_statement:
+    if root_node.type in def_statement:
         name=root_node.child_by_field_name('name')
         value=root_node.child_by_field_name('value')
         DFG=[]
@@ -1055,25 +1067,25 @@ def DFG_javascript(root_node,index_to_code,states):
             for index in indexs:
                 idx,code=index_to_code[index]
                 DFG.append((code,idx,'comesFrom',[],[]))
-                states[code]=[idx]
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code:[idx]}
+            return DFG,states
         else:
             name_indexs=tree_to_variable_index(name,index_to_code)
             value_indexs=tree_to_variable_index(value,index_to_code)
-            temp,states=DFG_javascript(value,index_to_code,states)
+            temp,states=(yield value,states)
             DFG+=temp            
             for index1 in name_indexs:
                 idx1,code1=index_to_code[index1]
                 for index2 in value_indexs:
                     idx2,code2=index_to_code[index2]
                     DFG.append((code1,idx1,'comesFrom',[code2],[idx2]))
-                states[code1]=[idx1]   
-            return sorted(DFG,key=lambda x:x[1]),states
+                states={**states,code1:[idx1]}
+            return DFG,states
     elif root_node.type in assignment:
         left_nodes=root_node.child_by_field_name('left')
         right_nodes=root_node.child_by_field_name('right')
         DFG=[]
-        temp,states=DFG_javascript(right_nodes,index_to_code,states)
+        temp,states=(yield right_nodes,states)
         DFG+=temp            
         name_indexs=tree_to_variable_index(left_nodes,index_to_code)
         value_indexs=tree_to_variable_index(right_nodes,index_to_code)        
@@ -1082,8 +1094,8 @@ def DFG_javascript(root_node,index_to_code,states):
             for index2 in value_indexs:
                 idx2,code2=index_to_code[index2]
                 DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-            states[code1]=[idx1]   
-        return sorted(DFG,key=lambda x:x[1]),states
+            states={**states,code1:[idx1]}
+        return DFG,states
     elif root_node.type in increment_statement:
         DFG=[]
         indexs=tree_to_variable_index(root_node,index_to_code)
@@ -1092,8 +1104,8 @@ def DFG_javascript(root_node,index_to_code,states):
             for index2 in indexs:
                 idx2,code2=index_to_code[index2]
                 DFG.append((code1,idx1,'computedFrom',[code2],[idx2]))
-            states[code1]=[idx1]
-        return sorted(DFG,key=lambda x:x[1]),states   
+            states={**states,code1:[idx1]}
+        return DFG,states   
     elif root_node.type in if_statement:
         DFG=[]
         current_states=states.copy()
@@ -1106,11 +1118,11 @@ def DFG_javascript(root_node,index_to_code,states):
             if 'else' in child.type:
                 tag=True
             if child.type not in if_statement and flag is False:
-                temp,current_states=DFG_javascript(child,index_to_code,current_states)
+                temp,current_states=(yield child,current_states)
                 DFG+=temp
             else:
                 flag=True
-                temp,new_states=DFG_javascript(child,index_to_code,states)
+                temp,new_states=(yield child,states)
                 DFG+=temp
                 others_states.append(new_states)
         others_states.append(current_states)
@@ -1130,16 +1142,16 @@ def DFG_javascript(root_node,index_to_code,states):
                 new_states[key]+=states[key]
         for key in new_states:
             new_states[key]=sorted(list(set(new_states[key])))
-        return sorted(DFG,key=lambda x:x[1]),new_states
+        return DFG,new_states
     elif root_node.type in for_statement:
         DFG=[]
         for child in root_node.children:
-            temp,states=DFG_javascript(child,index_to_code,states)
+            temp,states=(yield child,states)
             DFG+=temp
         flag=False
         for child in root_node.children:
             if flag:
-                temp,states=DFG_javascript(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp                
             elif child.type=="variable_declaration":               
                 flag=True
@@ -1151,12 +1163,12 @@ def DFG_javascript(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
     elif root_node.type in while_statement:  
         DFG=[]
         for i in range(2):
             for child in root_node.children:
-                temp,states=DFG_javascript(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp    
         dic={}
         for x in DFG:
@@ -1166,19 +1178,19 @@ def DFG_javascript(root_node,index_to_code,states):
                 dic[(x[0],x[1],x[2])][0]=list(set(dic[(x[0],x[1],x[2])][0]+x[3]))
                 dic[(x[0],x[1],x[2])][1]=sorted(list(set(dic[(x[0],x[1],x[2])][1]+x[4])))
         DFG=[(x[0],x[1],x[2],y[0],y[1]) for x,y in sorted(dic.items(),key=lambda t:t[0][1])]
-        return sorted(DFG,key=lambda x:x[1]),states    
+        return DFG,states    
     else:
         DFG=[]
         for child in root_node.children:
             if child.type in do_first_statement:
-                temp,states=DFG_javascript(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp,states=DFG_javascript(child,index_to_code,states)
+                temp,states=(yield child,states)
                 DFG+=temp
         
-        return sorted(DFG,key=lambda x:x[1]),states
+        return DFG,states
 
-
-     
+def DFG_javascript(root_node,index_to_code,states):
+    return walk_dfg(_DFG_javascript,_DFG_javascript_leaf,root_node,index_to_code,states)
@@ -2,7 +2,6 @@ import os
 import pickle
 import json
 import sys
-import copy
 import torch
 import argparse
 from tqdm import tqdm
@@ -12,7 +11,8 @@ sys.path.append('../../../python_parser')
 
 # from attacker import 
 from python_parser.run_parser import get_identifiers, remove_comments_and_docstrings
-from utils import is_valid_variable_name, _tokenize, get_identifier_posistions_from_code, get_masked_code_by_position, get_substitues, is_valid_substitue
+from utils import is_valid_variable_name, _tokenize, get_identifier_posistions_from_code, get_masked_code_by_position, get_substitues, is_valid_substitue, get_substitute_similarities
+from utils import get_device, merge_ranked_substitutes, IdentifierMLMHead, IdentifierIndex
 from transformers import (RobertaForMaskedLM, RobertaConfig, RobertaForSequenceClassification, RobertaTokenizer)
 
 def main():
@@ -28,13 +28,22 @@ def main():
     parser.add_argument("--block_size", default=-1, type=int,
                         help="Optional input sequence length after tokenization.")
 
+    parser.add_argument("--no_cuda", action='store_true',
+                        help="Avoid using CUDA when available")
+    parser.add_argument("--num_threads", default=0, type=int,
+                        help="Number of CPU threads for inference when running without CUDA (0 = torch default).")
+    parser.add_argument("--sim_batch_size", default=60, type=int,
+                        help="Number of candidate substitutes encoded together when ranking by embedding similarity.")
     args = parser.parse_args()
 
     eval_data = []
 
     codebert_mlm = RobertaForMaskedLM.from_pretrained(args.base_model)
     tokenizer_mlm = RobertaTokenizer.from_pretrained(args.base_model)
-    codebert_mlm.to('cuda')
+    device = get_device(args.no_cuda, args.num_threads)
+    codebert_mlm.to(device)
+    identifier_head = IdentifierMLMHead(codebert_mlm, tokenizer_mlm)
+    identifier_index = IdentifierIndex(tokenizer_mlm)
 
     file_type = args.eval_data_file.split('/')[-1].split('.')[0] # valid
     folder = '/'.join(args.eval_data_file.split('/')[:-1]) # 得到文件目录
@@ -69,8 +78,9 @@ def main():
             
             input_ids_ = torch.tensor([tokenizer_mlm.convert_tokens_to_ids(sub_words)])
 
-            word_predictions = codebert_mlm(input_ids_.to('cuda'))[0].squeeze()  # seq-len(sub) vocab
-            word_pred_scores_all, word_predictions = torch.topk(word_predictions, 60, -1)  # seq-len k
+            # 只在可以组成变量名的subword上取top k; orig_embeddings是同一次forward的hidden states
+            word_pred_scores_all, word_predictions, orig_embeddings = identifier_head.topk(input_ids_, 60)
+            word_pred_scores_all, word_predictions = word_pred_scores_all.squeeze(), word_predictions.squeeze()  # seq-len k
             # 得到前k个结果.
 
             word_predictions = word_predictions[1:len(sub_words) + 1, :]
@@ -80,9 +90,6 @@ def main():
 
             variable_substitue_dict = {}
 
-            with torch.no_grad():
-                orig_embeddings = codebert_mlm.roberta(input_ids_.to('cuda'))[0]
-            cos = torch.nn.CosineSimilarity(dim=1, eps=1e-6)
             for tgt_word in names_positions_dict.keys():
                 tgt_positions = names_positions_dict[tgt_word] # the positions of tgt_word in code
                 if not is_valid_variable_name(tgt_word, lang='python'):
@@ -97,25 +104,19 @@ def main():
                         continue
                     substitutes = word_predictions[keys[one_pos][0]:keys[one_pos][1]]  # L, k
                     word_pred_scores = word_pred_scores_all[keys[one_pos][0]:keys[one_pos][1]]
-                    
-                    orig_word_embed = orig_embeddings[0][keys[one_pos][0]+1:keys[one_pos][1]+1]
 
                     similar_substitutes = []
                     similar_word_pred_scores = []
-                    sims = []
                     subwords_leng, nums_candis = substitutes.size()
 
-                    for i in range(nums_candis):
-
-                        new_ids_ = copy.deepcopy(input_ids_)
-                        new_ids_[0][keys[one_pos][0]+1:keys[one_pos][1]+1] = substitutes[:,i]
-                        # 替换词得到新embeddings
-
-                        with torch.no_grad():
-                            new_embeddings = codebert_mlm.roberta(new_ids_.to('cuda'))[0]
-                        new_word_embed = new_embeddings[0][keys[one_pos][0]+1:keys[one_pos][1]+1]
-
-                        sims.append((i, sum(cos(orig_word_embed, new_word_embed))/subwords_leng))
+                    # 一次性批量计算所有候选的相似度
+                    sims = get_substitute_similarities(substitutes,
+                                                       input_ids_,
+                                                       keys[one_pos][0]+1,
+                                                       keys[one_pos][1]+1,
+                                                       orig_embeddings,
+                                                       codebert_mlm,
+                                                       args.sim_batch_size)
                     
                     sims = sorted(sims, key=lambda x: x[1], reverse=True)
                     # 排序取top 30 个
@@ -132,14 +133,17 @@ def main():
                                                 codebert_mlm, 
                                                 1, 
                                                 similar_word_pred_scores, 
-                                                0)
-                    all_substitues += substitutes
-                all_substitues = set(all_substitues)
-
-                for tmp_substitue in all_substitues:
+                                                0,
+                                                index=identifier_index)
+                    all_substitues.append(substitutes)
+                # 按MLM/相似度的排名排序 (greedy_attack按这个顺序查询)
+                all_substitues = merge_ranked_substitutes(all_substitues)
+
+                valid = identifier_index.valid_names([tmp_substitue.strip() for tmp_substitue in all_substitues], 'python')
+                for tmp_substitue, is_valid in zip(all_substitues, valid):
                     if tmp_substitue.strip() in variable_names:
                         continue
-                    if not is_valid_substitue(tmp_substitue.strip(), tgt_word, 'python'):
+                    if not is_valid:
                         continue
                     try:
                         variable_substitue_dict[tgt_word].append(tmp_substitue)
@@ -18,8 +18,8 @@ import torch
 import time
 from model import Model
 from run import TextDataset
-from utils import set_seed
-from utils import Recorder
+from utils import set_seed, get_device
+from utils import AttackScheduler, ConcurrentAttackRunner
 from attacker import Attacker
 from transformers import (RobertaForMaskedLM, RobertaConfig, RobertaForSequenceClassification, RobertaTokenizer)
 
@@ -69,6 +69,24 @@ def main():
                         help="Whether to GA-Attack.")
     parser.add_argument("--eval_batch_size", default=4, type=int,
                         help="Batch size per GPU/CPU for evaluation.")
+    parser.add_argument("--no_cuda", action='store_true',
+                        help="Avoid using CUDA when available")
+    parser.add_argument("--num_threads", default=0, type=int,
+                        help="Number of CPU threads for inference when running without CUDA (0 = torch default).")
+    parser.add_argument("--query_cache_size", default=100000, type=int,
+                        help="Max number of cached victim model outputs (0 disables the query cache).")
+    parser.add_argument("--greedy_batch_size", default=0, type=int,
+                        help="Greedy attack: query the substitutes of a variable in micro-batches of this size, in the order of the substitutes file, and stop at the first successful one (0 = all in one query).")
+    parser.add_argument("--importance_mode", default="mask", type=str, choices=["mask", "variable", "gradient", "compare"],
+                        help="Importance score of the variables: query one masked copy per occurrence (mask) or per variable, with all its occurrences masked (variable), estimate it from one forward/backward pass of the original code (gradient), or use mask and print the cost and ranking agreement of mask and gradient (compare).")
+    parser.add_argument("--ig_steps", default=1, type=int,
+                        help="Gradient importance mode: number of integrated-gradients steps from the <unk> embedding (1 = gradient x embedding difference).")
+    parser.add_argument("--nb_workers", default=1, type=int,
+                        help="Number of worker processes attacking examples in parallel.")
+    parser.add_argument("--nb_concurrent", default=1, type=int,
+                        help="Number of examples attacked concurrently in each process; their model queries are pooled into shared batches.")
+    parser.add_argument("--resume", action='store_true',
+                        help="Continue an interrupted run: keep the rows already in csv_store_path and skip their examples.")
     parser.add_argument('--seed', type=int, default=42,
                         help="random seed for initialization")
     parser.add_argument("--cache_dir", default="", type=str,
@@ -78,8 +96,11 @@ def main():
 
     args = parser.parse_args()
 
+    AttackScheduler(args.nb_workers).run(run_attack, args)
 
-    args.device = torch.device("cuda")
+
+def run_attack(args, worker):
+    args.device = get_device(args.no_cuda, args.num_threads)
     # Set seed
     set_seed(args.seed)
 
@@ -126,14 +147,14 @@ def main():
 
     checkpoint_prefix = 'checkpoint-best-acc/model.bin'
     output_dir = os.path.join(args.output_dir, '{}'.format(checkpoint_prefix))  
-    model.load_state_dict(torch.load(output_dir))      
+    model.load_state_dict(torch.load(output_dir, map_location=args.device))
     model.to(args.device)
 
 
     ## Load CodeBERT (MLM) model
     codebert_mlm = RobertaForMaskedLM.from_pretrained(args.base_model)
     tokenizer_mlm = RobertaTokenizer.from_pretrained(args.base_model)
-    codebert_mlm.to('cuda') 
+    codebert_mlm.to(args.device)
 
     ## Load Dataset
     eval_dataset = TextDataset(tokenizer, args,args.eval_data_file)
@@ -149,16 +170,17 @@ def main():
             generated_substitutions.append(js['substitutes'])
     assert(len(source_codes) == len(eval_dataset) == len(generated_substitutions))
 
-    success_attack = 0
-    total_cnt = 0
-
-    recoder = Recorder(args.csv_store_path)
-    query_times = 0
-    attacker = Attacker(args, model, tokenizer, codebert_mlm, tokenizer_mlm, use_bpe=1, threshold_pred_score=0)
-    start_time = time.time()
-    for index, example in enumerate(eval_dataset):
-        example_start_time = time.time()
-        orig_prob, orig_label = model.get_results([example], args.eval_batch_size)
+    recoder = worker.recorder(args.csv_store_path)
+    # --resume时从已有的csv恢复统计
+    success_attack = recoder.nb_success
+    total_cnt = recoder.nb_total
+    model.query += recoder.query_times
+    runner = ConcurrentAttackRunner(model, args.nb_concurrent)
+    attacker = Attacker(args, runner.model, tokenizer, codebert_mlm, tokenizer_mlm, use_bpe=1, threshold_pred_score=0)
+    start_time = time.time() - recoder.time_cost * 60
+
+    def attack_example(index, example):
+        orig_prob, orig_label = runner.model.get_results([example], args.eval_batch_size)
         
         code = source_codes[index]
         substituions = generated_substitutions[index]
@@ -168,8 +190,11 @@ def main():
             # 如果不成功，则使用gi_attack
             code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, names_to_importance_score, nb_changed_var, nb_changed_pos, replaced_words = attacker.ga_attack(example, code, substituions, initial_replace=replaced_words)
             attack_type = "GA"
+        return code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, names_to_importance_score, nb_changed_var, nb_changed_pos, replaced_words, attack_type
+
+    for index, example, result, attack_queries, example_end_time in runner.run(attack_example, worker, eval_dataset):
+        code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, names_to_importance_score, nb_changed_var, nb_changed_pos, replaced_words, attack_type = result
 
-        example_end_time = (time.time()-example_start_time)/60
         
         print("Example time cost: ", round(example_end_time, 2), "min")
         print("ALL examples time cost: ", round((time.time()-start_time)/60, 2), "min")
@@ -183,10 +208,10 @@ def main():
             for key in replaced_words.keys():
                 replace_info += key + ':' + replaced_words[key] + ','
 
-        print("Query times in this attack: ", model.query - query_times)
+        print("Query times in this attack: ", attack_queries)
         print("All Query times: ", model.query)
-        recoder.write(index, code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, score_info, nb_changed_var, nb_changed_pos, replace_info, attack_type, model.query - query_times, example_end_time)
-        query_times = model.query
+        print("Query cache hits/misses: ", model.engine.cache.hits, model.engine.cache.misses)
+        recoder.write(index, code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, score_info, nb_changed_var, nb_changed_pos, replace_info, attack_type, attack_queries, example_end_time)
         
         
         if is_success >= -1 :
@@ -202,7 +227,7 @@ def main():
         print("Total count: ", total_cnt)
         print("Index: ", index)
         print()
-    
-        
+
+
 if __name__ == '__main__':
     main()
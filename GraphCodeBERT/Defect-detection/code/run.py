@@ -45,6 +45,7 @@ except:
 from tqdm import tqdm, trange
 import multiprocessing
 from model import Model
+from utils import get_graph_edges, build_graph_attn_mask, FeatureStore
 cpu_cont = multiprocessing.cpu_count()
 from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
                           BertConfig, BertForMaskedLM, BertTokenizer,
@@ -135,7 +136,7 @@ class TextDataset(Dataset):
 
         print('\n cached_features_file: ',cache_file_path)
         try:
-            self.examples = torch.load(cache_file_path)
+            self.examples = FeatureStore.load(cache_file_path)
             logger.info("Loading features from cached file %s", cache_file_path)
         
         except:
@@ -146,7 +147,7 @@ class TextDataset(Dataset):
                     self.examples.append(convert_examples_to_features(js,tokenizer,args))
                     # 这里每次都是重新读取并处理数据集，能否cache然后load
             logger.info("Saving features into cached file %s", cache_file_path)
-            torch.save(self.examples, cache_file_path)
+            self.examples = FeatureStore.save(cache_file_path, self.examples)
         if 'train' in file_path:
             for idx, example in enumerate(self.examples[:3]):
                     logger.info("*** Example ***")
@@ -154,38 +155,27 @@ class TextDataset(Dataset):
                     logger.info("label: {}".format(example.label))
                     logger.info("input_tokens: {}".format([x.replace('\u0120','_') for x in example.input_tokens]))
                     logger.info("input_ids: {}".format(' '.join(map(str, example.input_ids))))
+        self.edges = [None] * len(self.examples)
 
     def __len__(self):
         return len(self.examples)
 
+    def get_edges(self, item):
+        if self.edges[item] is None:
+            self.edges[item] = get_graph_edges(self.examples[item].position_idx,
+                                               self.examples[item].dfg_to_code,
+                                               self.examples[item].dfg_to_dfg)
+        return self.edges[item]
+
     def __getitem__(self, item):
         #calculate graph-guided masked function
-        attn_mask=np.zeros((self.args.code_length+self.args.data_flow_length,
-                            self.args.code_length+self.args.data_flow_length),dtype=np.bool)
-        #calculate begin index of node and max length of input
-        
-        node_index=sum([i>1 for i in self.examples[item].position_idx])
-        max_length=sum([i!=1 for i in self.examples[item].position_idx])
-        #sequence can attend to sequence
-        attn_mask[:node_index,:node_index]=True
-        #special tokens attend to all tokens
-        for idx,i in enumerate(self.examples[item].input_ids):
-            if i in [0,2]:
-                attn_mask[idx,:max_length]=True
-        #nodes attend to code tokens that are identified from
-        for idx,(a,b) in enumerate(self.examples[item].dfg_to_code):
-            if a<node_index and b<node_index:
-                attn_mask[idx+node_index,a:b]=True
-                attn_mask[a:b,idx+node_index]=True
-        #nodes attend to adjacent nodes 
-        for idx,nodes in enumerate(self.examples[item].dfg_to_dfg):
-            for a in nodes:
-                if a+node_index<len(self.examples[item].position_idx):
-                    attn_mask[idx+node_index,a+node_index]=True
+        attn_mask = build_graph_attn_mask([self.examples[item].input_ids],
+                                          [self.examples[item].position_idx],
+                                          [self.get_edges(item)])[0]
               
-        return (torch.tensor(self.examples[item].input_ids),
-              torch.tensor(attn_mask),
-              torch.tensor(self.examples[item].position_idx),
+        return (torch.tensor(self.examples[item].input_ids, dtype=torch.long),
+              attn_mask,
+              torch.tensor(self.examples[item].position_idx, dtype=torch.long),
               torch.tensor(self.examples[item].label))
             
 
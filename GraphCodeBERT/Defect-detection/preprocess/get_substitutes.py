@@ -11,6 +11,7 @@ sys.path.append('../../../python_parser')
 # from attacker import 
 from python_parser.run_parser import get_identifiers, remove_comments_and_docstrings
 from utils import is_valid_variable_name, _tokenize, get_identifier_posistions_from_code, get_masked_code_by_position, get_substitues, is_valid_substitue
+from utils import get_device, merge_ranked_substitutes, IdentifierMLMHead, IdentifierIndex
 from transformers import (RobertaForMaskedLM, RobertaConfig, RobertaForSequenceClassification, RobertaTokenizer)
 
 def main():
@@ -28,13 +29,20 @@ def main():
     parser.add_argument("--index", nargs='+',
                         help="Optional input sequence length after tokenization.")
 
+    parser.add_argument("--no_cuda", action='store_true',
+                        help="Avoid using CUDA when available")
+    parser.add_argument("--num_threads", default=0, type=int,
+                        help="Number of CPU threads for inference when running without CUDA (0 = torch default).")
     args = parser.parse_args()
 
     eval_data = []
 
     codebert_mlm = RobertaForMaskedLM.from_pretrained(args.base_model)
     tokenizer_mlm = RobertaTokenizer.from_pretrained(args.base_model)
-    codebert_mlm.to('cuda')
+    device = get_device(args.no_cuda, args.num_threads)
+    codebert_mlm.to(device)
+    identifier_head = IdentifierMLMHead(codebert_mlm, tokenizer_mlm)
+    identifier_index = IdentifierIndex(tokenizer_mlm)
 
     with open(args.eval_data_file) as rf:
         for i, line in enumerate(rf):
@@ -60,8 +68,9 @@ def main():
             
             input_ids_ = torch.tensor([tokenizer_mlm.convert_tokens_to_ids(sub_words)])
 
-            word_predictions = codebert_mlm(input_ids_.to('cuda'))[0].squeeze()  # seq-len(sub) vocab
-            word_pred_scores_all, word_predictions = torch.topk(word_predictions, 60, -1)  # seq-len k
+            # 只在可以组成变量名的subword上取top k
+            word_pred_scores_all, word_predictions, _ = identifier_head.topk(input_ids_, 60)
+            word_pred_scores_all, word_predictions = word_pred_scores_all.squeeze(), word_predictions.squeeze()  # seq-len k
             # 得到前k个结果.
 
             word_predictions = word_predictions[1:len(sub_words) + 1, :]
@@ -129,14 +138,17 @@ def main():
                                                 codebert_mlm, 
                                                 1, 
                                                 word_pred_scores, 
-                                                0)
-                    all_substitues += substitutes
-                all_substitues = set(all_substitues)
-
-                for tmp_substitue in all_substitues:
+                                                0,
+                                                index=identifier_index)
+                    all_substitues.append(substitutes)
+                # 按MLM/相似度的排名排序 (greedy_attack按这个顺序查询)
+                all_substitues = merge_ranked_substitutes(all_substitues)
+
+                valid = identifier_index.valid_names([tmp_substitue.strip() for tmp_substitue in all_substitues], 'c')
+                for tmp_substitue, is_valid in zip(all_substitues, valid):
                     if tmp_substitue.strip() in variable_names:
                         continue
-                    if not is_valid_substitue(tmp_substitue.strip(), tgt_word, 'c'):
+                    if not is_valid:
                         continue
                     try:
                         variable_substitue_dict[tgt_word].append(tmp_substitue)
@@ -1,3 +1,7 @@
+import sys
+sys.path.append('../../../')
+sys.path.append('../../../python_parser')
+
 import torch
 import torch.nn as nn
 import torch
@@ -5,8 +9,8 @@ from torch.autograd import Variable
 import copy
 import torch.nn.functional as F
 from torch.nn import CrossEntropyLoss, MSELoss
-from torch.utils.data import SequentialSampler, DataLoader
 import numpy as np
+from utils import InferenceEngine, QueryCache, group_rows
 
 class RobertaClassificationHead(nn.Module):
     """Head for sentence-level classification tasks."""
@@ -36,14 +40,30 @@ class Model(nn.Module):
         self.classifier=RobertaClassificationHead(config)
         self.args=args
         self.query = 0
+        self.engine = InferenceEngine(args.device, getattr(args, 'query_cache_size', 0))
+        # code 2 的<s>输出, 见encode_partners
+        self.partner_cache = QueryCache(getattr(args, 'partner_cache_size', 32))
     
         
     def forward(self, inputs_ids_1,position_idx_1,attn_mask_1,inputs_ids_2,position_idx_2,attn_mask_2,labels=None): 
+        if labels is None and not self.training:
+            return self.predict_pairs(inputs_ids_1,position_idx_1,attn_mask_1,inputs_ids_2,position_idx_2,attn_mask_2)
         bs,l=inputs_ids_1.size()
         inputs_ids=torch.cat((inputs_ids_1.unsqueeze(1),inputs_ids_2.unsqueeze(1)),1).view(bs*2,l)
         position_idx=torch.cat((position_idx_1.unsqueeze(1),position_idx_2.unsqueeze(1)),1).view(bs*2,l)
         attn_mask=torch.cat((attn_mask_1.unsqueeze(1),attn_mask_2.unsqueeze(1)),1).view(bs*2,l,l)
 
+        outputs = self.encode(inputs_ids,position_idx,attn_mask)
+        logits=self.classifier(outputs)
+        prob=F.softmax(logits)
+        if labels is not None:
+            loss_fct = CrossEntropyLoss()
+            loss = loss_fct(logits, labels)
+            return loss,prob
+        else:
+            return prob
+
+    def encode(self, inputs_ids, position_idx, attn_mask):
         #embedding
         nodes_mask=position_idx.eq(0)
         token_mask=position_idx.ge(2)        
@@ -54,36 +74,73 @@ class Model(nn.Module):
         inputs_embeddings=inputs_embeddings*(~nodes_mask)[:,:,None]+avg_embeddings*nodes_mask[:,:,None]    
         
         outputs = self.encoder.roberta(inputs_embeds=inputs_embeddings,attention_mask=attn_mask,position_ids=position_idx)[0]
-        logits=self.classifier(outputs)
-        prob=F.softmax(logits)
-        if labels is not None:
-            loss_fct = CrossEntropyLoss()
-            loss = loss_fct(logits, labels)
-            return loss,prob
-        else:
-            return prob
-    
+        # classifier只用到<s>的输出
+        return outputs[:, :1, :]
+
+    def encode_partners(self, inputs_ids, position_idx, attn_mask):
+        '''
+        code 2 的<s>输出. attack时code 2是固定的, 一个batch中相同的code 2只编码一次,
+        编码过的code 2 (按去掉padding之后的三个输入) 直接从partner_cache中取.
+        code 2 不需要梯度 (见utils.embedding_saliency), 缓存的输出都detach.
+        '''
+        groups = group_rows(inputs_ids, position_idx, attn_mask)
+        index = torch.empty(inputs_ids.size(0), dtype=torch.long, device=inputs_ids.device)
+        outputs = []
+        for g, (first, rows) in enumerate(groups):
+            # code tokens + dfg nodes, 之后全是pad
+            length = int(position_idx[first].ne(self.tokenizer.pad_token_id).sum())
+            features = (inputs_ids[first:first+1, :length], position_idx[first:first+1, :length],
+                        attn_mask[first:first+1, :length, :length])
+            key = self.partner_cache.key([t.cpu() for t in features])
+            output = self.partner_cache.get(key)
+            if output is None:
+                output = self.encode(*features).detach()
+                self.partner_cache.put(key, output)
+            outputs.append(output)
+            index[rows] = g
+        return torch.cat(outputs)[index]
+
+    def predict_pairs(self, inputs_ids_1, position_idx_1, attn_mask_1, inputs_ids_2, position_idx_2, attn_mask_2):
+        '''
+        推理时两段代码分开编码: 只对code 1运行encoder, code 2由encode_partners复用.
+        classifier只把两段代码的<s>输出拼起来, 所以结果和forward相同.
+        '''
+        outputs_1 = self.encode(inputs_ids_1, position_idx_1, attn_mask_1)
+        outputs_2 = self.encode_partners(inputs_ids_2, position_idx_2, attn_mask_2)
+        outputs = torch.cat((outputs_1, outputs_2), 1).view(-1, 1, outputs_1.size(-1))
+        logits = self.classifier(outputs)
+        prob = F.softmax(logits)
+        return prob
+
+    def train(self, mode=True):
+        # 参数会被更新, 缓存的code 2输出不再有效
+        if mode:
+            self.partner_cache = QueryCache(self.partner_cache.maxsize)
+        return super(Model, self).train(mode)
+
+    def feature_length(self, item):
+        # code tokens + dfg nodes, 之后全是pad. 两段代码取较长的那段
+        return max(int(item[1].ne(self.tokenizer.pad_token_id).sum()), int(item[4].ne(self.tokenizer.pad_token_id).sum()))
+
+    def trim_features(self, features):
+        '''
+        features: [inputs_ids_1, position_idx_1, attn_mask_1, inputs_ids_2, position_idx_2, attn_mask_2, labels].
+        forward要求两段代码等长, 所以两段都只pad到batch里最长的那段
+        '''
+        length = max(int(features[1].ne(self.tokenizer.pad_token_id).sum(-1).max()),
+                     int(features[4].ne(self.tokenizer.pad_token_id).sum(-1).max()))
+        trimmed = []
+        for inputs_ids, position_idx, attn_mask in (features[0:3], features[3:6]):
+            trimmed += [inputs_ids[:, :length], position_idx[:, :length], attn_mask[:, :length, :length]]
+        return trimmed + features[6:]
+
     def get_results(self, dataset, batch_size, threshold=0.5):
         '''Given a dataset, return probabilities and labels.'''
-        self.query += len(dataset)
-        eval_sampler = SequentialSampler(dataset)
-        eval_dataloader = DataLoader(dataset, sampler=eval_sampler, batch_size=batch_size,num_workers=4,pin_memory=False)
-
         self.eval()
-        logits=[] 
-        labels=[]
-        for batch in eval_dataloader:
-            (inputs_ids_1,position_idx_1,attn_mask_1,
-            inputs_ids_2,position_idx_2,attn_mask_2,
-            label)=[x.to("cuda")  for x in batch]
-            with torch.no_grad():
-                logit = self.forward(inputs_ids_1,position_idx_1,attn_mask_1,inputs_ids_2,position_idx_2,attn_mask_2)
-                logits.append(logit.cpu().numpy())
-                # 和defect detection任务不一样，这个的输出就是softmax值，而非sigmoid值
-                labels.append(label.cpu().numpy())
-
-        logits=np.concatenate(logits,0)
-        labels=np.concatenate(labels,0)
+        logits, nb_queries = self.engine.predict(self, dataset, batch_size)
+        # inputs served from the query cache are not counted as queries
+        self.query += nb_queries
+        # 和defect detection任务不一样，这个的输出就是softmax值，而非sigmoid值
 
         probs = logits
         pred_labels = [0 if first_softmax  > threshold else 1 for first_softmax in logits[:,0]]
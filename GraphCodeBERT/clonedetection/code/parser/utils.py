@@ -61,27 +61,66 @@ def remove_comments_and_docstrings(source,lang):
         return '\n'.join(temp)
 
 def tree_to_token_index(root_node):
-    if (len(root_node.children)==0 or root_node.type=='string') and root_node.type!='comment':
-        return [(root_node.start_point,root_node.end_point)]
-    else:
-        code_tokens=[]
-        for child in root_node.children:
-            code_tokens+=tree_to_token_index(child)
-        return code_tokens
+    # 显式的栈代替递归, 很长的函数也不会超过递归深度
+    code_tokens=[]
+    stack=[root_node]
+    while stack:
+        node=stack.pop()
+        if (len(node.children)==0 or node.type=='string') and node.type!='comment':
+            code_tokens.append((node.start_point,node.end_point))
+        else:
+            stack.extend(reversed(node.children))
+    return code_tokens
     
 def tree_to_variable_index(root_node,index_to_code):
-    if (len(root_node.children)==0 or root_node.type=='string') and root_node.type!='comment':
-        index=(root_node.start_point,root_node.end_point)
-        _,code=index_to_code[index]
-        if root_node.type!=code:
-            return [(root_node.start_point,root_node.end_point)]
+    if not root_node:
+        return []
+    code_tokens=[]
+    stack=[root_node]
+    while stack:
+        node=stack.pop()
+        if (len(node.children)==0 or node.type=='string') and node.type!='comment':
+            index=(node.start_point,node.end_point)
+            _,code=index_to_code[index]
+            if node.type!=code:
+                code_tokens.append(index)
         else:
-            return []
-    else:
-        code_tokens=[]
-        for child in root_node.children:
-            code_tokens+=tree_to_variable_index(child,index_to_code)
-        return code_tokens    
+            stack.extend(reversed(node.children))
+    return code_tokens
+
+def is_token_node(node):
+    return (node.child_count==0 or node.type=='string') and node.type!='comment'
+
+def walk_dfg(handler,leaf,root_node,index_to_code,states):
+    '''
+    leaf(node,index_to_code,states) 处理token节点, 直接返回 (DFG,states).
+    handler(node,index_to_code,states) 处理其他节点, 是一个generator: 需要子节点的
+    结果时 yield (child,states), 拿到子节点的 (DFG,states); 最后 return (DFG,states).
+    用显式的栈代替递归, 中间结果不排序, 整个DFG只在最后按token位置排一次
+    (sort是稳定的, 和每一层都排序的结果相同).
+    states不会被原地修改, 所以不用在每个节点复制.
+    '''
+    if is_token_node(root_node):
+        DFG,states=leaf(root_node,index_to_code,states)
+        return sorted(DFG,key=lambda x:x[1]),states
+    stack=[handler(root_node,index_to_code,states)]
+    result=None
+    while True:
+        try:
+            child,child_states=stack[-1].send(result)
+        except StopIteration as e:
+            stack.pop()
+            result=e.value
+            if not stack:
+                break
+            continue
+        if is_token_node(child):
+            result=leaf(child,index_to_code,child_states)
+        else:
+            stack.append(handler(child,index_to_code,child_states))
+            result=None
+    DFG,states=result
+    return sorted(DFG,key=lambda x:x[1]),states
 
 def index_to_code_token(index,code):
     start_point=index[0]
@@ -21,6 +21,7 @@ using a masked language modeling (MLM) loss.
 
 from __future__ import absolute_import, division, print_function
 
+import sys
 import argparse
 import glob
 import logging
@@ -39,6 +40,9 @@ from transformers import (WEIGHTS_NAME, AdamW, get_linear_schedule_with_warmup,
 from tqdm import tqdm, trange
 import multiprocessing
 from model import Model
+sys.path.append('../../../')
+sys.path.append('../../../python_parser')
+from utils import get_graph_edges, build_graph_attn_mask, FeatureStore
 
 cpu_cont = 16
 logger = logging.getLogger(__name__)
@@ -213,7 +217,7 @@ class TextDataset(Dataset):
         code_pairs_file_path = os.path.join(folder, 'cached_{}.pkl'.format(postfix))
         code_pairs = []
         try:
-            self.examples = torch.load(cache_file_path)
+            self.examples = FeatureStore.load(cache_file_path)
             with open(code_pairs_file_path, 'rb') as f:
                 code_pairs = pickle.load(f)
             logger.info("Loading features from cached file %s", cache_file_path)
@@ -254,7 +258,7 @@ class TextDataset(Dataset):
                 pickle.dump(code_pairs, f)
             #convert example to input features    
             self.examples=[convert_examples_to_features(x) for x in tqdm(data,total=len(data))]
-            torch.save(self.examples, cache_file_path)
+            self.examples = FeatureStore.save(cache_file_path, self.examples)
         
         if 'train' in file_path:
             for idx, example in enumerate(self.examples[:3]):
@@ -272,64 +276,31 @@ class TextDataset(Dataset):
                 logger.info("position_idx_2: {}".format(example.position_idx_2))
                 logger.info("dfg_to_code_2: {}".format(' '.join(map(str, example.dfg_to_code_2))))
                 logger.info("dfg_to_dfg_2: {}".format(' '.join(map(str, example.dfg_to_dfg_2))))
-
+        self.edges = [None] * len(self.examples)
 
     def __len__(self):
         return len(self.examples)
     
+    def get_edges(self, item):
+        if self.edges[item] is None:
+            example = self.examples[item]
+            self.edges[item] = (get_graph_edges(example.position_idx_1, example.dfg_to_code_1, example.dfg_to_dfg_1),
+                                get_graph_edges(example.position_idx_2, example.dfg_to_code_2, example.dfg_to_dfg_2))
+        return self.edges[item]
+    
     def __getitem__(self, item):
-        #calculate graph-guided masked function
-        attn_mask_1= np.zeros((self.args.code_length+self.args.data_flow_length,
-                        self.args.code_length+self.args.data_flow_length),dtype=np.bool)
-        #calculate begin index of node and max length of input
-        node_index=sum([i>1 for i in self.examples[item].position_idx_1])
-        max_length=sum([i!=1 for i in self.examples[item].position_idx_1])
-        #sequence can attend to sequence
-        attn_mask_1[:node_index,:node_index]=True
-        #special tokens attend to all tokens
-        for idx,i in enumerate(self.examples[item].input_ids_1):
-            if i in [0,2]:
-                attn_mask_1[idx,:max_length]=True
-        #nodes attend to code tokens that are identified from
-        for idx,(a,b) in enumerate(self.examples[item].dfg_to_code_1):
-            if a<node_index and b<node_index:
-                attn_mask_1[idx+node_index,a:b]=True
-                attn_mask_1[a:b,idx+node_index]=True
-        #nodes attend to adjacent nodes 
-        for idx,nodes in enumerate(self.examples[item].dfg_to_dfg_1):
-            for a in nodes:
-                if a+node_index<len(self.examples[item].position_idx_1):
-                    attn_mask_1[idx+node_index,a+node_index]=True  
-                    
-        #calculate graph-guided masked function
-        attn_mask_2= np.zeros((self.args.code_length+self.args.data_flow_length,
-                        self.args.code_length+self.args.data_flow_length),dtype=np.bool)
-        #calculate begin index of node and max length of input
-        node_index=sum([i>1 for i in self.examples[item].position_idx_2])
-        max_length=sum([i!=1 for i in self.examples[item].position_idx_2])
-        #sequence can attend to sequence
-        attn_mask_2[:node_index,:node_index]=True
-        #special tokens attend to all tokens
-        for idx,i in enumerate(self.examples[item].input_ids_2):
-            if i in [0,2]:
-                attn_mask_2[idx,:max_length]=True
-        #nodes attend to code tokens that are identified from
-        for idx,(a,b) in enumerate(self.examples[item].dfg_to_code_2):
-            if a<node_index and b<node_index:
-                attn_mask_2[idx+node_index,a:b]=True
-                attn_mask_2[a:b,idx+node_index]=True
-        #nodes attend to adjacent nodes 
-        for idx,nodes in enumerate(self.examples[item].dfg_to_dfg_2):
-            for a in nodes:
-                if a+node_index<len(self.examples[item].position_idx_2):
-                    attn_mask_2[idx+node_index,a+node_index]=True                      
+        #calculate graph-guided masked function for both code snippets at once
+        edges_1, edges_2 = self.get_edges(item)
+        attn_mask_1, attn_mask_2 = build_graph_attn_mask([self.examples[item].input_ids_1, self.examples[item].input_ids_2],
+                                                         [self.examples[item].position_idx_1, self.examples[item].position_idx_2],
+                                                         [edges_1, edges_2])
                     
-        return (torch.tensor(self.examples[item].input_ids_1),
-                torch.tensor(self.examples[item].position_idx_1),
-                torch.tensor(attn_mask_1), 
-                torch.tensor(self.examples[item].input_ids_2),
-                torch.tensor(self.examples[item].position_idx_2),
-                torch.tensor(attn_mask_2),                 
+        return (torch.tensor(self.examples[item].input_ids_1, dtype=torch.long),
+                torch.tensor(self.examples[item].position_idx_1, dtype=torch.long),
+                attn_mask_1,
+                torch.tensor(self.examples[item].input_ids_2, dtype=torch.long),
+                torch.tensor(self.examples[item].position_idx_2, dtype=torch.long),
+                attn_mask_2,
                 torch.tensor(self.examples[item].label))
 
 
@@ -0,0 +1,116 @@
+'''
+比较 parser_folder 中显式栈的DFG提取和原来递归的实现 (dfg_recursive.py):
+检查两者得到的DFG完全相同, 并输出各自的耗时.
+
+    cd python_parser
+    python benchmark_dfg.py --scale 1 8 32 --depth 2000
+'''
+import argparse
+import ast
+import os
+import sys
+import time
+
+from tree_sitter import Language, Parser
+
+sys.path.append('.')
+from parser_folder import (DFG_c, DFG_java, DFG_python,
+                           remove_comments_and_docstrings,
+                           tree_to_token_index,
+                           index_to_code_token)
+import dfg_recursive
+
+iterative_dfg = {'c': DFG_c, 'java': DFG_java, 'python': DFG_python}
+recursive_dfg = {'c': dfg_recursive.DFG_c, 'java': dfg_recursive.DFG_java, 'python': dfg_recursive.DFG_python}
+
+
+def load_samples():
+    # run_parser.py 中自带的示例代码. import run_parser 会加载 (或下载编译) tree-sitter, 这里直接读源码
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_parser.py')
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    samples = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name) \
+                and node.targets[0].id in ['c_code', 'java_code', 'python_code']:
+            samples[node.targets[0].id[:-len('_code')]] = ast.literal_eval(node.value)
+    return samples
+
+
+def nested_program(lang, depth):
+    '''
+    嵌套depth层if的函数, 用来检查递归深度
+    '''
+    if lang == 'python':
+        lines = ['def f(a):']
+        for i in range(depth):
+            lines.append('    ' * (i + 1) + 'if a > %d:' % i)
+        lines.append('    ' * (depth + 1) + 'a = a + 1')
+        lines.append('    return a')
+        return '\n'.join(lines) + '\n'
+    # c和java相同
+    body = 'if (a > 0) { ' * depth + 'a = a + 1; ' + '} ' * depth
+    return 'int f(int a) { %s return a; }' % body
+
+
+def prepare(parser, code, lang):
+    # 和 run_parser.extract_dataflow 相同的预处理
+    try:
+        code = remove_comments_and_docstrings(code, lang)
+    except:
+        pass
+    root_node = parser.parse(bytes(code, 'utf8')).root_node
+    tokens_index = tree_to_token_index(root_node)
+    lines = code.split('\n')
+    index_to_code = {}
+    for idx, index in enumerate(tokens_index):
+        index_to_code[index] = (idx, index_to_code_token(index, lines))
+    return root_node, index_to_code, len(tokens_index)
+
+
+def timeit(dfg_function, root_node, index_to_code, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        DFG, _ = dfg_function(root_node, index_to_code, {})
+    return DFG, (time.perf_counter() - start) / repeat * 1000
+
+
+def run_case(name, lang, parser, code, repeat):
+    root_node, index_to_code, nb_tokens = prepare(parser, code, lang)
+    new_dfg, new_time = timeit(iterative_dfg[lang], root_node, index_to_code, repeat)
+    try:
+        old_dfg, old_time = timeit(recursive_dfg[lang], root_node, index_to_code, repeat)
+    except RecursionError:
+        print("%-8s %-12s %7d tokens  recursive: RecursionError   iterative: %9.2f ms" % (lang, name, nb_tokens, new_time))
+        return
+    assert new_dfg == old_dfg, "DFG mismatch for %s %s" % (lang, name)
+    print("%-8s %-12s %7d tokens  recursive: %9.2f ms   iterative: %9.2f ms   x%.2f"
+          % (lang, name, nb_tokens, old_time, new_time, old_time / new_time))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--so_path", default="parser_folder/my-languages.so", type=str,
+                        help="Compiled tree-sitter languages (see parser_folder/build.sh).")
+    parser.add_argument("--langs", nargs='+', default=['c', 'java', 'python'], type=str)
+    parser.add_argument("--scale", nargs='+', default=[1, 8, 32], type=int,
+                        help="Number of copies of each sample program concatenated into one input.")
+    parser.add_argument("--depth", default=0, type=int,
+                        help="Also run a function with this many nested if statements (0 = skip).")
+    parser.add_argument("--repeat", default=5, type=int,
+                        help="Number of timed runs per case.")
+    args = parser.parse_args()
+
+    samples = load_samples()
+    for lang in args.langs:
+        ts_parser = Parser()
+        ts_parser.set_language(Language(args.so_path, lang))
+        for scale in args.scale:
+            code = '\n'.join([samples[lang]] * scale)
+            run_case('x%d' % scale, lang, ts_parser, code, args.repeat)
+        if args.depth > 0:
+            run_case('depth %d' % args.depth, lang, ts_parser, nested_program(lang, args.depth), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
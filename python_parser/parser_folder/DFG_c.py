@@ -5,9 +5,25 @@ from tree_sitter import Language, Parser
 from .utils import (remove_comments_and_docstrings,
                     tree_to_token_index,
                     index_to_code_token,
-                    tree_to_variable_index)
+                    tree_to_variable_index,
+                    walk_dfg)
 
-def DFG_c(root_node, index_to_code, states):
+def _DFG_c_leaf(root_node, index_to_code, states, parent):
+    idx, code = index_to_code[(root_node.start_point, root_node.end_point)]
+    if root_node.type == code or (parent.type == 'function_declarator' and root_node):
+        return [], states
+    elif code in states:
+        return [(code, idx, 'comesFrom', [code], states[code].copy())], states
+    elif root_node.type == 'identifier':
+        if parent.type == 'declaration':
+            states = {**states, code: [idx]}
+            return [(code,idx,'comesFrom',[],[])],states
+        return [], states
+    else:
+        return [], states
+
+
+def _DFG_c(root_node, index_to_code, states, parent):
     assignment = ['assignment_expression']
     def_statement = ['init_declatator', 'pointer_declarator', 'array_declarator']
     increment_statement = ['update_expression']
@@ -16,31 +32,17 @@ def DFG_c(root_node, index_to_code, states):
     while_statement = ['while_statement']
     parameter_statement = ['parameter_declaration']
     do_first_statement = []
-    states = states.copy()
-    if (len(root_node.children) == 0 or root_node.type == 'string') and root_node.type != 'comment':
-        idx, code = index_to_code[(root_node.start_point, root_node.end_point)]
-        if root_node.type == code or (root_node.parent.type == 'function_declarator' and root_node):
-            return [], states
-        elif code in states:
-            return [(code, idx, 'comesFrom', [code], states[code].copy())], states
-        elif root_node.type == 'identifier':
-            if root_node.parent.type == 'declaration':
-                states[code]=[idx]
-                return [(code,idx,'comesFrom',[],[])],states
-            return [], states
-        else:
-            return [], states
-    elif root_node.type in def_statement:
+    if root_node.type in def_statement:
 
-        if root_node.parent.type == 'function_definition':
+        if parent.type == 'function_definition':
             while root_node.type == 'pointer_declarator' and root_node.child_by_field_name('declarator').type == 'pointer_declarator':
                 root_node = root_node.child_by_field_name('declarator')
             DFG = []
             for child in root_node.children:
                 if child.type not in do_first_statement:
-                    temp, states = DFG_c(child, index_to_code, states)
+                    temp, states = (yield child, states, root_node)
                     DFG += temp
-            return sorted(DFG, key=lambda x: x[1]), states
+            return DFG, states
         name = root_node.child_by_field_name('declarator')
         value = root_node.child_by_field_name('value')
         DFG = []
@@ -49,20 +51,20 @@ def DFG_c(root_node, index_to_code, states):
             for index in indexs:
                 idx, code = index_to_code[index]
                 DFG.append((code, idx, 'comesFrom', [], []))
-                states[code] = [idx]
-            return sorted(DFG, key=lambda x: x[1]), states
+                states = {**states, code: [idx]}
+            return DFG, states
         else:
             name_indexs = tree_to_variable_index(name, index_to_code)
             value_indexs = tree_to_variable_index(value, index_to_code)
-            temp, states = DFG_c(value, index_to_code, states)
+            temp, states = (yield value, states)
             DFG += temp
             for index1 in name_indexs:
                 idx1, code1 = index_to_code[index1]
                 for index2 in value_indexs:
                     idx2, code2 = index_to_code[index2]
                     DFG.append((code1, idx1, 'comesFrom', [code2], [idx2]))
-                states[code1] = [idx1]
-            return sorted(DFG, key=lambda x: x[1]), states
+                states = {**states, code1: [idx1]}
+            return DFG, states
     elif root_node.type in assignment:
         # left_nodes = root_node.child_by_field_name('left')
         # right_nodes = root_node.child_by_field_name('right')
@@ -93,8 +95,8 @@ def DFG_c(root_node, index_to_code, states):
             for index2 in indexs:
                 idx2, code2 = index_to_code[index2]
                 DFG.append((code1, idx1, 'computedFrom', [code2], [idx2]))
-            states[code1] = [idx1]
-        return sorted(DFG, key=lambda x: x[1]), states
+            states = {**states, code1: [idx1]}
+        return DFG, states
     elif root_node.type in if_statement:
         DFG = []
         current_states = states.copy()
@@ -107,11 +109,11 @@ def DFG_c(root_node, index_to_code, states):
             if 'else' in child.type:
                 tag = True
             if child.type not in if_statement and flag is False:
-                temp, current_states = DFG_c(child, index_to_code, current_states)
+                temp, current_states = (yield child, current_states)
                 DFG += temp
             else:
                 flag = True
-                temp, new_states = DFG_c(child, index_to_code, states)
+                temp, new_states = (yield child, states)
                 DFG += temp
                 others_states.append(new_states)
         others_states.append(current_states)
@@ -131,16 +133,16 @@ def DFG_c(root_node, index_to_code, states):
                 new_states[key] += states[key]
         for key in new_states:
             new_states[key] = sorted(list(set(new_states[key])))
-        return sorted(DFG, key=lambda x: x[1]), new_states
+        return DFG, new_states
     elif root_node.type in for_statement:
         DFG = []
         for child in root_node.children:
-            temp, states = DFG_c(child, index_to_code, states)
+            temp, states = (yield child, states)
             DFG += temp
         flag = False
         for child in root_node.children:
             if flag:
-                temp, states = DFG_c(child, index_to_code, states)
+                temp, states = (yield child, states)
                 DFG += temp
             elif child.type == "variable_declaration":
                 flag = True
@@ -152,12 +154,12 @@ def DFG_c(root_node, index_to_code, states):
                 dic[(x[0], x[1], x[2])][0] = list(set(dic[(x[0], x[1], x[2])][0] + x[3]))
                 dic[(x[0], x[1], x[2])][1] = sorted(list(set(dic[(x[0], x[1], x[2])][1] + x[4])))
         DFG = [(x[0], x[1], x[2], y[0], y[1]) for x, y in sorted(dic.items(), key=lambda t: t[0][1])]
-        return sorted(DFG, key=lambda x: x[1]), states
+        return DFG, states
     elif root_node.type in while_statement:
         DFG = []
         for i in range(2):
             for child in root_node.children:
-                temp, states = DFG_c(child, index_to_code, states)
+                temp, states = (yield child, states)
                 DFG += temp
         dic = {}
         for x in DFG:
@@ -167,7 +169,7 @@ def DFG_c(root_node, index_to_code, states):
                 dic[(x[0], x[1], x[2])][0] = list(set(dic[(x[0], x[1], x[2])][0] + x[3]))
                 dic[(x[0], x[1], x[2])][1] = sorted(list(set(dic[(x[0], x[1], x[2])][1] + x[4])))
         DFG = [(x[0], x[1], x[2], y[0], y[1]) for x, y in sorted(dic.items(), key=lambda t: t[0][1])]
-        return sorted(DFG, key=lambda x: x[1]), states
+        return DFG, states
     elif root_node.type in parameter_statement:
         child = root_node.child_by_field_name('declarator')
         if not child:
@@ -180,12 +182,16 @@ def DFG_c(root_node, index_to_code, states):
             if not child:
                 return [], states
         idx,code=index_to_code[(child.start_point,child.end_point)]
-        states[code]=[idx]
+        states = {**states, code: [idx]}
         return [(code,idx,'comesFrom',[],[])],states
     else:
         DFG = []
         for child in root_node.children:
             if child.type not in do_first_statement:
-                temp, states = DFG_c(child, index_to_code, states)
+                temp, states = (yield child, states)
                 DFG += temp
-        return sorted(DFG, key=lambda x: x[1]), states
+        return DFG, states
+
+
+def DFG_c(root_node, index_to_code, states):
+    return walk_dfg(_DFG_c, _DFG_c_leaf, root_node, index_to_code, states)
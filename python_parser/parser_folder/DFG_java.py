@@ -5,9 +5,23 @@ from tree_sitter import Language, Parser
 from .utils import (remove_comments_and_docstrings,
                     tree_to_token_index,
                     index_to_code_token,
-                    tree_to_variable_index)
+                    tree_to_variable_index,
+                    walk_dfg)
 
-def DFG_java(root_node, index_to_code, states):
+def _DFG_java_leaf(root_node, index_to_code, states, parent):
+    idx, code = index_to_code[(root_node.start_point, root_node.end_point)]
+    if root_node.type == code or root_node.type == 'string':
+        return [], states
+    elif code in states:
+        return [(code, idx, 'comesFrom', [code], states[code].copy())], states
+    elif root_node.type == 'identifier' and parent.type == 'formal_parameter':
+        states = {**states, code: [idx]}
+        return [(code,idx,'comesFrom',[],[])],states
+    else:
+        return [], states
+
+
+def _DFG_java(root_node, index_to_code, states, parent):
     assignment = ['assignment_expression']
     def_statement = ['variable_declarator']
     increment_statement = ['update_expression']
@@ -16,19 +30,7 @@ def DFG_java(root_node, index_to_code, states):
     for_statement = ['for_statement']
     enhanced_for_statement = ['enhanced_for_statement']
     while_statement = ['while_statement']
-    states = states.copy()
-    if (len(root_node.children) == 0 or root_node.type == 'string') and root_node.type != 'comment':
-        idx, code = index_to_code[(root_node.start_point, root_node.end_point)]
-        if root_node.type == code or root_node.type == 'string':
-            return [], states
-        elif code in states:
-            return [(code, idx, 'comesFrom', [code], states[code].copy())], states
-        elif root_node.type == 'identifier' and root_node.parent.type == 'formal_parameter':
-            states[code]=[idx]
-            return [(code,idx,'comesFrom',[],[])],states
-        else:
-            return [], states
-    elif root_node.type in def_statement:
+    if root_node.type in def_statement:
         name = root_node.child_by_field_name('name')
         value = root_node.child_by_field_name('value')
         DFG = []
@@ -37,25 +39,25 @@ def DFG_java(root_node, index_to_code, states):
             for index in indexs:
                 idx, code = index_to_code[index]
                 DFG.append((code, idx, 'comesFrom', [], []))
-                states[code] = [idx]
-            return sorted(DFG, key=lambda x: x[1]), states
+                states = {**states, code: [idx]}
+            return DFG, states
         else:
             name_indexs = tree_to_variable_index(name, index_to_code)
             value_indexs = tree_to_variable_index(value, index_to_code)
-            temp, states = DFG_java(value, index_to_code, states)
+            temp, states = (yield value, states)
             DFG += temp
             for index1 in name_indexs:
                 idx1, code1 = index_to_code[index1]
                 for index2 in value_indexs:
                     idx2, code2 = index_to_code[index2]
                     DFG.append((code1, idx1, 'comesFrom', [code2], [idx2]))
-                states[code1] = [idx1]
-            return sorted(DFG, key=lambda x: x[1]), states
+                states = {**states, code1: [idx1]}
+            return DFG, states
     elif root_node.type in assignment:
         left_nodes = root_node.child_by_field_name('left')
         right_nodes = root_node.child_by_field_name('right')
         DFG = []
-        temp, states = DFG_java(right_nodes, index_to_code, states)
+        temp, states = (yield right_nodes, states)
         DFG += temp
         name_indexs = tree_to_variable_index(left_nodes, index_to_code)
         value_indexs = tree_to_variable_index(right_nodes, index_to_code)
@@ -64,8 +66,8 @@ def DFG_java(root_node, index_to_code, states):
             for index2 in value_indexs:
                 idx2, code2 = index_to_code[index2]
                 DFG.append((code1, idx1, 'computedFrom', [code2], [idx2]))
-            states[code1] = [idx1]
-        return sorted(DFG, key=lambda x: x[1]), states
+            states = {**states, code1: [idx1]}
+        return DFG, states
     elif root_node.type in increment_statement:
         DFG = []
         indexs = tree_to_variable_index(root_node, index_to_code)
@@ -74,8 +76,8 @@ def DFG_java(root_node, index_to_code, states):
             for index2 in indexs:
                 idx2, code2 = index_to_code[index2]
                 DFG.append((code1, idx1, 'computedFrom', [code2], [idx2]))
-            states[code1] = [idx1]
-        return sorted(DFG, key=lambda x: x[1]), states
+            states = {**states, code1: [idx1]}
+        return DFG, states
     elif root_node.type in if_statement:
         DFG = []
         current_states = states.copy()
@@ -88,11 +90,11 @@ def DFG_java(root_node, index_to_code, states):
             if 'else' in child.type:
                 tag = True
             if child.type not in if_statement and flag is False:
-                temp, current_states = DFG_java(child, index_to_code, current_states)
+                temp, current_states = (yield child, current_states)
                 DFG += temp
             else:
                 flag = True
-                temp, new_states = DFG_java(child, index_to_code, states)
+                temp, new_states = (yield child, states)
                 DFG += temp
                 others_states.append(new_states)
         others_states.append(current_states)
@@ -107,16 +109,16 @@ def DFG_java(root_node, index_to_code, states):
                     new_states[key] += dic[key]
         for key in new_states:
             new_states[key] = sorted(list(set(new_states[key])))
-        return sorted(DFG, key=lambda x: x[1]), new_states
+        return DFG, new_states
     elif root_node.type in for_statement:
         DFG = []
         for child in root_node.children:
-            temp, states = DFG_java(child, index_to_code, states)
+            temp, states = (yield child, states)
             DFG += temp
         flag = False
         for child in root_node.children:
             if flag:
-                temp, states = DFG_java(child, index_to_code, states)
+                temp, states = (yield child, states)
                 DFG += temp
             elif child.type == "local_variable_declaration":
                 flag = True
@@ -128,14 +130,14 @@ def DFG_java(root_node, index_to_code, states):
                 dic[(x[0], x[1], x[2])][0] = list(set(dic[(x[0], x[1], x[2])][0] + x[3]))
                 dic[(x[0], x[1], x[2])][1] = sorted(list(set(dic[(x[0], x[1], x[2])][1] + x[4])))
         DFG = [(x[0], x[1], x[2], y[0], y[1]) for x, y in sorted(dic.items(), key=lambda t: t[0][1])]
-        return sorted(DFG, key=lambda x: x[1]), states
+        return DFG, states
     elif root_node.type in enhanced_for_statement:
         name = root_node.child_by_field_name('name')
         value = root_node.child_by_field_name('value')
         body = root_node.child_by_field_name('body')
         DFG = []
         for i in range(2):
-            temp, states = DFG_java(value, index_to_code, states)
+            temp, states = (yield value, states)
             DFG += temp
             name_indexs = tree_to_variable_index(name, index_to_code)
             value_indexs = tree_to_variable_index(value, index_to_code)
@@ -144,8 +146,8 @@ def DFG_java(root_node, index_to_code, states):
                 for index2 in value_indexs:
                     idx2, code2 = index_to_code[index2]
                     DFG.append((code1, idx1, 'computedFrom', [code2], [idx2]))
-                states[code1] = [idx1]
-            temp, states = DFG_java(body, index_to_code, states)
+                states = {**states, code1: [idx1]}
+            temp, states = (yield body, states)
             DFG += temp
         dic = {}
         for x in DFG:
@@ -155,12 +157,12 @@ def DFG_java(root_node, index_to_code, states):
                 dic[(x[0], x[1], x[2])][0] = list(set(dic[(x[0], x[1], x[2])][0] + x[3]))
                 dic[(x[0], x[1], x[2])][1] = sorted(list(set(dic[(x[0], x[1], x[2])][1] + x[4])))
         DFG = [(x[0], x[1], x[2], y[0], y[1]) for x, y in sorted(dic.items(), key=lambda t: t[0][1])]
-        return sorted(DFG, key=lambda x: x[1]), states
+        return DFG, states
     elif root_node.type in while_statement:
         DFG = []
         for i in range(2):
             for child in root_node.children:
-                temp, states = DFG_java(child, index_to_code, states)
+                temp, states = (yield child, states)
                 DFG += temp
         dic = {}
         for x in DFG:
@@ -170,22 +172,24 @@ def DFG_java(root_node, index_to_code, states):
                 dic[(x[0], x[1], x[2])][0] = list(set(dic[(x[0], x[1], x[2])][0] + x[3]))
                 dic[(x[0], x[1], x[2])][1] = sorted(list(set(dic[(x[0], x[1], x[2])][1] + x[4])))
         DFG = [(x[0], x[1], x[2], y[0], y[1]) for x, y in sorted(dic.items(), key=lambda t: t[0][1])]
-        return sorted(DFG, key=lambda x: x[1]), states
+        return DFG, states
     elif root_node.type in method_expression and root_node.child_by_field_name('object') is not None:
         DFG = []
         obj_node = root_node.child_by_field_name('object')
         arg_node = root_node.child_by_field_name('arguments')
-        temp, states = DFG_java(obj_node, index_to_code, states)
+        temp, states = (yield obj_node, states)
         DFG += temp
-        temp, states = DFG_java(arg_node, index_to_code, states)
+        temp, states = (yield arg_node, states)
         DFG += temp
-        return sorted(DFG, key=lambda x: x[1]), states
+        return DFG, states
 
     else:
         DFG = []
         for child in root_node.children:
-            temp, states = DFG_java(child, index_to_code, states)
+            temp, states = (yield child, states)
             DFG += temp
-        return sorted(DFG, key=lambda x: x[1]), states
+        return DFG, states
 
 
+def DFG_java(root_node, index_to_code, states):
+    return walk_dfg(_DFG_java, _DFG_java_leaf, root_node, index_to_code, states)
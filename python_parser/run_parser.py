@@ -9,7 +9,15 @@ from parser_folder import (remove_comments_and_docstrings,
                            tree_to_token_index,
                            index_to_code_token,)
 from tree_sitter import Language, Parser
+from functools import lru_cache
+from collections import OrderedDict
+import hashlib
+import json
 import os
+import pickle
+import re
+import sqlite3
+import threading
 sys.path.append('..')
 sys.path.append('../../../')
 
@@ -87,29 +95,18 @@ special_char = ['[', ']', ':', ',', '.', '(', ')', '{', '}', 'not', 'is', '=', "
                 '|']
 
 from keyword import iskeyword
+# 每种语言不能用作变量名的标识符 (集合查找, 不用在几百个元素的list里线性查找)
+java_reserved = frozenset(java_keywords + java_special_ids)
+c_reserved = frozenset(c_keywords + c_macros + c_special_ids)
+
 def is_valid_variable_python(name: str) -> bool:
     return name.isidentifier() and not iskeyword(name)
 
 def is_valid_variable_java(name: str) -> bool:
-    if not name.isidentifier():
-        return False
-    elif name in java_keywords:
-        return False
-    elif name in java_special_ids:
-        return False
-    return True
+    return name.isidentifier() and name not in java_reserved
 
 def is_valid_variable_c(name: str) -> bool:
-
-    if not name.isidentifier():
-        return False
-    elif name in c_keywords:
-        return False
-    elif name in c_macros:
-        return False
-    elif name in c_special_ids:
-        return False
-    return True
+    return name.isidentifier() and name not in c_reserved
 
 def is_valid_variable_name(name: str, lang: str) -> bool:
     # check if matches language keywords
@@ -187,9 +184,130 @@ def get_code_tokens(code, lang):
     code_tokens = [x + '\\n' for x in code if x ]
     return code_tokens
 
-def extract_dataflow(code, lang):
-    parser = parsers[lang]
+class ParseCache():
+    '''
+    (parser版本, lang, kind, sha1(code)) -> 解析结果 (dataflow, identifiers, token位置).
+    前面是进程内的LRU, 后面是一个sqlite文件; 语料解析过一次之后,
+    get_substitutes / 各个attack / process.py 再运行都不用调用tree-sitter.
+    db_path为None时只用内存. attack时才出现的代码 (候选, mask之后的变体) 用persist=False,
+    只放在LRU中, 不写入sqlite.
+    '''
+    def __init__(self, db_path=None, maxsize=4096) -> None:
+        self.db_path = db_path
+        self.maxsize = maxsize
+        # 存pickle后的bytes, 每次get都得到新的对象, 调用方修改返回值不会污染缓存
+        self.lru = OrderedDict()
+        # 只在LRU中, 没有写入sqlite的key
+        self.unsaved = set()
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def connect(self):
+        # sqlite连接不能跨进程使用, AttackScheduler的每个worker各自打开
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS parses (key TEXT PRIMARY KEY, value BLOB)')
+            self.pid = os.getpid()
+        return self.conn
+
+    @staticmethod
+    def key(kind, code, lang):
+        return "%s:%s:%s:%s" % (PARSER_VERSION, lang, kind, hashlib.sha1(code.encode('utf8')).hexdigest())
+
+    def remember(self, key, blob):
+        self.lru[key] = blob
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.maxsize:
+            self.unsaved.discard(self.lru.popitem(last=False)[0])
+
+    def get(self, key):
+        with self.lock:
+            blob = self.lru.get(key)
+            if blob is not None:
+                self.lru.move_to_end(key)
+            elif self.db_path is not None:
+                row = self.connect().execute('SELECT value FROM parses WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    blob = row[0]
+                    self.remember(key, blob)
+        if blob is None:
+            return None
+        return pickle.loads(blob)
+
+    def put_many(self, items, persist=True):
+        '''
+        items: [(key, value), ...], 一个事务写入; persist=False时只放在LRU中
+        '''
+        rows = [(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)) for key, value in items]
+        with self.lock:
+            for key, blob in rows:
+                self.remember(key, blob)
+                if persist:
+                    self.unsaved.discard(key)
+                else:
+                    self.unsaved.add(key)
+            if persist and self.db_path is not None:
+                conn = self.connect()
+                with conn:
+                    conn.executemany('INSERT OR REPLACE INTO parses (key, value) VALUES (?, ?)', rows)
+
+    def put(self, key, value, persist=True):
+        self.put_many([(key, value)], persist)
+
+    def lookup(self, kind, code, lang, compute, persist=True):
+        key = self.key(kind, code, lang)
+        value = self.get(key)
+        if value is None:
+            value = compute(code, lang)
+            self.put(key, value, persist)
+        elif persist and key in self.unsaved:
+            # 之前作为attack时的代码只放在了内存中
+            self.put(key, value)
+        return value
+
+    def prune(self):
+        '''
+        删除其他parser版本写入的条目
+        '''
+        if self.db_path is None:
+            return 0
+        with self.lock:
+            conn = self.connect()
+            with conn:
+                return conn.execute("DELETE FROM parses WHERE substr(key, 1, ?) != ?",
+                                    (len(PARSER_VERSION) + 1, PARSER_VERSION + ':')).rowcount
+
+
+def get_parser_version():
+    '''
+    解析结果依赖的代码 (本文件, parser_folder中的DFG和工具函数) 和tree-sitter语法库的hash.
+    它们改变之后 (比如修改了DFG_c), 缓存中之前的结果不再使用.
+    '''
+    digest = hashlib.sha1()
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_folder')
+    sources = [os.path.abspath(__file__), path] + \
+              [os.path.join(folder, name) for name in ['__init__.py', 'utils.py', 'DFG_c.py', 'DFG_java.py', 'DFG_python.py']]
+    for source in sources:
+        with open(source, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+# PARSE_CACHE_PATH="" 关闭磁盘缓存
+PARSE_CACHE_PATH = os.environ.get('PARSE_CACHE_PATH',
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parse_cache.db'))
+PARSER_VERSION = get_parser_version()
+parse_cache = ParseCache(PARSE_CACHE_PATH or None)
+
+
+def extract_dataflow(code, lang, persist=True):
     code = code.replace("\\n", "\n")
+    return parse_cache.lookup('dataflow', code, lang, _extract_dataflow, persist)
+
+def _extract_dataflow(code, lang):
+    parser = parsers[lang]
     # remove comments
     try:
         code = remove_comments_and_docstrings(code, lang)
@@ -215,76 +333,230 @@ def extract_dataflow(code, lang):
     DFG = sorted(DFG, key=lambda x: x[1])
     return DFG, index_table, code_tokens
 
-def get_example(code, tgt_word, substitute, lang):
-    parser = parsers[lang]
-    code = code.replace("\\n", "\n")
+class RenamableProgram():
+    '''
+    一个代码片段只parse一次. 预先记录每个token在源码中的偏移,
+    之后的所有重命名都直接在原始字符串上拼接, 不再调用tree-sitter.
+    '''
+    def __init__(self, code, lang, persist=True) -> None:
+        self.code = code.replace("\\n", "\n")
+        # {token: [(start, end), ...]}
+        self.positions = parse_cache.lookup('positions', self.code, lang, get_token_positions, persist)
+
+    def rename(self, chromesome):
+        '''
+        chromesome: {tgt_word: substitute, ...}, 返回替换之后的代码
+        '''
+        spans = []
+        for tgt_word, substitute in chromesome.items():
+            if tgt_word == substitute:
+                continue
+            for start, end in self.positions.get(tgt_word, []):
+                spans.append((start, end, substitute))
+        if len(spans) == 0:
+            return self.code
+        spans.sort()
+        pieces = []
+        last = 0
+        for start, end, substitute in spans:
+            pieces.append(self.code[last:start])
+            pieces.append(substitute)
+            last = end
+        pieces.append(self.code[last:])
+        return "".join(pieces)
+
+    def rename_batch(self, chromesomes):
+        return [self.rename(chromesome) for chromesome in chromesomes]
+
+
+def get_token_positions(code, lang):
     parser = parsers[lang]
     tree = parser[0].parse(bytes(code, 'utf8'))
-    root_node = tree.root_node
-    tokens_index = tree_to_token_index(root_node)
-    code = code.split('\n')
-    code_tokens = [index_to_code_token(x, code) for x in tokens_index]
-    replace_pos = {}
-    for index, code_token in enumerate(code_tokens):
-        if code_token == tgt_word:
-            try:
-                replace_pos[tokens_index[index][0][0]].append((tokens_index[index][0][1], tokens_index[index][1][1]))
-            except:
-                replace_pos[tokens_index[index][0][0]] = [(tokens_index[index][0][1], tokens_index[index][1][1])]
-    diff = len(substitute) - len(tgt_word)
-    for line in replace_pos.keys():
-        for index, pos in enumerate(replace_pos[line]):
-            code[line] = code[line][:pos[0]+index*diff] + substitute + code[line][pos[1]+index*diff:]
-
-    return "\n".join(code)
-
-
-def get_example_batch(code, chromesome, lang):
-    parser = parsers[lang]
+    tokens_index = tree_to_token_index(tree.root_node)
+    lines = code.split('\n')
+    code_tokens = [index_to_code_token(x, lines) for x in tokens_index]
+    # 每一行在整个字符串中的起始位置
+    line_starts = [0]
+    for line in lines[:-1]:
+        line_starts.append(line_starts[-1] + len(line) + 1)
+    positions = {}
+    for index, code_token in zip(tokens_index, code_tokens):
+        # 跨行的token (如多行字符串) 不会是变量名
+        if index[0][0] != index[1][0]:
+            continue
+        start = line_starts[index[0][0]] + index[0][1]
+        end = line_starts[index[1][0]] + index[1][1]
+        positions.setdefault(code_token, []).append((start, end))
+    return positions
+
+
+@lru_cache(maxsize=256)
+def get_renamable_program(code, lang, persist=True):
+    # 同一段代码会被替换很多次 (每个变量 x 每个substitute), 缓存parse的结果
+    return RenamableProgram(code, lang, persist)
+
+
+def get_example(code, tgt_word, substitute, lang, persist=True):
+    '''
+    persist=False: code是attack过程中得到的代码 (不是数据集中的), 它的解析结果不写入磁盘缓存
+    '''
+    return get_renamable_program(code, lang, persist).rename({tgt_word: substitute})
+
+
+def get_example_batch(code, chromesome, lang, persist=True):
+    return get_renamable_program(code, lang, persist).rename(chromesome)
+
+
+def has_syntax_error(code, lang, persist=True):
     code = code.replace("\\n", "\n")
-    parser = parsers[lang]
-    tree = parser[0].parse(bytes(code, 'utf8'))
-    root_node = tree.root_node
-    tokens_index = tree_to_token_index(root_node)
-    code = code.split('\n')
-    code_tokens = [index_to_code_token(x, code) for x in tokens_index]
-    replace_pos = {}
-    for tgt_word in chromesome.keys():
-        diff = len(chromesome[tgt_word]) - len(tgt_word)
-        for index, code_token in enumerate(code_tokens):
-            if code_token == tgt_word:
-                try:
-                    replace_pos[tokens_index[index][0][0]].append((tgt_word, chromesome[tgt_word], diff, tokens_index[index][0][1], tokens_index[index][1][1]))
-                except:
-                    replace_pos[tokens_index[index][0][0]] = [(tgt_word, chromesome[tgt_word], diff, tokens_index[index][0][1], tokens_index[index][1][1])]
-    for line in replace_pos.keys():
-        diff = 0
-        for index, pos in enumerate(replace_pos[line]):
-            code[line] = code[line][:pos[3]+diff] + pos[1] + code[line][pos[4]+diff:]
-            diff += pos[2]
-
-    return "\n".join(code)
+    return parse_cache.lookup('error', code, lang, _has_syntax_error, persist)
+
+def _has_syntax_error(code, lang):
+    # 和 _extract_dataflow 相同的预处理
+    try:
+        code = remove_comments_and_docstrings(code, lang)
+    except:
+        pass
+    return parsers[lang][0].parse(bytes(code, 'utf8')).root_node.has_error
+
+
+# NAME出现在声明, 赋值, 表达式, 函数调用和成员访问的位置上
+RENAME_PROBES = {
+    'c': 'int f(int NAME) {\n    int NAME = NAME;\n    NAME = NAME + NAME;\n    NAME(NAME);\n    s.NAME = s->NAME;\n    return NAME;\n}\n',
+    'java': 'class A {\n    int NAME;\n    void f(int NAME) {\n        int NAME = NAME;\n        NAME = NAME + NAME;\n        NAME(NAME);\n        this.NAME = a.NAME;\n    }\n}\n',
+    'python': 'def f(NAME):\n    NAME = NAME + NAME\n    NAME(NAME)\n    a.NAME = NAME\n    return NAME\n',
+}
+
+@lru_cache(maxsize=65536)
+def is_renamable_name(name, lang):
+    '''
+    name在RENAME_PROBES的每个位置上都被parse成identifier叶子结点 (不是关键字, 也不会改变语法树).
+    对没有语法错误的程序, 把一个这样的变量名换成另一个这样的名字, 语法树的形状不变,
+    DFG也只有其中的变量名改变.
+    '''
+    # index_to_code_token按字节的列号切分字符串, 非ASCII的名字会改变同一行之后的token
+    if not (name.isidentifier() and name.isascii()):
+        return False
+    probe = RENAME_PROBES[lang].replace('NAME', name)
+    source = bytes(probe, 'utf8')
+    root_node = parsers[lang][0].parse(source).root_node
+    if root_node.has_error:
+        return False
+    occurrences = 0
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        if node.child_count > 0:
+            stack.extend(node.children)
+        elif source[node.start_byte:node.end_byte].decode('utf8') == name:
+            if node.type == name or not node.type.endswith('identifier'):
+                return False
+            occurrences += 1
+    return occurrences == len(re.findall(r'(?<!\w)%s(?!\w)' % re.escape(name), probe))
 
 def unique(sequence):
     seen = set()
     return [x for x in sequence if not (x in seen or seen.add(x))]
 
 def get_identifiers(code, lang):
+    code = code.replace("\\n", "\n")
+    return parse_cache.lookup('identifiers', code, lang, _get_identifiers)
 
+def _get_identifiers(code, lang):
     dfg, index_table, code_tokens = extract_dataflow(code, lang)
+    return dataflow_identifiers(dfg, lang), code_tokens
+
+def dataflow_identifiers(dfg, lang):
     ret = []
     for d in dfg:
         if is_valid_variable_name(d[0], lang):
             ret.append(d[0])
     ret = unique(ret)
     ret = [ [i] for i in ret]
-    return ret, code_tokens
+    return ret
+
+def parse_all(code, lang):
+    '''
+    warm_up用: 一段代码在缓存中的所有条目
+    '''
+    code = code.replace("\\n", "\n")
+    items = []
+    variants = [code]
+    try:
+        # get_substitutes.py 会先去掉注释再取identifiers
+        stripped = remove_comments_and_docstrings(code, lang)
+        if stripped != code:
+            variants.append(stripped)
+    except:
+        pass
+    for variant in variants:
+        dataflow = _extract_dataflow(variant, lang)
+        items.append((ParseCache.key('dataflow', variant, lang), dataflow))
+        items.append((ParseCache.key('identifiers', variant, lang), (dataflow_identifiers(dataflow[0], lang), dataflow[2])))
+    items.append((ParseCache.key('positions', code, lang), get_token_positions(code, lang)))
+    return items
+
+def _parse_all(task):
+    return parse_all(*task)
+
+def read_codes(file_path, field):
+    '''
+    jsonl文件取field字段; 其他文本文件 (Authorship-Attribution的txt) 每行取 <CODESPLIT> 之前的部分
+    '''
+    codes = []
+    with open(file_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if file_path.endswith('.jsonl'):
+                codes.append(json.loads(line)[field])
+            else:
+                codes.append(line.split(' <CODESPLIT> ')[0])
+    return codes
+
+def warm_up(file_paths, lang, field='func', nb_workers=1, chunk_size=256):
+    '''
+    把一批数据文件中的代码全部解析一遍, 写入parse_cache
+    '''
+    codes = []
+    for file_path in file_paths:
+        codes += read_codes(file_path, field)
+    todo = [code for code in unique(codes)
+            if parse_cache.get(ParseCache.key('positions', code.replace("\\n", "\n"), lang)) is None]
+    print("%d codes, %d not cached yet, %d stale entries removed" % (len(codes), len(todo), parse_cache.prune()))
+    if nb_workers > 1:
+        from multiprocessing import Pool
+        pool = Pool(nb_workers)
+        results = pool.imap(_parse_all, [(code, lang) for code in todo], chunksize=16)
+    else:
+        pool = None
+        results = (parse_all(code, lang) for code in todo)
+    items = []
+    for done, result in enumerate(results, 1):
+        items += result
+        if len(items) >= chunk_size or done == len(todo):
+            parse_cache.put_many(items)
+            items = []
+            print("\r%d / %d" % (done, len(todo)), end='')
+    print()
+    if pool is not None:
+        pool.close()
+        pool.join()
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--lang", default=None, type=str,
                         help="language.")
+    parser.add_argument("--warm_up", nargs='+', default=None, type=str,
+                        help="Parse every code snippet in these data files into the parse cache.")
+    parser.add_argument("--field", default="func", type=str,
+                        help="Key of the code in jsonl data files (func / code).")
+    parser.add_argument("--nb_workers", default=1, type=int,
+                        help="Number of processes used by --warm_up.")
     args = parser.parse_args()
+    if args.warm_up is not None:
+        warm_up(args.warm_up, args.lang, args.field, args.nb_workers)
+        return
     code = codes[args.lang]
     data, _ = get_identifiers(code, args.lang)
     code_ = get_example(java_code, "inChannel", "dwad", "java")
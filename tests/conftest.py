@@ -0,0 +1,14 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LANGUAGE_LIB = os.path.join(ROOT, 'python_parser', 'parser_folder', 'my-languages.so')
+# 没有build tree-sitter (见README) 时跳过, 不在测试中clone和编译
+HAVE_PARSER = os.path.exists(LANGUAGE_LIB)
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'python_parser'))
+# 测试中不读写磁盘上的parse cache
+os.environ.setdefault('PARSE_CACHE_PATH', '')
+# run_parser按相对路径 ../../../python_parser/parser_folder 加载tree-sitter, 和attack脚本一样在code目录中运行
+os.chdir(os.path.join(ROOT, 'CodeXGLUE', 'Defect-detection', 'code'))
@@ -0,0 +1,96 @@
+import json
+import logging
+import random
+
+import pytest
+
+from conftest import HAVE_PARSER
+
+if not HAVE_PARSER:
+    pytest.skip('tree-sitter library is not built', allow_module_level=True)
+
+from tokenizers import Tokenizer, models, pre_tokenizers, trainers
+from transformers import RobertaTokenizer
+from run_parser import get_identifiers
+from utils import CodeFeatureTemplate, map_chromesome
+
+PROGRAMS = {
+    'c': [
+        '''static int sum_values(const int *values, int count, int start)
+        {
+            int total = start;
+            for (int i = 0; i < count; i++) {
+                total += values[i];
+            }
+            if (total > 10) { total = total - 1; }
+            return total;
+        }''',
+        '''int copy_buffer(char *dst, const char *src, int len) {
+            int n=0; char c;
+            while (n<len&&(c=src[n])!='\\0') { dst[n]=c; n++; }
+            dst[n] = 0; /* terminé */ printf("copié: %d\\n", n);
+            return n;
+        }''',
+    ],
+    'python': [
+        '''def count_words(text, minimum=1):
+    counts = {}
+    for word in text.split():
+        counts[word] = counts.get(word, 0) + 1
+    result = [w for w, n in counts.items() if n >= minimum]
+    return sorted(result)
+''',
+        '''def déjà_vu(entrée, n):
+    total = 0
+    for i in range(n):
+        total += len(entrée) * i  # compte les caractères
+    return total
+''',
+    ],
+}
+SUBSTITUTES = ['a', 'x1', 'value', 'tmp_', 'result', 'n', 'total', 'z', '_', 'é', 'données']
+
+
+def trained_tokenizer(tmp_path, add_prefix_space=False):
+    # 在测试程序上训练一个小的byte-level BPE, 不需要下载预训练的tokenizer
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    trainer = trainers.BpeTrainer(vocab_size=400, special_tokens=['<s>', '<pad>', '</s>', '<unk>', '<mask>'],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator([code for codes in PROGRAMS.values() for code in codes], trainer)
+    model = json.loads(tokenizer.to_str())['model']
+    merges = [x if isinstance(x, str) else ' '.join(x) for x in model['merges']]
+    (tmp_path / 'vocab.json').write_text(json.dumps(model['vocab']))
+    (tmp_path / 'merges.txt').write_text('#version: 0.2\n' + '\n'.join(merges) + '\n')
+    return RobertaTokenizer(str(tmp_path / 'vocab.json'), str(tmp_path / 'merges.txt'), add_prefix_space=add_prefix_space)
+
+
+@pytest.mark.parametrize('lang,normalize', [('c', True), ('python', False)])
+def test_incremental_tokenize_matches_full(tmp_path, lang, normalize):
+    tokenizer = trained_tokenizer(tmp_path)
+    rng = random.Random(0)
+    for program in PROGRAMS[lang]:
+        template = CodeFeatureTemplate(program, tokenizer, lang, normalize)
+        assert template.enabled
+        names = [x[0] if isinstance(x, list) else x for x in get_identifiers(program, lang)[0]]
+        for _ in range(60):
+            chromesome = {name: rng.choice(SUBSTITUTES + names) for name in rng.sample(names, rng.randint(1, min(3, len(names))))}
+            max_length = rng.choice([None, 200, 30, 3])
+            result = template.tokenize(chromesome, max_length)
+            # None表示调用者完整地重新tokenize: 这些替换都应该走增量的路径
+            assert result is not None, chromesome
+            code = map_chromesome(chromesome, program, lang)
+            if normalize:
+                code = ' '.join(code.split())
+            tokens = tokenizer.tokenize(code)[:max_length]
+            assert result == (tokens, tokenizer.convert_tokens_to_ids(tokens)), chromesome
+
+
+def test_unsupported_tokenizer_warns_once(tmp_path, caplog):
+    tokenizer = trained_tokenizer(tmp_path, add_prefix_space=True)
+    program = PROGRAMS['python'][0]
+    with caplog.at_level(logging.WARNING, logger='utils'):
+        templates = [CodeFeatureTemplate(program, tokenizer, 'python') for _ in range(3)]
+    assert all(template.backend is None for template in templates)
+    assert templates[0].rename({'counts': 'x'}, 64) is None
+    assert len([r for r in caplog.records if 'incremental tokenization' in r.getMessage()]) == 1
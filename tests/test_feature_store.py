@@ -0,0 +1,51 @@
+import multiprocessing
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import HAVE_PARSER
+
+if not HAVE_PARSER:
+    pytest.skip('tree-sitter library is not built', allow_module_level=True)
+
+from utils import FeatureStore
+
+
+def make_examples(n, seed=0):
+    return [SimpleNamespace(input_tokens=['<s>', 'tok%d' % i, '</s>'], input_ids=[seed, i, i + 1, 2],
+                            dfg_to_code=[(i, i + 1)] * (i % 3), label=i % 2) for i in range(n)]
+
+
+def rows(store):
+    return [(x.input_tokens, list(x.input_ids), [list(y) for y in x.dfg_to_code], x.label) for x in store]
+
+
+def save_in_worker(cache_file_path, seed, results):
+    store = FeatureStore.save(cache_file_path, make_examples(2000, seed))
+    results.put(rows(store))
+
+
+def test_concurrent_saves_keep_one_store(tmp_path):
+    cache_file_path = str(tmp_path / 'cached_test')
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    workers = [ctx.Process(target=save_in_worker, args=(cache_file_path, seed, results)) for seed in range(4)]
+    for p in workers:
+        p.start()
+    stores = [results.get(timeout=60) for _ in workers]
+    for p in workers:
+        p.join()
+    assert all(p.exitcode == 0 for p in workers)
+    # 所有worker都打开同一个 (第一个写完的) store
+    assert all(store == stores[0] for store in stores)
+    assert stores[0] == rows(FeatureStore.load(cache_file_path))
+    assert sorted(os.listdir(tmp_path)) == ['cached_test.features', 'cached_test.features.lock']
+
+
+def test_save_does_not_replace_an_open_store(tmp_path):
+    cache_file_path = str(tmp_path / 'cached_test')
+    store = FeatureStore.save(cache_file_path, make_examples(10, 1))
+    expected = rows(store)
+    other = FeatureStore.save(cache_file_path, make_examples(5, 2))
+    assert rows(store) == expected and rows(other) == expected
@@ -0,0 +1,82 @@
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import HAVE_PARSER
+
+if not HAVE_PARSER:
+    pytest.skip('tree-sitter library is not built', allow_module_level=True)
+
+from transformers import RobertaTokenizer
+from run_parser import extract_dataflow, get_identifiers
+from utils import build_graph_features, code_token_pieces, get_graph_feature_template, map_chromesome
+
+PROGRAMS = [
+    '''public static int sum(int[] values, int start) {
+        int total = start;
+        for (int i = 0; i < values.length; i++) {
+            total += values[i];
+        }
+        if (total > 10) { total = total - 1; }
+        return total;
+    }''',
+    '''public void copy(File source, File target) throws IOException {
+        FileChannel in = new FileInputStream(source).getChannel();
+        FileChannel out = new FileOutputStream(target).getChannel();
+        try { in.transferTo(0, in.size(), out); } finally { in.close(); out.close(); }
+    }''',
+    # 非ASCII字符后面同一行的token, 按字节列号切分时会被截错
+    '''public String connect(String host, int port) {
+        String message = "réseau"; String texteErreur = host + port;
+        if (port < 0) { texteErreur = message + "échec: " + texteErreur; }
+        return texteErreur;
+    }''',
+    '''public int scale(int n, int m) {
+        String unit = "mètre"; int k=n+m; int q=k*n-m;
+        if (q>k) { q=q-k; } String label = "déjà vu"+q+n;
+        return q+k;
+    }''',
+    '''public int count(String text) {
+        int n = 0; // compte les caractères spéciaux
+        for (char c : text.toCharArray()) { if (c == 'é') { n = n + 1; } }
+        return n;
+    }''',
+]
+SUBSTITUTES = ['a', 'x1', 'value', 'tmp_', 'result', 'n', 'total', 'host', 'z']
+
+
+def byte_level_tokenizer(tmp_path):
+    # 只有单个字节的byte-level BPE (没有merge), 不需要下载预训练的tokenizer
+    bs = list(range(ord('!'), ord('~') + 1)) + list(range(ord('¡'), ord('¬') + 1)) + list(range(ord('®'), ord('ÿ') + 1))
+    chars = [chr(b) for b in bs] + [chr(256 + n) for n in range(256 - len(bs))]
+    vocab = {token: i for i, token in enumerate(['<s>', '<pad>', '</s>', '<unk>'] + chars + ['<mask>'])}
+    (tmp_path / 'vocab.json').write_text(json.dumps(vocab))
+    (tmp_path / 'merges.txt').write_text('#version: 0.2\n')
+    return RobertaTokenizer(str(tmp_path / 'vocab.json'), str(tmp_path / 'merges.txt'))
+
+
+def full_features(code, tokenizer, args):
+    dfg, index_table, code_tokens = extract_dataflow(code, 'java')
+    return build_graph_features(code_token_pieces(code_tokens, tokenizer), dfg, tokenizer, args)
+
+
+@pytest.mark.parametrize('code_length,data_flow_length', [(256, 64), (48, 16)])
+def test_template_matches_full_conversion(tmp_path, code_length, data_flow_length):
+    tokenizer = byte_level_tokenizer(tmp_path)
+    args = SimpleNamespace(code_length=code_length, data_flow_length=data_flow_length)
+    rng = random.Random(0)
+    incremental = 0
+    for program in PROGRAMS:
+        template = get_graph_feature_template(map_chromesome({}, program, 'java'), tokenizer, 'java')
+        assert template.renamable == program.isascii()
+        names = [x[0] for x in get_identifiers(program, 'java')[0]]
+        for _ in range(60):
+            chromesome = {name: rng.choice(SUBSTITUTES + names) for name in rng.sample(names, rng.randint(1, min(3, len(names))))}
+            features = template.rename(chromesome, args)
+            if features is None:
+                continue
+            incremental += 1
+            assert features == full_features(map_chromesome(chromesome, program, 'java'), tokenizer, args), chromesome
+    assert incremental > 0
@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+from conftest import HAVE_PARSER
+
+if not HAVE_PARSER:
+    pytest.skip('tree-sitter library is not built', allow_module_level=True)
+
+import python_parser.run_parser
+import run_parser
+from run_parser import ParseCache
+from test_graph_features import byte_level_tokenizer
+from utils import CodeFeatureTemplate, get_graph_feature_template, map_chromesome
+
+
+def count_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute('SELECT COUNT(*) FROM parses').fetchone()[0]
+
+
+def test_attack_time_parses_are_not_written_to_disk(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'parse_cache.db')
+    cache = ParseCache(db_path)
+    monkeypatch.setattr(run_parser, 'parse_cache', cache)
+    code = 'int f(int a) {\n    int b = a + 1;\n    return b;\n}\n'
+
+    candidate = run_parser.extract_dataflow(code.replace('b', 'c'), 'c', persist=False)
+    assert count_rows(db_path) == 0
+    # 仍然在进程内的LRU中
+    assert run_parser.extract_dataflow(code.replace('b', 'c'), 'c', persist=False) == candidate
+
+    run_parser.get_identifiers(code, 'c')
+    run_parser.get_example(code, 'b', 'c', 'c', persist=False)
+    assert count_rows(db_path) == 2
+    run_parser.get_example(code, 'a', 'x', 'c')
+    assert count_rows(db_path) == 3
+    assert ParseCache(db_path).get(ParseCache.key('positions', code, 'c')) is not None
+
+
+def test_greedy_step_does_not_write_intermediate_programs(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'parse_cache.db')
+    cache = ParseCache(db_path)
+    # attacker导入的run_parser和utils导入的python_parser.run_parser是两个模块对象
+    monkeypatch.setattr(run_parser, 'parse_cache', cache)
+    monkeypatch.setattr(python_parser.run_parser, 'parse_cache', cache)
+    tokenizer = byte_level_tokenizer(tmp_path)
+    code = 'int f(int a, int q) {\n    int b = a + q;\n    return b * q;\n}\n'
+
+    # 数据集中的代码: 写入磁盘
+    CodeFeatureTemplate(code, tokenizer, 'c', normalize=True).rename({'b': 'x'}, 64)
+    get_graph_feature_template(code, tokenizer, 'c')
+    rows = count_rows(db_path)
+    assert rows > 0
+
+    # greedy_attack的一步: final_code替换了一个变量, 之后的候选都在final_code上计算
+    final_code = run_parser.get_example(code, 'b', 'x', 'c', persist=False)
+    assert CodeFeatureTemplate(final_code, tokenizer, 'c', normalize=True, persist=False).rename({'q': 'y'}, 64) is not None
+    get_graph_feature_template(final_code, tokenizer, 'c', persist=False)
+    map_chromesome({'a': 'z'}, final_code, 'c', persist=False)
+    run_parser.has_syntax_error(final_code, 'c', persist=False)
+    assert count_rows(db_path) == rows
+
+
+def test_prune_removes_entries_of_other_parser_versions(tmp_path):
+    db_path = str(tmp_path / 'parse_cache.db')
+    cache = ParseCache(db_path)
+    key = ParseCache.key('dataflow', 'int a;', 'c')
+    assert key.startswith(run_parser.PARSER_VERSION + ':')
+    cache.put_many([(key, 1), ('0123456789abcdef:c:dataflow:' + key.split(':')[-1], 2)])
+    assert cache.prune() == 1
+    assert count_rows(db_path) == 1 and cache.get(key) == 1
@@ -0,0 +1,73 @@
+import csv
+
+import pytest
+
+from conftest import HAVE_PARSER
+
+if not HAVE_PARSER:
+    pytest.skip('tree-sitter library is not built', allow_module_level=True)
+
+from utils import Recorder
+
+
+def write_example(recorder, index, code):
+    recorder.write(index, code, 3, code, 1, 1, 0, 1, ['a', 'b'], '', 1, 2, 'a:x', 'Greedy', 10, 0.5)
+
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_resume_truncates_row_cut_after_newline_in_code(tmp_path):
+    path = str(tmp_path / 'attack.csv')
+    recorder = Recorder(path)
+    write_example(recorder, 0, 'int a;\nint b;\n')
+    write_example(recorder, 1, 'int c;\nint d;\n')
+    recorder.close()
+    # 写row 2的code字段时被打断, 正好停在一个换行之后
+    with open(path, 'rb') as f:
+        data = f.read()
+    cut = data.index(b'"int c;\n') + len(b'"int c;\n')
+    with open(path, 'wb') as f:
+        f.write(data[:cut])
+
+    recorder = Recorder(path, resume=True)
+    assert recorder.completed == {0}
+    assert recorder.nb_total == 1 and recorder.query_times == 10
+    write_example(recorder, 1, 'int c;\nint d;\n')
+    recorder.close()
+
+    rows = read_rows(path)
+    assert [len(row) for row in rows] == [16, 16, 16]
+    assert [row[0] for row in rows[1:]] == ['0', '1']
+    assert Recorder(path, resume=True).completed == {0, 1}
+
+
+def test_resume_keeps_rows_with_unicode_line_separators(tmp_path):
+    path = str(tmp_path / 'attack.csv')
+    code = 'int a;\x0c\nchar *s = "\u2028\x1c";\r\n'
+    recorder = Recorder(path)
+    write_example(recorder, 0, code)
+    write_example(recorder, 1, code)
+    recorder.close()
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    recorder = Recorder(path, resume=True)
+    recorder.close()
+    assert recorder.completed == {0, 1}
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    assert read_rows(path)[2][1] == code
+
+
+def test_resume_rewrites_header_of_empty_run(tmp_path):
+    path = str(tmp_path / 'attack.csv')
+    with open(path, 'w') as f:
+        f.write('Index,Orig')
+    recorder = Recorder(path, resume=True)
+    write_example(recorder, 0, 'int a;')
+    recorder.close()
+    rows = read_rows(path)
+    assert rows[0] == Recorder.header and rows[1][0] == '0'
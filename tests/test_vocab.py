@@ -0,0 +1,57 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from conftest import HAVE_PARSER
+
+if not HAVE_PARSER:
+    pytest.skip('tree-sitter library is not built', allow_module_level=True)
+
+import utils
+from utils import load_vocab
+
+CODES = [
+    'def add(a, b):\n    total = a + b\n    return total\n',
+    'def greet(name):\n    message = "hello " + name\n    print(message)\n',
+    'def scale(values, k=2.5):\n    return [v * k for v in values]\n',
+]
+
+
+def load_in_worker(cache_file_path, codes, results):
+    idx2txt, txt2idx = load_vocab(cache_file_path, codes, 'python', 50)
+    results.put(idx2txt)
+
+
+def test_concurrent_workers_build_the_vocab_once(tmp_path, monkeypatch):
+    ctx = multiprocessing.get_context('fork')
+    builds = ctx.Value('i', 0)
+    build_vocab = utils.build_vocab
+
+    def counting_build_vocab(*args, **kwargs):
+        with builds.get_lock():
+            builds.value += 1
+        # 让建立词表的时间足够长, 所有worker都在它结束之前开始
+        time.sleep(0.5)
+        return build_vocab(*args, **kwargs)
+
+    monkeypatch.setattr(utils, 'build_vocab', counting_build_vocab)
+    cache_file_path = str(tmp_path / 'test.jsonl')
+    results = ctx.Queue()
+    workers = [ctx.Process(target=load_in_worker, args=(cache_file_path, CODES, results)) for _ in range(4)]
+    for p in workers:
+        p.start()
+    vocabs = [results.get(timeout=30) for _ in workers]
+    for p in workers:
+        p.join()
+    assert all(p.exitcode == 0 for p in workers)
+    assert builds.value == 1
+    assert all(vocab == vocabs[0] for vocab in vocabs)
+    assert 'total' in vocabs[0]
+    assert sorted(os.listdir(tmp_path)) == ['test.jsonl.vocab', 'test.jsonl.vocab.lock']
+
+    # 程序改变之后重新建立
+    idx2txt, txt2idx = load_vocab(cache_file_path, CODES[:1], 'python', 50)
+    assert builds.value == 2 and 'message' not in idx2txt
+    assert load_vocab(cache_file_path, CODES[:1], 'python', 50)[0] == idx2txt and builds.value == 2
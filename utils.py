@@ -8,7 +8,23 @@ from torch.utils.data.dataset import Dataset
 import os
 import numpy as np
 import csv
-from python_parser.run_parser import get_example, get_example_batch
+import json
+import pickle
+import re
+import shutil
+import bisect
+import contextlib
+import fcntl
+import hashlib
+import queue
+import threading
+import time
+import logging
+import torch.multiprocessing as mp
+from collections import Counter, OrderedDict
+from python_parser.run_parser import get_example, get_example_batch, get_identifiers, is_renamable_name, get_renamable_program, extract_dataflow, has_syntax_error
+
+logger = logging.getLogger(__name__)
 
 python_keywords = ['import', '', '[', ']', ':', ',', '.', '(', ')', '{', '}', 'not', 'is', '=', "+=", '-=', "<", ">",
                    '+', '-', '*', '/', 'False', 'None', 'True', 'and', 'as', 'assert', 'async', 'await', 'break',
@@ -81,6 +97,29 @@ special_char = ['[', ']', ':', ',', '.', '(', ')', '{', '}', 'not', 'is', '=', "
                 '|']
 
 
+def get_device(no_cuda=False, num_threads=0):
+    '''
+    Return the device used for model inference.
+    Falls back to the CPU when CUDA is unavailable or disabled, and then
+    uses num_threads intra-op threads (0 keeps the torch default).
+    '''
+    if not no_cuda and torch.cuda.is_available():
+        return torch.device("cuda")
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    return torch.device("cpu")
+
+
+def inference_context(device):
+    '''
+    Gradient-free context for inference on the given device.
+    On the CPU, torch.inference_mode is used when this torch version has it.
+    '''
+    if torch.device(device).type == "cpu" and hasattr(torch, "inference_mode"):
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
 def select_parents(population):
     length = range(len(population))
     index_1 = random.choice(length)
@@ -113,9 +152,93 @@ def crossover(csome_1, csome_2, r=None):
     return child_1, child_2
 
 
-def map_chromesome(chromesome: dict, code: str, lang: str) -> str:
+class GeneticPopulation():
+    '''
+    GA的种群. 每个chromesome是一个整数向量, 第i位是第i个变量的取值在 [原来的变量名] + substitues 中的下标
+    (0表示不替换), 整个种群是一个二维的numpy数组, 和每一行的fitness一起保存.
+    selection, crossover, mutation和去重都对一个batch的子代一起做;
+    只有没见过的基因型才会被decode成 {tgt_word: candidate} 的chromesome去计算fitness.
+    '''
+    def __init__(self, variable_substitue_dict) -> None:
+        self.names = list(variable_substitue_dict.keys())
+        self.alleles = [[name] + list(variable_substitue_dict[name]) for name in self.names]
+        self.nb_substitutes = np.array([len(variable_substitue_dict[name]) for name in self.names])
+        self.genes = np.zeros((0, len(self.names)), dtype=np.int64)
+        self.fitness = np.zeros(0)
+        self.seen = set()
+
+    def __len__(self):
+        return len(self.genes)
+
+    def encode(self, chromesome):
+        genes = np.zeros(len(self.names), dtype=np.int64)
+        for i, name in enumerate(self.names):
+            candidate = chromesome[name]
+            if candidate not in self.alleles[i]:
+                # 例如greedy_attack给的, 不在substitues中的取值
+                self.alleles[i].append(candidate)
+            genes[i] = self.alleles[i].index(candidate)
+        return genes
+
+    def decode(self, genes):
+        return {name: self.alleles[i][g] for i, (name, g) in enumerate(zip(self.names, genes))}
+
+    def add(self, chromesomes, fitness_values):
+        rows = np.stack([self.encode(chromesome) for chromesome in chromesomes])
+        self.genes = np.concatenate([self.genes, rows])
+        self.fitness = np.concatenate([self.fitness, np.asarray(fitness_values, dtype=float)])
+        self.seen.update(row.tobytes() for row in rows)
+
+    def offspring(self, nb_children, cross_probability=0.7):
+        '''
+        从种群中随机选择nb_children对parent, 以cross_probability的概率crossover (前r个变量来自parent_2,
+        其余来自parent_1), 否则复制parent_1. 和某个parent相同的子代随机把一个变量换成它的一个substitue.
+        '''
+        nb_variables = len(self.names)
+        parent_1 = self.genes[np.random.randint(len(self.genes), size=nb_children)]
+        parent_2 = self.genes[np.random.randint(len(self.genes), size=nb_children)]
+        r = np.random.randint(nb_variables, size=nb_children)
+        crossed = np.where(np.arange(nb_variables)[None, :] < r[:, None], parent_2, parent_1)
+        do_crossover = np.random.random(nb_children) < cross_probability
+        children = np.where(do_crossover[:, None], crossed, parent_1)
+
+        # 没有crossover的子代就是parent_1, 也在这里mutate
+        rows = np.nonzero((children == parent_1).all(1) | (children == parent_2).all(1))[0]
+        cols = np.random.randint(nb_variables, size=len(rows))
+        nb_substitutes = self.nb_substitutes[cols]
+        mutated = 1 + (np.random.random(len(rows)) * nb_substitutes).astype(np.int64)
+        # 没有substitue的变量保持不变
+        children[rows, cols] = np.where(nb_substitutes > 0, mutated, children[rows, cols])
+        return children
+
+    def breed(self, nb_children, cross_probability=0.7, max_rounds=10):
+        '''
+        返回最多nb_children个之前没有出现过的 (去重之后的) 子代. 见过的基因型不再计算fitness,
+        所以种群收敛之后会多生成几轮 (最多max_rounds轮) 来补足.
+        '''
+        children = []
+        for _ in range(max_rounds):
+            for child in self.offspring(nb_children, cross_probability):
+                key = child.tobytes()
+                if key not in self.seen and len(children) < nb_children:
+                    self.seen.add(key)
+                    children.append(child)
+            if len(children) >= nb_children:
+                break
+        return np.array(children, dtype=np.int64).reshape(-1, len(self.names))
+
+    def replace(self, children, fitness_values):
+        # 依次替换掉当前fitness最小的chromesome (如果子代更好)
+        for child, fitness_value in zip(children, fitness_values):
+            worst = int(np.argmin(self.fitness))
+            if fitness_value > self.fitness[worst]:
+                self.genes[worst] = child
+                self.fitness[worst] = fitness_value
+
+
+def map_chromesome(chromesome: dict, code: str, lang: str, persist=True) -> str:
     
-    temp_replace = get_example_batch(code, chromesome, lang)
+    temp_replace = get_example_batch(code, chromesome, lang, persist)
     
     return temp_replace
 
@@ -123,29 +246,18 @@ input = ["0ab", "\ndsd", "说啊", "'z'", "for"]
 
 
 from keyword import iskeyword
+# 每种语言不能用作变量名的标识符 (集合查找, 不用在几百个元素的list里线性查找)
+java_reserved = frozenset(java_keywords + java_special_ids)
+c_reserved = frozenset(c_keywords + c_macros + c_special_ids)
+
 def is_valid_variable_python(name: str) -> bool:
     return name.isidentifier() and not iskeyword(name)
 
 def is_valid_variable_java(name: str) -> bool:
-    if not name.isidentifier():
-        return False
-    elif name in java_keywords:
-        return False
-    elif name in java_special_ids:
-        return False
-    return True
+    return name.isidentifier() and name not in java_reserved
 
 def is_valid_variable_c(name: str) -> bool:
-
-    if not name.isidentifier():
-        return False
-    elif name in c_keywords:
-        return False
-    elif name in c_macros:
-        return False
-    elif name in c_special_ids:
-        return False
-    return True
+    return name.isidentifier() and name not in c_reserved
 
 def is_valid_variable_name(name: str, lang: str) -> bool:
     # check if matches language keywords
@@ -232,12 +344,13 @@ def get_bpe_substitues(substitutes, tokenizer, mlm_model):
     word_list = []
     # all_substitutes = all_substitutes[:24]
     all_substitutes = torch.tensor(all_substitutes)  # [ N, L ]
-    all_substitutes = all_substitutes[:24].to('cuda')
+    all_substitutes = all_substitutes[:24].to(mlm_model.device)
     # 不是，这个总共不会超过24... 那之前生成那么多也没用....
     N, L = all_substitutes.size()
-    word_predictions = mlm_model(all_substitutes)[0]  # N L vocab-size
-    ppl = c_loss(word_predictions.view(N * L, -1), all_substitutes.view(-1))  # [ N*L ]
-    ppl = torch.exp(torch.mean(ppl.view(N, L), dim=-1))  # N
+    with inference_context(mlm_model.device):
+        word_predictions = mlm_model(all_substitutes)[0]  # N L vocab-size
+        ppl = c_loss(word_predictions.view(N * L, -1), all_substitutes.view(-1))  # [ N*L ]
+        ppl = torch.exp(torch.mean(ppl.view(N, L), dim=-1))  # N
     _, word_list = torch.sort(ppl)
     word_list = [all_substitutes[i] for i in word_list]
     final_words = []
@@ -248,9 +361,10 @@ def get_bpe_substitues(substitutes, tokenizer, mlm_model):
     return final_words
 
 
-def get_substitues(substitutes, tokenizer, mlm_model, use_bpe, substitutes_score=None, threshold=3.0):
+def get_substitues(substitutes, tokenizer, mlm_model, use_bpe, substitutes_score=None, threshold=3.0, index=None):
     '''
     将生成的substitued subwords转化为words
+    index: 可选的IdentifierIndex, 单个subword时直接使用其中预先解码好的words
     '''
     # substitues L,k
     # from this matrix to recover a word
@@ -266,7 +380,7 @@ def get_substitues(substitutes, tokenizer, mlm_model, use_bpe, substitutes_score
         for (i, j) in zip(substitutes[0], substitutes_score[0]):
             if threshold != 0 and j < threshold:
                 break
-            words.append(tokenizer._decode([int(i)]))
+            words.append(tokenizer._decode([int(i)]) if index is None else index.words[int(i)])
             # 将id转为token.
     else:
         # word被分解成了多个subwords
@@ -277,6 +391,134 @@ def get_substitues(substitutes, tokenizer, mlm_model, use_bpe, substitutes_score
     return words
 
 
+def merge_ranked_substitutes(ranked_lists):
+    '''
+    合并一个变量在各个位置上的substitutes (每个列表都从最好的开始), 去掉重复的,
+    按它们在各个位置上最好的排名排序, 排名相同的按出现的先后.
+    '''
+    best = {}
+    for ranked in ranked_lists:
+        for rank, word in enumerate(ranked):
+            if word not in best or rank < best[word]:
+                best[word] = rank
+    return sorted(best, key=best.get)
+
+
+def candidate_batches(candidates, batch_size=0):
+    '''
+    把candidates按顺序切成大小为batch_size的micro-batch, batch_size <= 0 时只有一个batch.
+    '''
+    candidates = list(candidates)
+    if batch_size <= 0:
+        batch_size = max(len(candidates), 1)
+    return [candidates[i: i + batch_size] for i in range(0, len(candidates), batch_size)]
+
+
+def get_substitute_similarities(substitutes, input_ids, start, end, orig_embeddings, mlm_model, batch_size=60):
+    '''
+    将位置[start, end)分别替换成每一个候选subwords, 批量计算替换后embedding与原embedding的cosine相似度
+    '''
+    # substitutes L, k
+    nums_candis = substitutes.size(1)
+    orig_word_embed = orig_embeddings[0][start:end].unsqueeze(0)  # 1 L H
+    sims = []
+    with inference_context(mlm_model.device):
+        for i in range(0, nums_candis, batch_size):
+            candis = substitutes[:, i:i + batch_size].t().to(mlm_model.device)  # B L
+            new_ids = input_ids.to(mlm_model.device).repeat(candis.size(0), 1)
+            new_ids[:, start:end] = candis
+            new_word_embed = mlm_model.roberta(new_ids)[0][:, start:end]  # B L H
+            sims.append(nn.functional.cosine_similarity(orig_word_embed, new_word_embed, dim=2, eps=1e-6).mean(1))
+    sims = torch.cat(sims, 0).tolist()
+    return list(enumerate(sims))
+
+
+def identifier_token_ids(tokenizer):
+    '''
+    词表中可能出现在变量名里的subword的id: 去掉首尾的空白之后只包含变量名字符的token, 以及解码出
+    不完整UTF-8字节的token (它们可以拼成非ASCII的变量名). C, Java和Python都用str.isidentifier判断变量名,
+    所以三种语言是同一个集合; 关键字等整个词的限制仍然由is_valid_substitue检查.
+    '''
+    special_ids = set(tokenizer.all_special_ids)
+    ids = []
+    for token, idx in tokenizer.get_vocab().items():
+        if idx in special_ids:
+            continue
+        text = tokenizer.convert_tokens_to_string([token]).strip().replace('�', '')
+        if ('_' + text).isidentifier():
+            ids.append(idx)
+    return sorted(ids)
+
+
+class IdentifierMLMHead():
+    '''
+    只保留identifier_token_ids那些行的MLM输出层. hidden states只投影到decoder的这个子矩阵上,
+    得到的top k都是可以组成变量名的subword (返回的仍然是整个词表中的id).
+    需要在mlm_model移动到device之后创建.
+    '''
+    def __init__(self, mlm_model, tokenizer) -> None:
+        self.mlm_model = mlm_model
+        decoder = mlm_model.lm_head.decoder
+        ids = [idx for idx in identifier_token_ids(tokenizer) if idx < decoder.weight.size(0)]
+        self.token_ids = torch.tensor(ids, dtype=torch.long, device=decoder.weight.device)
+        self.weight = decoder.weight.detach()[self.token_ids]
+        bias = decoder.bias if decoder.bias is not None else mlm_model.lm_head.bias
+        self.bias = bias.detach()[self.token_ids]
+
+    def topk(self, input_ids, k):
+        '''
+        返回 (scores, token_ids, hidden_states): scores和token_ids的形状和
+        torch.topk(mlm_model(input_ids)[0], k, -1) 相同, hidden_states是同一次forward中roberta的输出.
+        '''
+        lm_head = self.mlm_model.lm_head
+        with inference_context(self.mlm_model.device):
+            hidden_states = self.mlm_model.roberta(input_ids.to(self.mlm_model.device))[0]
+            features = lm_head.layer_norm(nn.functional.gelu(lm_head.dense(hidden_states)))
+            scores = torch.matmul(features, self.weight.t()) + self.bias
+            scores, indices = torch.topk(scores, min(k, len(self.token_ids)), -1)
+        return scores, self.token_ids[indices], hidden_states
+
+
+class IdentifierIndex():
+    '''
+    在tokenizer的整个词表上预先算好的变量名合法性. words[i]是id i单独解码的结果 (和get_substitues中
+    tokenizer._decode([i])相同), valid[lang]是这些word去掉首尾空白之后是否是合法变量名的bitmap.
+    一个tokenizer只需要创建一次.
+    '''
+    def __init__(self, tokenizer, langs=('c', 'java', 'python')) -> None:
+        self.tokenizer = tokenizer
+        self.words = [tokenizer._decode([i]) for i in range(len(tokenizer))]
+        stripped = [word.strip() for word in self.words]
+        self.valid = {lang: np.fromiter((is_valid_variable_name(word, lang) for word in stripped),
+                                        dtype=bool, count=len(stripped))
+                      for lang in langs}
+        # 去掉空白之后的word -> 它的一个id, 用来在bitmap中查找任意字符串
+        self.word_ids = {}
+        for idx, word in enumerate(stripped):
+            self.word_ids.setdefault(word, idx)
+
+    def decode(self, ids):
+        return [self.words[i] if i < len(self.words) else self.tokenizer._decode([i]) for i in map(int, ids)]
+
+    def valid_ids(self, ids, lang):
+        '''
+        一组token id (单独解码之后) 是否是合法的变量名, 返回bool数组.
+        '''
+        return self.valid[lang][np.asarray(ids, dtype=np.int64)]
+
+    def valid_names(self, names, lang):
+        '''
+        一组候选的变量名是否合法, 返回bool数组, 结果和逐个调用is_valid_variable_name相同.
+        词表中的word直接查bitmap, 其余的 (比如多个subword合成的) 再逐个判断.
+        '''
+        if lang not in self.valid:
+            return np.fromiter((is_valid_variable_name(name, lang) for name in names), dtype=bool, count=len(names))
+        bitmap = self.valid[lang]
+        word_ids = self.word_ids
+        return np.fromiter((bitmap[word_ids[name]] if name in word_ids else is_valid_variable_name(name, lang)
+                            for name in names), dtype=bool, count=len(names))
+
+
 def get_masked_code_by_position(tokens: list, positions: dict):
     '''
     给定一段文本，以及需要被mask的位置,返回一组masked后的text
@@ -296,32 +538,180 @@ def get_masked_code_by_position(tokens: list, positions: dict):
     
     return masked_token_list, replace_token_positions
 
+
+def get_masked_code_by_variable(tokens: list, positions: dict):
+    '''
+    和get_masked_code_by_position相同, 但是一次mask掉一个变量的所有位置, 每个变量一个masked text.
+    Example:
+        tokens: [a,b,a]
+        positions: {a: [0,2], b: [1]}
+        Return:
+            [<unk>, b, <unk>]
+            [a, <unk>, a]
+    '''
+    masked_token_list = []
+    for variable_name in positions.keys():
+        masked_tokens = list(tokens)
+        for pos in positions[variable_name]:
+            masked_tokens[pos] = '<unk>'
+        masked_token_list.append(masked_tokens)
+    return masked_token_list
+
+
+def spread_variable_scores(positions: dict, variable_scores: list):
+    '''
+    把每个变量的分数 (get_masked_code_by_variable的顺序) 平分到它的各个位置,
+    顺序和get_masked_code_by_position返回的replace_token_positions相同.
+    按变量加起来 (greedy_attack) 就是变量的分数.
+    '''
+    importance_score = []
+    for variable_name, score in zip(positions.keys(), variable_scores):
+        importance_score += [score / len(positions[variable_name])] * len(positions[variable_name])
+    return importance_score
+
+
+def get_word_spans(words_list, tokens, tokenizer, normalize=False):
+    '''
+    ' '.join(words_list) tokenize之后, 每个词的subword在tokens中的范围 [start, end).
+    tokens可以是截断之后的, 被截断的词范围为空. 和tokens对不上时返回None.
+    normalize: tokens是 ' '.join(code.split()) 的结果 (如defect detection), 这时空白的词不对应任何subword.
+    '''
+    if normalize:
+        words_list = [' '.join(word.split()) for word in words_list]
+    kept = [i for i, word in enumerate(words_list) if word != '' or not normalize]
+    pieces = dict(zip(kept, code_token_pieces([words_list[i] for i in kept], tokenizer)))
+    spans = []
+    start = 0
+    for i in range(len(words_list)):
+        word_pieces = pieces.get(i, [])
+        end = min(start + len(word_pieces), len(tokens))
+        if tokens[start:end] != word_pieces[:end - start]:
+            return None
+        spans.append((start, end))
+        start = end
+    return spans
+
+
+def embedding_saliency(model, dataset, steps=1):
+    '''
+    不逐个mask再query, 而是用一次forward + backward估计dataset[0]中每个token的重要性:
+    grad · (embedding - <unk>的embedding), 即把这个token换成<unk>之后, 预测的label的概率下降多少的一阶近似.
+    steps > 1 时用steps步的integrated gradients (以<unk>为baseline).
+    只对第一次调用word embedding的输入计算 (被attack的代码; clone detection中之后的是固定的code 2).
+    这steps个输入记为steps次query.
+    返回 (第一次调用word embedding的输入的tokens, 每个token的分数).
+    '''
+    shared = model if isinstance(model, SharedQueryModel) else None
+    if shared is not None:
+        model = shared.model
+    tokenizer = model.tokenizer
+    device = next(model.parameters()).device
+    features = model.engine.collate([dataset[0]])
+    trim = getattr(model, 'trim_features', None)
+    if trim is not None:
+        features = trim(features)
+    features = [t.repeat(steps, *([1] * (t.dim() - 1))).to(device) for t in features[:-1]]
+    alphas = torch.arange(1, steps + 1, dtype=torch.float, device=device) / steps
+    special_ids = torch.tensor([tokenizer.cls_token_id, tokenizer.sep_token_id,
+                                tokenizer.pad_token_id, tokenizer.unk_token_id], device=device)
+    calls = []
+
+    def interpolate(module, inputs, output):
+        if len(calls) > 0:
+            return None
+        # 第i行是baseline和原始embedding之间的第i步, special token保持不变
+        is_code = (inputs[0][..., None] != special_ids).all(-1)[..., None].to(output.dtype)
+        delta = (output - module.weight[tokenizer.unk_token_id]) * is_code
+        embeddings = output - delta + alphas.view(-1, 1, 1) * delta
+        calls.append((inputs[0][0], delta[0].detach(), embeddings))
+        return embeddings
+
+    # 多个attack并发时, 不能让其他线程的query经过这个hook
+    with shared.cond if shared is not None else contextlib.nullcontext():
+        handle = model.encoder.get_input_embeddings().register_forward_hook(interpolate)
+        try:
+            model.eval()
+            with torch.enable_grad():
+                prob = model(*features)
+                if prob.size(-1) == 1:
+                    # defect detection的输出是sigmoid
+                    prob = torch.cat((1 - prob, prob), -1)
+                label = int(prob[-1].argmax())
+                grad = torch.autograd.grad(prob[:, label].sum(), calls[0][2])[0]
+        finally:
+            handle.remove()
+    if shared is not None:
+        shared.local.query = shared.thread_query + steps
+    model.query += steps
+
+    input_ids, delta, _ = calls[0]
+    scores = (grad.mean(0) * delta).sum(-1)
+    return tokenizer.convert_ids_to_tokens(input_ids.tolist()), scores.detach().cpu().numpy()
+
+
+def get_gradient_importance_score(model, dataset, words_list, replace_token_positions, steps=1, normalize=False):
+    '''
+    --importance_mode gradient 时代替逐个mask的importance score.
+    dataset中只有原始代码 (' '.join(words_list)) 一个样本, 每个replace_token_positions处的词的分数
+    是它的subword的embedding_saliency之和. 词和模型的输入对不上时返回None. normalize见get_word_spans.
+    '''
+    tokens, scores = embedding_saliency(model, dataset, steps)
+    # 去掉开头的<s>, 到第一个</s>为止都是代码
+    tokens = tokens[1:tokens.index(model.tokenizer.sep_token)]
+    spans = get_word_spans(words_list, tokens, model.tokenizer, normalize)
+    if spans is None:
+        return None
+    return [float(scores[spans[pos][0] + 1: spans[pos][1] + 1].sum()) for pos in replace_token_positions]
+
+
+def report_importance_agreement(positions, replace_token_positions, mask_score, gradient_score, mask_cost, gradient_cost):
+    '''
+    --importance_mode compare: 打印两种importance score的开销 (秒, 模型输入个数),
+    以及和greedy_attack一样按变量加起来之后, 变量排序的Spearman相关系数和排第一的变量是否相同.
+    '''
+    score_pos = {pos: i for i, pos in enumerate(replace_token_positions)}
+    names = list(positions.keys())
+    mask_total = np.array([sum(mask_score[score_pos[pos]] for pos in positions[name]) for name in names])
+    gradient_total = np.array([sum(gradient_score[score_pos[pos]] for pos in positions[name]) for name in names])
+    if len(names) > 1:
+        mask_rank = np.argsort(np.argsort(-mask_total))
+        gradient_rank = np.argsort(np.argsort(-gradient_total))
+        spearman = float(np.corrcoef(mask_rank, gradient_rank)[0, 1])
+    else:
+        spearman = 1.0
+    print("Importance score mask: %.2fs, %d inputs; gradient: %.2fs, %d inputs; Spearman: %.3f; same top variable: %s"
+          % (mask_cost[0], mask_cost[1], gradient_cost[0], gradient_cost[1], spearman,
+             names[int(mask_total.argmax())] == names[int(gradient_total.argmax())]))
+    return spearman
+
+def _vocab_token(t):
+    # 字符串, 字符和数字常量在词表中各自合并为一个token
+    if t[0] == '"' and t[-1] == '"':
+        return "<str>"
+    elif t[0] == "'" and t[-1] == "'":
+        return "<char>"
+    elif t[0] in "0123456789.":
+        if 'e' in t.lower():
+            return "<fp>"
+        elif '.' in t:
+            return t if t == '.' else "<fp>"
+        else:
+            return "<int>"
+    return t
+
 def build_vocab(codes, limit=5000):
-    
-    vocab_cnt = {"<str>": 0, "<char>": 0, "<int>": 0, "<fp>": 0}
+    '''
+    codes可以是一个generator (每个元素是一个程序的token list). 先用Counter数出每个token出现的次数,
+    再对不同的token (而不是每一次出现) 做常量的归类, 结果和逐个token统计相同.
+    '''
+    token_cnt = Counter()
     for c in tqdm(codes):
-        for t in c:
-            if len(t)>0:
-                if t[0] == '"' and t[-1] == '"':
-                    vocab_cnt["<str>"] += 1
-                elif t[0] == "'" and t[-1] == "'":
-                    vocab_cnt["<char>"] += 1
-                elif t[0] in "0123456789.":
-                    if 'e' in t.lower():
-                        vocab_cnt["<fp>"] += 1
-                    elif '.' in t:
-                        if t == '.':
-                            if t not in vocab_cnt.keys():
-                                vocab_cnt[t] = 0
-                            vocab_cnt[t] += 1
-                        else:
-                            vocab_cnt["<fp>"] += 1
-                    else:
-                        vocab_cnt["<int>"] += 1
-                elif t in vocab_cnt.keys():
-                    vocab_cnt[t] += 1
-                else:
-                    vocab_cnt[t] = 1
+        token_cnt.update(c)
+    vocab_cnt = {"<str>": 0, "<char>": 0, "<int>": 0, "<fp>": 0}
+    for t, cnt in token_cnt.items():
+        if len(t) > 0:
+            t = _vocab_token(t)
+            vocab_cnt[t] = vocab_cnt.get(t, 0) + cnt
     vocab_cnt = sorted(vocab_cnt.items(), key=lambda x:x[1], reverse=True)
     
     idx2txt = ["<unk>"] + ["<pad>"] + [it[0] for index, it in enumerate(vocab_cnt) if index < limit-1]
@@ -330,6 +720,70 @@ def build_vocab(codes, limit=5000):
         txt2idx[idx2txt[idx]] = idx
     return idx2txt, txt2idx
 
+@contextlib.contextmanager
+def cache_lock(path):
+    '''
+    进程间互斥地建立缓存目录path (文件锁path + '.lock').
+    AttackScheduler的多个worker同时遇到冷缓存时, 只有第一个建立, 其余的等待之后直接读取它的结果.
+    '''
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def publish_cache_dir(tmp_path, path):
+    '''
+    把写好的tmp_path改名为path. path已经是一个完整的缓存 (有meta.json, 另一个进程先写好了) 时
+    不覆盖 (其他进程可能正在读取它), 删除tmp_path并返回False.
+    '''
+    if os.path.exists(path) and not os.path.isfile(os.path.join(path, 'meta.json')):
+        # 上次写到一半的目录, 没有进程会读取它
+        shutil.rmtree(path)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path)
+        return False
+    return True
+
+
+def load_vocab(cache_file_path, codes, lang, limit=5000):
+    '''
+    MHM用的词表. 第一次调用时parse所有的codes建立词表, 和codes的hash一起保存在
+    cache_file_path + '.vocab' (tokens.npy和meta.json); 之后codes没有变化时直接读取,
+    不再对每个程序调用get_identifiers. 多个进程同时调用时只建立一次.
+    '''
+    path = cache_file_path + '.vocab'
+    digest = hashlib.sha1(('%s\0%d\0' % (lang, limit)).encode())
+    for code in codes:
+        digest.update(code.encode('utf-8', 'surrogatepass'))
+        digest.update(b'\0')
+    source_hash = digest.hexdigest()
+    meta_path = os.path.join(path, 'meta.json')
+    with cache_lock(path):
+        if os.path.isfile(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('hash') == source_hash:
+                idx2txt = np.load(os.path.join(path, 'tokens.npy')).tolist()
+                return idx2txt, {txt: idx for idx, txt in enumerate(idx2txt)}
+            # codes改变之后的旧词表: 读取它的进程也持有锁, 可以直接删除
+            shutil.rmtree(path)
+
+        idx2txt, txt2idx = build_vocab((get_identifiers(code, lang)[1] for code in codes), limit)
+        tmp_path = path + '.tmp%d' % os.getpid()
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'tokens.npy'), np.array(idx2txt, dtype=str))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'hash': source_hash, 'lang': lang, 'limit': limit, 'size': len(idx2txt)}, f)
+        publish_cache_dir(tmp_path, path)
+    return idx2txt, txt2idx
+
 
 
 # From MHM codebases
@@ -338,11 +792,11 @@ def build_vocab(codes, limit=5000):
 # import pycparser
 # import torch
 
-def getTensor(batch, batchfirst=False):
+def getTensor(batch, batchfirst=False, device="cuda"):
     
     inputs, labels = batch['x'], batch['y']
-    inputs, labels = torch.tensor(inputs, dtype=torch.long).cuda(), \
-                     torch.tensor(labels, dtype=torch.long).cuda()
+    inputs, labels = torch.tensor(inputs, dtype=torch.long).to(device), \
+                     torch.tensor(labels, dtype=torch.long).to(device)
     if batchfirst:
         # inputs_pos = [[pos_i + 1 if w_i != 0 else 0 for pos_i, w_i in enumerate(inst)] for inst in inputs]
         # inputs_pos = torch.tensor(inputs_pos, dtype=torch.long).cuda()
@@ -478,6 +932,11 @@ def getDecl(_seq="", _syms={}):
         _node.show()
     return _syms
     
+# 不是UID的token, 以及UID首字符/中间字符允许的字符 (和原来逐字符比较.lower()的结果一致, 包括U+212A)
+__non_uids__ = frozenset(__key_words__ + __ops__ + __macros__ + __special_ids__)
+__uid_heads__ = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_\u212a")
+__uid_chars__ = __uid_heads__ | frozenset("0123456789")
+
 def isUID(_text=""):
     
     '''
@@ -485,31 +944,15 @@ def isUID(_text=""):
     '''
     
     _text = _text.strip()
-    if _text == '':
-        return False
-
-    if " " in _text or "\n" in _text or "\r" in _text:
-        return False
-    elif _text in __key_words__:
-        return False
-    elif _text in __ops__:
+    if _text == '' or _text in __non_uids__:
         return False
-    elif _text in __macros__:
-        return False
-    elif _text in __special_ids__:
-        return False
-    elif _text[0].lower() in "0123456789":
+    elif " " in _text or "\n" in _text or "\r" in _text:
         return False
     elif "'" in _text or '"' in _text:
         return False
-    elif _text[0].lower() in "abcdefghijklmnopqrstuvwxyz_":
-        for _c in _text[1:-1]:
-            if _c.lower() not in "0123456789abcdefghijklmnopqrstuvwxyz_":
-                return False
-    else:
-        return False
-    return True
-    
+    # 和原来一样, 最后一个字符不检查
+    return _text[0] in __uid_heads__ and __uid_chars__.issuperset(_text[1:-1])
+
 def getUID(_tokens=[], uids=[]):
     
     '''
@@ -524,7 +967,418 @@ def getUID(_tokens=[], uids=[]):
             else:
                 ids[t] = [i]
     return ids
-    
+
+
+class MHMChain():
+    '''
+    MHM的一条马尔可夫链: 当前的代码, 变量名的位置, 每个变量的substitues, 以及被替换过的变量的历史.
+    多条链从同一份代码出发, 各自独立地接受/拒绝.
+    '''
+    def __init__(self, code, uid, substitute_dict, raw_tokens) -> None:
+        self.code = code
+        self.uid = copy.deepcopy(uid)
+        self.substitute_dict = dict(substitute_dict)
+        self.raw_tokens = copy.deepcopy(raw_tokens)
+        self.old_uids = {}
+        self.old_uid = ""
+        self.res = None
+
+    def update(self, res, iteration):
+        self.res = res
+        if res['status'].lower() not in ['s', 'a']:
+            return
+        if iteration == 1:
+            self.old_uids[res["old_uid"]] = []
+            self.old_uids[res["old_uid"]].append(res["new_uid"])
+            self.old_uid = res["old_uid"]
+        flag = 0
+        for k in self.old_uids.keys():
+            if res["old_uid"] == self.old_uids[k][-1]:
+                flag = 1
+                self.old_uids[k].append(res["new_uid"])
+                self.old_uid = k
+                break
+        if flag == 0:
+            self.old_uids[res["old_uid"]] = []
+            self.old_uids[res["old_uid"]].append(res["new_uid"])
+            self.old_uid = res["old_uid"]
+
+        self.code = res['tokens']
+        self.uid[res['new_uid']] = self.uid.pop(res['old_uid']) # 替换key，但保留value.
+        self.substitute_dict[res['new_uid']] = self.substitute_dict.pop(res['old_uid'])
+        for i in range(len(self.raw_tokens)):
+            if self.raw_tokens[i] == res['old_uid']:
+                self.raw_tokens[i] = res['new_uid']
+
+    def replace_info(self):
+        replace_info = {}
+        nb_changed_pos = 0
+        for uid_ in self.old_uids.keys():
+            replace_info[uid_] = self.old_uids[uid_][-1]
+            nb_changed_pos += len(self.uid[self.old_uids[uid_][-1]])
+        return replace_info, nb_changed_pos
+
+
+def mhm_accept(proposals, prob, pred, _label, _prob_threshold):
+    '''
+    所有链的候选拼在一起只调用一次get_results, 这里按链切开, 一起算出每条链的接受率.
+    proposals中每条链是 (_tokens, selected_uid, candi_token, candi_tokens), 第一个候选是没有替换的代码.
+    返回每条链的res (和原来的__replaceUID相同).
+    '''
+    sizes = np.array([len(proposal[2]) for proposal in proposals])
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    label_prob = np.asarray(prob)[:, _label]
+    fooled = np.asarray(pred) != _label
+
+    # 每条链中Ground_truth对应的probability最小的那个mutant (没有比1.0更小的就是原来的代码)
+    padded = np.ones((len(proposals), sizes.max()), dtype=label_prob.dtype)
+    for k, (start, size) in enumerate(zip(starts, sizes)):
+        padded[k, :size] = label_prob[start:start+size]
+    min_prob = padded[:, 1:].min(1, initial=1.0)
+    candi_prob = np.where(min_prob < 1.0, min_prob, label_prob[starts])
+    alpha = (1-candi_prob+1e-10) / (1-label_prob[starts]+1e-10)
+
+    results = []
+    for k, (_tokens, selected_uid, candi_token, candi_tokens) in enumerate(proposals):
+        start = starts[k]
+        succ = np.nonzero(fooled[start:start+sizes[k]])[0]
+        if len(succ) > 0: # 如果有样本攻击成功
+            i, status, a = succ[0], "s", 1
+        else:
+            i, a = sizes[k] - 1, alpha[k]
+            status = "r" if random.uniform(0, 1) > a or a < _prob_threshold else "a"
+        results.append({"status": status, "alpha": a, "tokens": candi_tokens[i],
+                        "old_uid": selected_uid, "new_uid": candi_token[i],
+                        "old_prob": prob[start], "new_prob": prob[start+i],
+                        "old_pred": pred[start], "new_pred": pred[start+i], "nb_changed_pos": _tokens.count(selected_uid)})
+    return results
+
+
+
+class QueryCache():
+    '''
+    Bounded LRU cache of model outputs, keyed by a hash of the input features
+    (input_ids, and position_idx/attn_mask for GraphCodeBERT) of one example.
+    maxsize=0 disables caching.
+    '''
+    def __init__(self, maxsize=0) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._store = OrderedDict()
+
+    def key(self, tensors):
+        h = hashlib.blake2b(digest_size=16)
+        for t in tensors:
+            h.update(t.numpy().tobytes())
+        return h.digest()
+
+    def get(self, key):
+        if key in self._store:
+            self._store.move_to_end(key)
+            self.hits += 1
+            return self._store[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._store[key] = value
+        self._store.move_to_end(key)
+        if len(self._store) > self.maxsize:
+            self._store.popitem(last=False)
+
+
+def group_rows(*tensors):
+    '''
+    tensors: 第一维相同的若干tensor (如一个batch的各个输入).
+    把各个tensor中都完全相同的行分成一组, 返回 [(组中第一行的下标, 组中所有行的下标), ...].
+    '''
+    remaining = torch.arange(tensors[0].size(0), device=tensors[0].device)
+    groups = []
+    while remaining.numel() > 0:
+        first = int(remaining[0])
+        same = torch.ones_like(remaining, dtype=torch.bool)
+        for t in tensors:
+            same &= (t[remaining] == t[first]).reshape(remaining.numel(), -1).all(-1)
+        groups.append((first, remaining[same]))
+        remaining = remaining[~same]
+    return groups
+
+
+class InferenceEngine():
+    '''
+    Long-lived batched inference used by Model.get_results.
+    Batches are collated in-process (no DataLoader workers are forked per
+    query) and copied to the device through reusable pinned staging buffers.
+    Outputs of previously seen inputs are served from a QueryCache.
+    '''
+    def __init__(self, device="cuda", cache_size=0) -> None:
+        self.device = torch.device(device)
+        self.pin_memory = self.device.type == "cuda"
+        self.cache = QueryCache(cache_size)
+        self.last_forwarded = []
+        self._buffers = {}
+
+    def collate(self, items):
+        # items: list of tuples of tensors, as returned by Dataset.__getitem__
+        return [torch.stack([item[i] for item in items]) for i in range(len(items[0]))]
+
+    def _stage(self, slot, tensor):
+        if not self.pin_memory:
+            return tensor.to(self.device)
+        # 动态padding之后每个batch的shape都不一样, 所以按元素个数复用一维的buffer
+        buf = self._buffers.get(slot)
+        if buf is None or buf.dtype != tensor.dtype or buf.numel() < tensor.numel():
+            buf = torch.empty(tensor.numel(), dtype=tensor.dtype).pin_memory()
+            self._buffers[slot] = buf
+        staged = buf[:tensor.numel()].view(tensor.size())
+        staged.copy_(tensor)
+        return staged.to(self.device, non_blocking=True)
+
+    def no_grad(self):
+        return inference_context(self.device)
+
+    def batches(self, dataset, batch_size, trim=None):
+        '''
+        Yield device tensors for dataset[i: i+batch_size].
+        If given, trim(features) cuts the collated batch down to the length
+        of its longest member before it is copied to the device.
+        The staging buffers are reused, so the caller must consume a batch
+        (e.g. move its outputs back with .cpu()) before asking for the next one.
+        '''
+        for start in range(0, len(dataset), batch_size):
+            items = [dataset[i] for i in range(start, min(start + batch_size, len(dataset)))]
+            features = self.collate(items)
+            if trim is not None:
+                features = trim(features)
+            yield [self._stage(slot, t) for slot, t in enumerate(features)]
+
+    def predict(self, model, dataset, batch_size):
+        '''
+        Return the outputs of model for every item of dataset (one numpy row
+        per item, in order) and the number of items actually run through the
+        model. Each item is a tuple of feature tensors followed by its label;
+        the model is called on the features only.
+        Models that define feature_length(item) and trim_features(features)
+        are run on length-sorted batches padded only to their longest member;
+        the outputs are scattered back to the original order.
+        '''
+        items = [dataset[i] for i in range(len(dataset))]
+        outputs = [None] * len(items)
+        keys = [None] * len(items)
+        todo = []
+        # key -> indices of the items in this call that share it
+        pending = {}
+        for i, item in enumerate(items):
+            if self.cache.maxsize <= 0:
+                todo.append(i)
+                continue
+            key = keys[i] = self.cache.key(item[:-1])
+            if key in pending:
+                self.cache.hits += 1
+                pending[key].append(i)
+                continue
+            outputs[i] = self.cache.get(key)
+            if outputs[i] is None:
+                pending[key] = [i]
+                todo.append(i)
+
+        # 本次真正送进模型的样本下标 (其余来自cache)
+        self.last_forwarded = todo
+        trim = getattr(model, 'trim_features', None)
+        if trim is not None:
+            # 长度相近的放在同一个batch里, 减少padding
+            todo.sort(key=lambda i: model.feature_length(items[i]))
+        todo_items = [items[i] for i in todo]
+        done = 0
+        for batch in self.batches(todo_items, batch_size, trim):
+            with self.no_grad():
+                logits = model(*batch[:-1]).cpu().numpy()
+            for row in logits:
+                i = todo[done]
+                done += 1
+                if keys[i] is None:
+                    outputs[i] = row
+                    continue
+                self.cache.put(keys[i], row)
+                for j in pending[keys[i]]:
+                    outputs[j] = row
+        return np.stack(outputs), len(todo)
+
+
+def _column_kind(values):
+    # 按整列的内容决定存储方式
+    if all(isinstance(v, (int, np.integer)) for v in values):
+        return 'scalar'
+    if not all(isinstance(v, (list, tuple, np.ndarray)) for v in values):
+        return 'object'
+    items = [x for v in values for x in v]
+    if all(isinstance(x, (int, np.integer)) for x in items):
+        return 'fixed' if len(set(len(v) for v in values)) == 1 else 'ragged'
+    if all(isinstance(x, (list, tuple)) and all(isinstance(y, (int, np.integer)) for y in x) for x in items):
+        return 'nested'
+    return 'object'
+
+
+def _offsets(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _open_array(path):
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        # 长度为0的数组不能mmap
+        return np.load(path)
+
+
+class FeatureRow():
+    '''
+    FeatureStore中的一个example, 属性名和原来的InputFeatures相同.
+    整数列返回memmap上的视图 (不拷贝), tokens/url等其余的列在访问时反序列化.
+    '''
+    def __init__(self, store, index) -> None:
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self._store.get(name, self._index)
+
+
+class FeatureStore():
+    '''
+    Columnar on-disk replacement for the torch.save'd lists of InputFeatures
+    used by the TextDatasets in run.py, kept in the directory
+    cache_file_path + '.features' (one .npy file per array plus meta.json).
+    Integer lists of the same length for every example (input_ids,
+    position_idx) are stored as a 2D int32 array, other integer lists as
+    int32 values plus int64 offsets, lists of integer lists (dfg_to_code,
+    dfg_to_dfg) with one more level of offsets, and everything else pickled.
+    The arrays are opened with np.load(mmap_mode='r'): opening a store does
+    not read the data, and forked DataLoader workers share the page cache.
+    '''
+    suffix = '.features'
+
+    def __init__(self, path) -> None:
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.length = meta['length']
+        self.columns = meta['columns']
+        self.arrays = {}
+        for name in os.listdir(path):
+            if name.endswith('.npy'):
+                self.arrays[name[:-len('.npy')]] = _open_array(os.path.join(path, name))
+
+    @classmethod
+    def exists(cls, cache_file_path):
+        return os.path.isfile(os.path.join(cache_file_path + cls.suffix, 'meta.json'))
+
+    @classmethod
+    def load(cls, cache_file_path):
+        '''
+        Open the store of cache_file_path. An old torch.save'd cache at
+        cache_file_path is converted once; otherwise FileNotFoundError is raised.
+        '''
+        if cls.exists(cache_file_path):
+            return cls(cache_file_path + cls.suffix)
+        if not os.path.isfile(cache_file_path):
+            raise FileNotFoundError(cache_file_path + cls.suffix)
+        return cls.save(cache_file_path, torch.load(cache_file_path))
+
+    @classmethod
+    def save(cls, cache_file_path, examples):
+        '''
+        Write examples (objects sharing the same attributes) and return the opened store.
+        Several processes (e.g. AttackScheduler workers on a cold cache) may
+        save the same store at once: they are serialized by a lock file, and a
+        store another process has already written is opened instead of replaced.
+        '''
+        path = cache_file_path + cls.suffix
+        with cache_lock(path):
+            if cls.exists(cache_file_path):
+                return cls(path)
+            cls._write(path, examples)
+        return cls(path)
+
+    @classmethod
+    def _write(cls, path, examples):
+        tmp_path = path + '.tmp%d' % os.getpid()
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        names = list(vars(examples[0]).keys()) if len(examples) > 0 else []
+        columns = {}
+        for name in names:
+            values = [getattr(example, name) for example in examples]
+            kind = columns[name] = _column_kind(values)
+            arrays = {}
+            if kind == 'scalar':
+                arrays['values'] = np.asarray(values, dtype=np.int64)
+            elif kind == 'fixed':
+                arrays['values'] = np.asarray(values, dtype=np.int32).reshape(len(values), -1)
+            elif kind == 'ragged':
+                arrays['values'] = np.fromiter((x for v in values for x in v), dtype=np.int32)
+                arrays['offsets'] = _offsets([len(v) for v in values])
+            elif kind == 'nested':
+                arrays['values'] = np.fromiter((y for v in values for x in v for y in x), dtype=np.int32)
+                arrays['inner'] = _offsets([len(x) for v in values for x in v])
+                arrays['offsets'] = _offsets([len(v) for v in values])
+            else:
+                blobs = [pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL) for v in values]
+                arrays['values'] = np.frombuffer(b''.join(blobs), dtype=np.uint8)
+                arrays['offsets'] = _offsets([len(b) for b in blobs])
+            for key, array in arrays.items():
+                np.save(os.path.join(tmp_path, '%s.%s.npy' % (name, key)), array)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'length': len(examples), 'columns': columns}, f)
+        # 其他进程可能已经mmap了一个完整的store, 它不会被删除或覆盖
+        publish_cache_dir(tmp_path, path)
+
+    def get(self, name, index):
+        if name not in self.columns:
+            raise AttributeError(name)
+        kind = self.columns[name]
+        values = self.arrays[name + '.values']
+        if kind == 'scalar':
+            return int(values[index])
+        if kind == 'fixed':
+            return values[index]
+        offsets = self.arrays[name + '.offsets']
+        start, end = offsets[index], offsets[index + 1]
+        if kind == 'ragged':
+            return values[start: end]
+        if kind == 'nested':
+            inner = self.arrays[name + '.inner']
+            return [values[inner[i]: inner[i + 1]] for i in range(start, end)]
+        return pickle.loads(values[start: end].tobytes())
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [FeatureRow(self, i) for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return FeatureRow(self, index)
+
+    def __iter__(self):
+        for i in range(self.length):
+            yield FeatureRow(self, i)
+
+    def __getstate__(self):
+        # spawn出来的进程重新mmap, 不拷贝数据
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
 
 
 class CodeDataset(Dataset):
@@ -537,41 +1391,401 @@ class CodeDataset(Dataset):
     def __getitem__(self, i):       
         return torch.tensor(self.examples[i].input_ids),torch.tensor(self.examples[i].label)
 
+def get_graph_edges(position_idx, dfg_to_code, dfg_to_dfg):
+    '''
+    GraphCodeBERT attention中除了"code attend to code"和special token之外的部分,
+    以边表(rows, cols)的形式保存, 每个feature只需计算一次.
+    '''
+    node_index = int((np.asarray(position_idx) > 1).sum())
+    rows, cols = [], []
+    #nodes attend to code tokens that are identified from
+    for idx, (a, b) in enumerate(dfg_to_code):
+        if a < node_index and b < node_index:
+            rows += [idx + node_index] * (b - a) + list(range(a, b))
+            cols += list(range(a, b)) + [idx + node_index] * (b - a)
+    #nodes attend to adjacent nodes
+    for idx, nodes in enumerate(dfg_to_dfg):
+        for a in nodes:
+            if a + node_index < len(position_idx):
+                rows.append(idx + node_index)
+                cols.append(a + node_index)
+    return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+
+def build_graph_attn_mask(input_ids, position_idx, edges, device=None):
+    '''
+    一次性构造一个batch的graph-guided attention mask.
+    input_ids, position_idx: [B, L]; edges: 每个样本的get_graph_edges结果.
+    返回[B, L, L]的bool tensor (在device上构造).
+    '''
+    input_ids = torch.as_tensor(np.asarray(input_ids), device=device)
+    position_idx = torch.as_tensor(np.asarray(position_idx), device=device)
+    batch_size, length = position_idx.size()
+    node_index = position_idx.gt(1).sum(-1, keepdim=True)
+    max_length = position_idx.ne(1).sum(-1, keepdim=True)
+    arange = torch.arange(length, device=device).unsqueeze(0)
+    #sequence can attend to sequence
+    is_code = arange < node_index
+    attn_mask = is_code[:, :, None] & is_code[:, None, :]
+    #special tokens attend to all tokens
+    is_special = input_ids.eq(0) | input_ids.eq(2)
+    attn_mask |= is_special[:, :, None] & (arange < max_length)[:, None, :]
+    #nodes attend to code tokens and adjacent nodes
+    batch_idx = np.concatenate([np.full(len(rows), i, dtype=np.int64) for i, (rows, _) in enumerate(edges)])
+    rows = np.concatenate([rows for rows, _ in edges])
+    cols = np.concatenate([cols for _, cols in edges])
+    if len(rows) > 0:
+        attn_mask[torch.as_tensor(batch_idx, device=device),
+                  torch.as_tensor(rows, device=device),
+                  torch.as_tensor(cols, device=device)] = True
+    return attn_mask
+
+
+def code_token_pieces(code_tokens, tokenizer):
+    # 每个code token的subword, 除了第一个token, 都在前面加'@ '再去掉, 保证带上空格前缀
+    return [tokenizer.tokenize('@ '+x)[1:] if idx!=0 else tokenizer.tokenize(x) for idx,x in enumerate(code_tokens)]
+
+
+def build_graph_features(code_pieces, dfg, tokenizer, args):
+    '''
+    GraphCodeBERT的convert_code_to_features中extract_dataflow和tokenize之后的部分.
+    code_pieces: 每个code token的subword; dfg: extract_dataflow得到的DFG.
+    返回 (source_tokens, source_ids, position_idx, dfg_to_code, dfg_to_dfg).
+    '''
+    ori2cur_pos={}
+    ori2cur_pos[-1]=(0,0)
+    for i in range(len(code_pieces)):
+        ori2cur_pos[i]=(ori2cur_pos[i-1][1],ori2cur_pos[i-1][1]+len(code_pieces[i]))
+    code_tokens=[y for x in code_pieces for y in x]
+
+    code_tokens=code_tokens[:args.code_length+args.data_flow_length-2-min(len(dfg),args.data_flow_length)]
+    source_tokens =[tokenizer.cls_token]+code_tokens+[tokenizer.sep_token]
+    source_ids =  tokenizer.convert_tokens_to_ids(source_tokens)
+    position_idx = [i+tokenizer.pad_token_id + 1 for i in range(len(source_tokens))]
+    dfg = dfg[:args.code_length+args.data_flow_length-len(source_tokens)]
+    source_tokens += [x[0] for x in dfg]
+    position_idx+=[0 for x in dfg]
+    source_ids+=[tokenizer.unk_token_id for x in dfg]
+    padding_length=args.code_length+args.data_flow_length-len(source_ids)
+    position_idx+=[tokenizer.pad_token_id]*padding_length
+    source_ids+=[tokenizer.pad_token_id]*padding_length
+
+    reverse_index={}
+    for idx,x in enumerate(dfg):
+        reverse_index[x[1]]=idx
+    for idx,x in enumerate(dfg):
+        dfg[idx]=x[:-1]+([reverse_index[i] for i in x[-1] if i in reverse_index],)
+    dfg_to_dfg=[x[-1] for x in dfg]
+    dfg_to_code=[ori2cur_pos[x[1]] for x in dfg]
+    length=len([tokenizer.cls_token])
+    dfg_to_code=[(x[0]+length,x[1]+length) for x in dfg_to_code]
+    return source_tokens, source_ids, position_idx, dfg_to_code, dfg_to_dfg
+
+
+class GraphFeatureTemplate():
+    '''
+    一个程序的GraphCodeBERT features, 供它的所有重命名复用.
+    重命名不改变语法树, 所以DFG只需要替换变量名; 每个code token的subword也只有
+    被重命名的位置需要重新tokenize, 之后的偏移 (ori2cur_pos) 由build_graph_features重新累加.
+    rename()的结果和对重命名之后的代码完整地重新计算完全相同; 不能保证这一点时
+    (程序有语法错误, 新名字是关键字或者和已有的token冲突等) 返回None, 由调用者完整地重新计算.
+    '''
+    def __init__(self, code_tokens, dfg, tokenizer, lang, renamable=True) -> None:
+        self.dfg = dfg
+        self.tokenizer = tokenizer
+        self.lang = lang
+        # 有语法错误的程序, tree-sitter的错误恢复和token的长度有关, 不能直接替换
+        self.renamable = renamable
+        self.pieces = code_token_pieces(code_tokens, tokenizer)
+        # {token: [在code_tokens中的位置, ...]}
+        self.slots = {}
+        for i, x in enumerate(code_tokens):
+            self.slots.setdefault(x, []).append(i)
+        self._embedded = {}
+        self._name_pieces = {}
+
+    def is_embedded(self, name):
+        '''
+        name是否作为一个完整的单词出现在别的token里 (如C中#define的参数, 字符串).
+        这些token在原来的代码中可能也包含被重命名的位置, 不能只替换slots.
+        '''
+        if name not in self._embedded:
+            pattern = re.compile(r'(?<!\w)%s(?!\w)' % re.escape(name))
+            self._embedded[name] = any(x != name and pattern.search(x) is not None for x in self.slots)
+        return self._embedded[name]
+
+    def name_pieces(self, name, first):
+        key = (name, first)
+        if key not in self._name_pieces:
+            self._name_pieces[key] = self.tokenizer.tokenize(name) if first else self.tokenizer.tokenize('@ '+name)[1:]
+        return self._name_pieces[key]
+
+    def can_rename(self, renames):
+        if not self.renamable:
+            return False
+        # 重命名之后不同的变量名仍然不同, DFG的结构才不变
+        if len(set(renames.values())) != len(renames):
+            return False
+        for old, new in renames.items():
+            if new in self.slots and new not in renames:
+                return False
+            if not (is_renamable_name(old, self.lang) and is_renamable_name(new, self.lang)):
+                return False
+            if self.is_embedded(old):
+                return False
+        return True
+
+    def rename(self, chromesome, args):
+        '''
+        chromesome: {tgt_word: substitute, ...}.
+        返回build_graph_features的结果, 不能增量计算时返回None.
+        '''
+        renames = {old: new for old, new in chromesome.items() if old != new}
+        if len(renames) == 0:
+            return build_graph_features(self.pieces, self.dfg, self.tokenizer, args)
+        if not self.can_rename(renames):
+            return None
+        renames = {old: new for old, new in renames.items() if old in self.slots}
+        pieces = list(self.pieces)
+        for old, new in renames.items():
+            for i in self.slots[old]:
+                pieces[i] = self.name_pieces(new, i == 0)
+        dfg = [(renames.get(x[0], x[0]),) + x[1:3] + ([renames.get(y, y) for y in x[3]],) + x[4:] for x in self.dfg]
+        return build_graph_features(pieces, dfg, self.tokenizer, args)
+
+
+def get_graph_feature_template(code, tokenizer, lang, persist=True):
+    '''
+    用run_parser的extract_dataflow得到code的GraphFeatureTemplate.
+    index_to_code_token把tree-sitter的字节列号用在字符串上, 代码中有非ASCII字符 (如字符串"réseau") 时
+    DFG中的变量名会被截错, 重命名之后和完整计算的结果不同, 所以这样的代码只能完整地重新计算.
+    persist=False: code是attack过程中得到的代码, 它的解析结果不写入磁盘缓存.
+    '''
+    dfg, index_table, code_tokens = extract_dataflow(code, lang, persist)
+    renamable = code.isascii() and not has_syntax_error(code, lang, persist)
+    return GraphFeatureTemplate(code_tokens, dfg, tokenizer, lang, renamable)
+
+
+# 已经打印过不支持增量tokenize的警告的tokenizer
+unsupported_tokenizers = set()
+
+
+class CodeFeatureTemplate():
+    '''
+    一个程序的CodeBERT subword, 供它的所有重命名复用.
+    tokenizer先用正则把代码切成pre-token, 再对每个pre-token分别做BPE: slow tokenizer用tokenizer.pat和tokenizer.bpe,
+    fast tokenizer (transformers 5.x中只有这一种) 用backend_tokenizer.pre_tokenizer和backend_tokenizer.model.
+    重命名只影响被替换位置附近的pre-token: 从被替换位置所在的pre-token开始重新切分,
+    直到切分的边界重新和原来的对齐, 其余的subword按偏移表从原来的结果中直接复制.
+    tokenize()的结果和tokenizer.tokenize(重命名之后的代码)完全相同; 不能保证这一点时
+    (不是byte-level BPE的tokenizer, 代码中出现special token等) 返回None, 由调用者完整地重新计算.
+    normalize: 代码在tokenize之前是否经过 ' '.join(code.split()).
+    persist=False: code是attack过程中得到的代码, 它的解析结果不写入磁盘缓存.
+    '''
+    def __init__(self, code, tokenizer, lang, normalize=False, persist=True) -> None:
+        program = get_renamable_program(code, lang, persist)
+        self.tokenizer = tokenizer
+        self.special_tokens = set(tokenizer.all_special_tokens) | set(getattr(tokenizer, 'added_tokens_encoder', {}))
+        self.text = program.code
+        self.positions = program.positions
+        # 位置不能映射到normalize之后的代码中的变量名
+        self.unsafe = set()
+        if normalize:
+            self.normalize()
+        self.backend = self.get_backend(tokenizer)
+        self.enabled = self.backend is not None and not self.has_special_tokens(self.text)
+        self._pieces = {}
+        # 每个pre-token的起始位置, 和它的subword在self.tokens中的偏移
+        self.starts = []
+        self.offsets = [0]
+        self.tokens = []
+        self.ids = []
+        if self.enabled:
+            for start, end, word in self.pretokenize(self.text, 0, len(self.text)):
+                tokens, ids = self.piece(word)
+                self.starts.append(start)
+                self.tokens.extend(tokens)
+                self.ids.extend(ids)
+                self.offsets.append(len(self.tokens))
+        # {pre-token的边界: pre-token的序号}
+        self.index = {start: i for i, start in enumerate(self.starts)}
+        self.index[len(self.text)] = len(self.starts)
+
+    def normalize(self):
+        # 把self.positions中的位置映射到 ' '.join(self.text.split()) 中
+        words = self.text.split()
+        raw_starts, starts = [], []
+        pos, length = 0, 0
+        for word in words:
+            pos = self.text.find(word, pos)
+            raw_starts.append(pos)
+            starts.append(length)
+            pos += len(word)
+            length += len(word) + 1
+        positions = {}
+        for name, spans in self.positions.items():
+            mapped = []
+            for start, end in spans:
+                k = bisect.bisect_right(raw_starts, start) - 1
+                if k < 0 or end > raw_starts[k] + len(words[k]):
+                    self.unsafe.add(name)
+                    break
+                mapped.append((starts[k] + start - raw_starts[k], starts[k] + end - raw_starts[k]))
+            positions[name] = mapped
+        self.text = ' '.join(words)
+        self.positions = positions
+
+    @staticmethod
+    def get_backend(tokenizer):
+        '''
+        返回增量tokenize用的实现: 'slow', 'fast', 不支持时返回None (每个tokenizer只打印一次警告).
+        '''
+        if all(hasattr(tokenizer, x) for x in ['pat', 'bpe', 'byte_encoder']):
+            return 'slow'
+        backend = getattr(tokenizer, 'backend_tokenizer', None)
+        if backend is not None:
+            from tokenizers import models, pre_tokenizers
+            pre_tokenizer = backend.pre_tokenizer
+            # 在pre-token的中间开始重新切分时, add_prefix_space会多加一个空格
+            if backend.normalizer is None and isinstance(backend.model, models.BPE) \
+                    and isinstance(pre_tokenizer, pre_tokenizers.ByteLevel) \
+                    and pre_tokenizer.use_regex and not pre_tokenizer.add_prefix_space:
+                return 'fast'
+        if id(tokenizer) not in unsupported_tokenizers:
+            unsupported_tokenizers.add(id(tokenizer))
+            logger.warning("%s does not support incremental tokenization, renamed programs are tokenized in full",
+                           type(tokenizer).__name__)
+        return None
+
+    def has_special_tokens(self, text):
+        return any(x in text for x in self.special_tokens)
+
+    def pretokenize(self, text, pos, window=256):
+        '''
+        从text[pos]开始切分pre-token, 依次返回 (开始位置, 结束位置, pre-token).
+        '''
+        if self.backend == 'slow':
+            for m in self.tokenizer.pat.finditer(text, pos):
+                yield m.start(), m.end(), m.group()
+            return
+        # pre_tokenize_str只能切分整个字符串: 每次切分window个字符, 最后一个pre-token可能被截断,
+        # 从它开始重新切分下一段. 返回的pre-token已经是byte-level的字符
+        pre_tokenizer = self.tokenizer.backend_tokenizer.pre_tokenizer
+        while pos < len(text):
+            words = pre_tokenizer.pre_tokenize_str(text[pos:pos + window])
+            if pos + window < len(text):
+                words = words[:-1]
+                if len(words) == 0:
+                    window *= 2
+                    continue
+            for word, (start, end) in words:
+                yield pos + start, pos + end, word
+            pos += words[-1][1][1]
+
+    def piece(self, word):
+        # 和tokenizer对每个pre-token的处理相同
+        if word not in self._pieces:
+            if self.backend == 'slow':
+                tokens = self.tokenizer.bpe(''.join(self.tokenizer.byte_encoder[b] for b in word.encode('utf-8'))).split(' ')
+                self._pieces[word] = (tokens, self.tokenizer.convert_tokens_to_ids(tokens))
+            else:
+                tokens = self.tokenizer.backend_tokenizer.model.tokenize(word)
+                self._pieces[word] = ([x.value for x in tokens], [x.id for x in tokens])
+        return self._pieces[word]
+
+    def tokenize(self, chromesome, max_length=None):
+        '''
+        chromesome: {tgt_word: substitute, ...}.
+        返回 (tokenizer.tokenize(重命名之后的代码)[:max_length], 对应的ids), 不能增量计算时返回None.
+        '''
+        if not self.enabled:
+            return None
+        spans = []
+        for old, new in chromesome.items():
+            if old == new or old not in self.positions:
+                continue
+            # 新的名字带空格会改变normalize的结果
+            if old in self.unsafe or new.split() != [new] or self.has_special_tokens(new):
+                return None
+            spans.extend((start, end, new) for start, end in self.positions[old])
+        if len(spans) == 0:
+            return self.tokens[:max_length], self.ids[:max_length]
+        spans.sort()
+        pieces = []
+        last = 0
+        for start, end, new in spans:
+            pieces.append(self.text[last:start])
+            pieces.append(new)
+            last = end
+        pieces.append(self.text[last:])
+        text = ''.join(pieces)
+
+        tokens, ids = [], []
+        piece = 0   # 下一个还没有复制的pre-token
+        delta = 0   # text中的位置 - self.text中的位置
+        k = 0
+        while k < len(spans) and (max_length is None or len(tokens) < max_length):
+            # 结束在替换位置上的pre-token也和替换位置的第一个字符有关 (如'\p{L}+'在这里停止)
+            i = max(piece, bisect.bisect_right(self.starts, spans[k][0] - 1) - 1)
+            tokens.extend(self.tokens[self.offsets[piece]:self.offsets[i]])
+            ids.extend(self.ids[self.offsets[piece]:self.offsets[i]])
+            # 从第i个pre-token开始重新切分, 切分的边界在所有被包含的替换位置之后, 并且和原来的某个边界重合时停止
+            end = spans[k][1]
+            piece = len(self.starts)
+            for _, word_end, word in self.pretokenize(text, self.starts[i] + delta):
+                while k < len(spans) and spans[k][0] + delta < word_end:
+                    start, end, new = spans[k]
+                    delta += len(new) - (end - start)
+                    k += 1
+                new_tokens, new_ids = self.piece(word)
+                tokens.extend(new_tokens)
+                ids.extend(new_ids)
+                if word_end - delta >= end and word_end - delta in self.index:
+                    piece = self.index[word_end - delta]
+                    break
+        stop = None if max_length is None else self.offsets[piece] + max(0, max_length - len(tokens))
+        tokens.extend(self.tokens[self.offsets[piece]:stop])
+        ids.extend(self.ids[self.offsets[piece]:stop])
+        return tokens[:max_length], ids[:max_length]
+
+    def rename(self, chromesome, block_size):
+        '''
+        返回convert_code_to_features中的 (source_tokens, source_ids), 不能增量计算时返回None.
+        '''
+        result = self.tokenize(chromesome, block_size - 2)
+        if result is None:
+            return None
+        code_tokens, code_ids = result
+        source_tokens = [self.tokenizer.cls_token] + code_tokens + [self.tokenizer.sep_token]
+        source_ids = [self.tokenizer.cls_token_id] + code_ids + [self.tokenizer.sep_token_id]
+        source_ids += [self.tokenizer.pad_token_id] * (block_size - len(source_ids))
+        return source_tokens, source_ids
+
+
 class GraphCodeDataset(Dataset):
     def __init__(self, examples, args):
         self.examples = examples
         self.args=args
+        self.edges = [None] * len(examples)
     
     def __len__(self):
         return len(self.examples)
 
+    def get_edges(self, item):
+        if self.edges[item] is None:
+            self.edges[item] = get_graph_edges(self.examples[item].position_idx,
+                                               self.examples[item].dfg_to_code,
+                                               self.examples[item].dfg_to_dfg)
+        return self.edges[item]
+
     def __getitem__(self, item):
         #calculate graph-guided masked function
-        attn_mask=np.zeros((self.args.code_length+self.args.data_flow_length,
-                            self.args.code_length+self.args.data_flow_length),dtype=np.bool)
-        #calculate begin index of node and max length of input
-        
-        node_index=sum([i>1 for i in self.examples[item].position_idx])
-        max_length=sum([i!=1 for i in self.examples[item].position_idx])
-        #sequence can attend to sequence
-        attn_mask[:node_index,:node_index]=True
-        #special tokens attend to all tokens
-        for idx,i in enumerate(self.examples[item].input_ids):
-            if i in [0,2]:
-                attn_mask[idx,:max_length]=True
-        #nodes attend to code tokens that are identified from
-        for idx,(a,b) in enumerate(self.examples[item].dfg_to_code):
-            if a<node_index and b<node_index:
-                attn_mask[idx+node_index,a:b]=True
-                attn_mask[a:b,idx+node_index]=True
-        #nodes attend to adjacent nodes 
-        for idx,nodes in enumerate(self.examples[item].dfg_to_dfg):
-            for a in nodes:
-                if a+node_index<len(self.examples[item].position_idx):
-                    attn_mask[idx+node_index,a+node_index]=True
+        attn_mask = build_graph_attn_mask([self.examples[item].input_ids],
+                                          [self.examples[item].position_idx],
+                                          [self.get_edges(item)])[0]
               
         return (torch.tensor(self.examples[item].input_ids),
-              torch.tensor(attn_mask),
+              attn_mask,
               torch.tensor(self.examples[item].position_idx),
               torch.tensor(self.examples[item].label))
 
@@ -579,63 +1793,31 @@ class CodePairDataset(Dataset):
     def __init__(self, examples, args):
         self.examples = examples
         self.args=args
+        self.edges = [None] * len(examples)
     
     def __len__(self):
         return len(self.examples)
 
+    def get_edges(self, item):
+        if self.edges[item] is None:
+            example = self.examples[item]
+            self.edges[item] = (get_graph_edges(example.position_idx_1, example.dfg_to_code_1, example.dfg_to_dfg_1),
+                                get_graph_edges(example.position_idx_2, example.dfg_to_code_2, example.dfg_to_dfg_2))
+        return self.edges[item]
+
     def __getitem__(self, item):
-        #calculate graph-guided masked function
-        attn_mask_1= np.zeros((self.args.code_length+self.args.data_flow_length,
-                        self.args.code_length+self.args.data_flow_length),dtype=np.bool)
-        #calculate begin index of node and max length of input
-        node_index=sum([i>1 for i in self.examples[item].position_idx_1])
-        max_length=sum([i!=1 for i in self.examples[item].position_idx_1])
-        #sequence can attend to sequence
-        attn_mask_1[:node_index,:node_index]=True
-        #special tokens attend to all tokens
-        for idx,i in enumerate(self.examples[item].input_ids_1):
-            if i in [0,2]:
-                attn_mask_1[idx,:max_length]=True
-        #nodes attend to code tokens that are identified from
-        for idx,(a,b) in enumerate(self.examples[item].dfg_to_code_1):
-            if a<node_index and b<node_index:
-                attn_mask_1[idx+node_index,a:b]=True
-                attn_mask_1[a:b,idx+node_index]=True
-        #nodes attend to adjacent nodes 
-        for idx,nodes in enumerate(self.examples[item].dfg_to_dfg_1):
-            for a in nodes:
-                if a+node_index<len(self.examples[item].position_idx_1):
-                    attn_mask_1[idx+node_index,a+node_index]=True  
-                    
-        #calculate graph-guided masked function
-        attn_mask_2= np.zeros((self.args.code_length+self.args.data_flow_length,
-                        self.args.code_length+self.args.data_flow_length),dtype=np.bool)
-        #calculate begin index of node and max length of input
-        node_index=sum([i>1 for i in self.examples[item].position_idx_2])
-        max_length=sum([i!=1 for i in self.examples[item].position_idx_2])
-        #sequence can attend to sequence
-        attn_mask_2[:node_index,:node_index]=True
-        #special tokens attend to all tokens
-        for idx,i in enumerate(self.examples[item].input_ids_2):
-            if i in [0,2]:
-                attn_mask_2[idx,:max_length]=True
-        #nodes attend to code tokens that are identified from
-        for idx,(a,b) in enumerate(self.examples[item].dfg_to_code_2):
-            if a<node_index and b<node_index:
-                attn_mask_2[idx+node_index,a:b]=True
-                attn_mask_2[a:b,idx+node_index]=True
-        #nodes attend to adjacent nodes 
-        for idx,nodes in enumerate(self.examples[item].dfg_to_dfg_2):
-            for a in nodes:
-                if a+node_index<len(self.examples[item].position_idx_2):
-                    attn_mask_2[idx+node_index,a+node_index]=True                      
+        #calculate graph-guided masked function for both code snippets at once
+        edges_1, edges_2 = self.get_edges(item)
+        attn_mask_1, attn_mask_2 = build_graph_attn_mask([self.examples[item].input_ids_1, self.examples[item].input_ids_2],
+                                                         [self.examples[item].position_idx_1, self.examples[item].position_idx_2],
+                                                         [edges_1, edges_2])
                     
         return (torch.tensor(self.examples[item].input_ids_1),
                 torch.tensor(self.examples[item].position_idx_1),
-                torch.tensor(attn_mask_1), 
+                attn_mask_1,
                 torch.tensor(self.examples[item].input_ids_2),
                 torch.tensor(self.examples[item].position_idx_2),
-                torch.tensor(attn_mask_2),                 
+                attn_mask_2,
                 torch.tensor(self.examples[item].label))
 
 def set_seed(seed=42):
@@ -649,29 +1831,103 @@ def set_seed(seed=42):
 
 
 class Recorder():
-    def __init__(self, file_path: str) -> None:
+    '''
+    Write one csv row per attacked example. With resume=True an existing
+    csv is reopened in append mode: the indices already recorded are kept
+    in self.completed and the cumulative counters (nb_success, nb_total,
+    query_times, time_cost) are restored from its rows.
+    '''
+    header = ["Index",
+              "Original Code", 
+              "Program Length", 
+              "Adversarial Code", 
+              "True Label", 
+              "Original Prediction", 
+              "Adv Prediction", 
+              "Is Success", 
+              "Extracted Names",
+              "Importance Score",
+              "No. Changed Names",
+              "No. Changed Tokens",
+              "Replaced Names",
+              "Attack Type",
+              "Query Times",
+              "Time Cost"]
+
+    def __init__(self, file_path: str, resume=False, sync_every=5) -> None:
         self.file_path = file_path
-        self.f = open(file_path, 'w')
-        self.writer = csv.writer(self.f)
-        self.writer.writerow(["Index",
-                        "Original Code", 
-                        "Program Length", 
-                        "Adversarial Code", 
-                        "True Label", 
-                        "Original Prediction", 
-                        "Adv Prediction", 
-                        "Is Success", 
-                        "Extracted Names",
-                        "Importance Score",
-                        "No. Changed Names",
-                        "No. Changed Tokens",
-                        "Replaced Names",
-                        "Attack Type",
-                        "Query Times",
-                        "Time Cost"])
-    
+        self.sync_every = sync_every
+        self.nb_unsynced = 0
+        self.completed = set()
+        self.nb_success = 0
+        self.nb_total = 0
+        self.query_times = 0
+        self.time_cost = 0.0
+        if resume and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+            self.load()
+            self.f = open(file_path, 'a')
+            self.writer = csv.writer(self.f)
+        else:
+            self.f = open(file_path, 'w')
+            self.writer = csv.writer(self.f)
+            self.writer.writerow(self.header)
+            self.sync()
+
+    def load(self):
+        # 记录最后一个完整的row结束时的字节位置. 被打断时写了一半的row (可能正好停在code字段中的
+        # 换行之后) 从这个位置截掉, 这个example重新attack. 只按'\n'分行, code中的\x0c, \u2028等不受影响
+        position = {'offset': 0, 'newline': False}
+        def lines(f):
+            for line in f:
+                position['offset'] += len(line)
+                position['newline'] = line.endswith(b'\n')
+                yield line.decode('utf-8', errors='replace')
+
+        rows = []
+        end = 0
+        with open(self.file_path, 'rb') as f:
+            try:
+                for i, row in enumerate(csv.reader(lines(f))):
+                    if position['newline'] and len(row) == len(self.header):
+                        end = position['offset']
+                        if i > 0:
+                            rows.append(row)
+            except csv.Error:
+                pass
+        if end < os.path.getsize(self.file_path):
+            with open(self.file_path, 'r+b') as f:
+                f.truncate(end)
+        if end == 0:
+            with open(self.file_path, 'w') as f:
+                csv.writer(f).writerow(self.header)
+        for row in rows:
+            self.completed.add(int(row[0]))
+            is_success = int(row[7])
+            if is_success >= -1:
+                self.nb_total += 1
+            if is_success == 1:
+                self.nb_success += 1
+            self.query_times += int(row[14])
+            self.time_cost += float(row[15])
+
+    def sync(self):
+        # flush到磁盘, 节点被抢占时最多丢失sync_every个example
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.nb_unsynced = 0
+
+    def close(self):
+        self.sync()
+        self.f.close()
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        self.nb_unsynced += 1
+        if self.nb_unsynced >= self.sync_every:
+            self.sync()
+
     def write(self, index, code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, score_info, nb_changed_var, nb_changed_pos, replace_info, attack_type, query_times, time_cost):
-        self.writer.writerow([index,
+        self.writerow([index,
                         code, 
                         prog_length, 
                         adv_code, 
@@ -689,7 +1945,7 @@ class Recorder():
                         time_cost])
 
     def writemhm(self, index, code, prog_length, adv_code, true_label, orig_label, temp_label, is_success, variable_names, score_info, nb_changed_var, nb_changed_pos, replace_info, attack_type, query_times, time_cost):
-        self.writer.writerow([index,
+        self.writerow([index,
                         code, 
                         prog_length, 
                         adv_code, 
@@ -705,3 +1961,277 @@ class Recorder():
                         attack_type,
                         query_times,
                         time_cost])
+
+
+class QueueRecorder(Recorder):
+    '''
+    Recorder used inside a worker process: rows are sent to the main
+    process, which writes them to the csv file in index order. The
+    counters restored on --resume stay in the main process, so a worker
+    starts its own from zero.
+    '''
+    def __init__(self, results) -> None:
+        self.results = results
+        self.completed = set()
+        self.nb_success = 0
+        self.nb_total = 0
+        self.query_times = 0
+        self.time_cost = 0.0
+
+    def writerow(self, row):
+        self.results.put(('row', row[0], row))
+
+
+class AttackWorker():
+    '''
+    Handle passed to a driver's run_attack(args, worker).
+    Without a scheduler it simply iterates over the whole dataset and
+    writes to a local Recorder. Indices in self.completed (already in the
+    csv when resuming) are skipped.
+    '''
+    def __init__(self, worker_id=0, counter=None, results=None, resume=False, completed=None) -> None:
+        self.worker_id = worker_id
+        self.counter = counter
+        self.results = results
+        self.resume = resume
+        self.completed = completed if completed is not None else set()
+        self.position = 0
+
+    def recorder(self, file_path):
+        if self.results is None:
+            recorder = Recorder(file_path, resume=self.resume)
+            self.completed = recorder.completed
+            return recorder
+        return QueueRecorder(self.results)
+
+    def take(self, dataset):
+        '''
+        Return the next (index, example) for this worker, or None when the
+        dataset is exhausted.
+        '''
+        while True:
+            if self.counter is None:
+                index = self.position
+                self.position += 1
+            else:
+                # 每个worker做完一个example再去领下一个, 慢的example不会拖住其他worker
+                with self.counter.get_lock():
+                    index = self.counter.value
+                    self.counter.value += 1
+            if index >= len(dataset):
+                return None
+            if index not in self.completed:
+                return index, dataset[index]
+
+    def done(self, index):
+        if self.results is not None:
+            self.results.put(('done', index, None))
+
+    def tasks(self, dataset):
+        while True:
+            task = self.take(dataset)
+            if task is None:
+                return
+            yield task
+            self.done(task[0])
+
+
+def _run_attack_worker(run_attack, args, worker):
+    if torch.cuda.is_available() and not args.no_cuda:
+        torch.cuda.set_device(worker.worker_id % torch.cuda.device_count())
+    try:
+        run_attack(args, worker)
+    finally:
+        worker.results.put(('exit', worker.worker_id, None))
+
+
+class AttackScheduler():
+    '''
+    Run run_attack(args, worker) in nb_workers processes. Each process loads
+    its own target model and MLM (round-robin over the visible GPUs) and
+    pulls examples from a shared counter; the rows they record are merged
+    into args.csv_store_path in index order.
+    '''
+    def __init__(self, nb_workers=1) -> None:
+        self.nb_workers = nb_workers
+
+    def run(self, run_attack, args):
+        resume = getattr(args, 'resume', False)
+        if self.nb_workers <= 1:
+            run_attack(args, AttackWorker(resume=resume))
+            return
+        recorder = Recorder(args.csv_store_path, resume=resume)
+        if recorder.completed:
+            print("Resuming: %d examples already recorded in %s" % (len(recorder.completed), args.csv_store_path))
+        ctx = mp.get_context('spawn')
+        counter = ctx.Value('i', 0)
+        results = ctx.Queue()
+        workers = []
+        for worker_id in range(self.nb_workers):
+            worker = AttackWorker(worker_id, counter, results, completed=recorder.completed)
+            p = ctx.Process(target=_run_attack_worker, args=(run_attack, args, worker))
+            p.start()
+            workers.append(p)
+
+        rows = {}
+        done = set(recorder.completed)
+        next_index = 0
+        while next_index in done:
+            next_index += 1
+        nb_running = self.nb_workers
+        while nb_running > 0:
+            try:
+                kind, index, row = results.get(timeout=10)
+            except queue.Empty:
+                if not any(p.is_alive() for p in workers):
+                    break
+                continue
+            if kind == 'exit':
+                nb_running -= 1
+            elif kind == 'row':
+                rows.setdefault(index, []).append(row)
+            else:
+                done.add(index)
+                while next_index in done:
+                    for row in rows.pop(next_index, []):
+                        recorder.writerow(row)
+                    next_index += 1
+        # example没有正常结束 (如worker出错) 时剩下的行也按顺序写出
+        for index in sorted(rows):
+            for row in rows[index]:
+                recorder.writerow(row)
+        recorder.close()
+        for p in workers:
+            p.join()
+        failed = [p.exitcode for p in workers if p.exitcode != 0]
+        if failed:
+            raise RuntimeError("%d attack worker(s) exited with an error" % len(failed))
+
+
+class SharedQueryModel():
+    '''
+    Stand-in for the target model shared by attacks running in several
+    threads. get_results blocks until every running attack is waiting for
+    a query; the pending candidates are then pooled into one get_results
+    call on the real model and the results are routed back.
+    '''
+    def __init__(self, model, nb_clients) -> None:
+        self.model = model
+        self.nb_clients = nb_clients
+        self.pending = []
+        self.batch_size = 1
+        self.cond = threading.Condition()
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    @property
+    def thread_query(self):
+        # 当前线程中的attack真正触发的query次数
+        return getattr(self.local, 'query', 0)
+
+    def get_results(self, dataset, batch_size):
+        request = {'items': [dataset[i] for i in range(len(dataset))], 'result': None, 'query': 0}
+        with self.cond:
+            self.batch_size = batch_size
+            self.pending.append(request)
+            if len(self.pending) >= self.nb_clients:
+                self._flush(batch_size)
+            while request['result'] is None:
+                self.cond.wait()
+        self.local.query = self.thread_query + request['query']
+        return request['result']
+
+    def finish(self):
+        '''
+        Called by a client thread that will not send any more queries.
+        '''
+        with self.cond:
+            self.nb_clients -= 1
+            if len(self.pending) > 0 and len(self.pending) >= self.nb_clients:
+                self._flush(self.batch_size)
+
+    def _flush(self, batch_size):
+        pending, self.pending = self.pending, []
+        items = [item for request in pending for item in request['items']]
+        probs, pred_labels = self.model.get_results(items, batch_size)
+        forwarded = set(self.model.engine.last_forwarded)
+        offset = 0
+        for request in pending:
+            n = len(request['items'])
+            request['result'] = (probs[offset: offset + n], pred_labels[offset: offset + n])
+            request['query'] = len([i for i in range(offset, offset + n) if i in forwarded])
+            offset += n
+        self.cond.notify_all()
+
+
+class ConcurrentAttackRunner():
+    '''
+    Attack up to nb_concurrent examples at the same time in one process.
+    Attacks must query the target model through self.model; while an attack
+    waits for its query the others keep preparing theirs, so the model sees
+    batches pooled from all of them.
+    '''
+    def __init__(self, model, nb_concurrent=1) -> None:
+        self.nb_concurrent = nb_concurrent
+        if nb_concurrent > 1:
+            self.model = SharedQueryModel(model, nb_concurrent)
+        else:
+            self.model = model
+
+    def run(self, attack_fn, worker, dataset):
+        '''
+        Run attack_fn(index, example) for the examples handed out by worker
+        and yield (index, example, result, query_times, time_cost) in the
+        order the examples were taken. time_cost is in minutes.
+        '''
+        if self.nb_concurrent <= 1:
+            for index, example in worker.tasks(dataset):
+                start_time = time.time()
+                query_times = self.model.query
+                result = attack_fn(index, example)
+                yield index, example, result, self.model.query - query_times, (time.time() - start_time) / 60
+            return
+
+        slots = queue.Queue()
+        take_lock = threading.Lock()
+
+        def client():
+            try:
+                while True:
+                    with take_lock:
+                        task = worker.take(dataset)
+                        slot = {'task': task, 'event': threading.Event()}
+                        slots.put(slot)
+                    if task is None:
+                        return
+                    start_time = time.time()
+                    query_times = self.model.thread_query
+                    try:
+                        slot['result'] = attack_fn(*task)
+                    except BaseException as e:
+                        slot['error'] = e
+                        return
+                    finally:
+                        slot['query'] = self.model.thread_query - query_times
+                        slot['time'] = (time.time() - start_time) / 60
+                        slot['event'].set()
+            finally:
+                self.model.finish()
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(self.nb_concurrent)]
+        for t in threads:
+            t.start()
+        while True:
+            slot = slots.get()
+            if slot['task'] is None:
+                break
+            slot['event'].wait()
+            if 'error' in slot:
+                raise slot['error']
+            index, example = slot['task']
+            yield index, example, slot['result'], slot['query'], slot['time']
+            worker.done(index)
+        for t in threads:
+            t.join()